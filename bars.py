@@ -0,0 +1,213 @@
+import math
+
+import numpy as np
+
+BAR_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+_minute_ns = {} # 'YYYY-MM-DD HH:MM' -> 该分钟起点 (纳秒)
+
+
+def tick_ns(text:str):
+    """
+    quote.datetime ('%Y-%m-%d %H:%M:%S.%f', exchange local time) to int64 nanoseconds; the minute
+    part is parsed once per minute, only the seconds are parsed per tick
+
+    Args:
+        text (str): tick datetime
+
+    Returns:
+        result (int): nanoseconds (naive local time, like the kline datetimes the recorder stores)
+    """
+    minute = text[:16]
+    base = _minute_ns.get(minute)
+    if base is None:
+        if len(_minute_ns) > 4096:
+            _minute_ns.clear()
+        base = _minute_ns[minute] = int(np.datetime64(minute, 'ns').astype(np.int64))
+    return base + int(round(float(text[17:] or 0) * 1e9))
+
+
+class BarRing(object):
+    """
+    Fixed-capacity ring of closed bars (datetime + open/high/low/close/volume), oldest bars are
+    overwritten
+
+    Args:
+        capacity (int): bars kept
+    """
+    def __init__(self, capacity:int):
+        self.capacity = capacity
+        self.datetime = np.zeros(capacity, dtype=np.int64)
+        self.values = np.full((capacity, len(BAR_FIELDS)), math.nan)
+        self.count = 0 # 已写入的bar数（可超过容量）
+
+    def append(self, dt:int, bar):
+        """
+        Args:
+            dt (int): bar start, nanoseconds
+            bar: open, high, low, close, volume
+        """
+        i = self.count % self.capacity
+        self.datetime[i] = dt
+        self.values[i] = bar
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def ordered(self):
+        """
+        Returns:
+            result (tuple): (datetimes, values) oldest first, copies
+        """
+        n = len(self)
+        if self.count <= self.capacity:
+            return self.datetime[:n].copy(), self.values[:n].copy()
+        i = self.count % self.capacity
+        return np.concatenate([self.datetime[i:], self.datetime[:i]]), np.concatenate([self.values[i:], self.values[:i]])
+
+
+class BarAggregator(object):
+    """
+    Builds OHLC bars of several periods per contract from the quote ticks the strategy already
+    receives, instead of one kline subscription per contract and period. Bars are aligned to
+    multiples of the period in exchange local time (meant for intraday periods; daily bars, whose
+    trading day starts with the night session, still come from the kline serial). A bar is closed
+    by the first tick of a later bucket; buckets without ticks produce no bar. Bar volume is the
+    difference of the cumulative quote.volume
+
+    Args:
+        periods (list): bar periods in seconds, e.g. [300, 900]
+        capacity (int, optional): closed bars kept per contract and period. Defaults to 200
+    """
+    def __init__(self, periods:list, capacity = 200):
+        self.periods = sorted(set(int(p) for p in periods))
+        self.capacity = capacity
+        self.rings = {} # (品种, 周期) -> BarRing
+        self.forming = {} # (品种, 周期) -> [bar起点, open, high, low, close, volume]
+        self.last_volume = {} # 品种 -> 上一个tick的累计成交量
+
+    def ring(self, s:str, period:int):
+        ring = self.rings.get((s, period))
+        if ring is None:
+            ring = self.rings[(s, period)] = BarRing(self.capacity)
+        return ring
+
+    def on_tick(self, s:str, dt:int, price:float, volume = math.nan):
+        """
+        take in one tick
+
+        Args:
+            s (str): contract name
+            dt (int): tick time, nanoseconds
+            price (float): last price
+            volume (float, optional): cumulative volume (quote.volume). Defaults to nan
+
+        Returns:
+            result (list): periods whose bar closed on this tick
+        """
+        if math.isnan(price):
+            return []
+        prev = self.last_volume.get(s, math.nan)
+        traded = volume - prev if not math.isnan(prev) and volume >= prev else 0.0
+        if not math.isnan(volume):
+            self.last_volume[s] = volume
+        closed = []
+        for period in self.periods:
+            key = (s, period)
+            start = dt - dt % (period * 1000000000)
+            bar = self.forming.get(key)
+            if bar is None or start > bar[0]:
+                if bar is not None:
+                    self.ring(s, period).append(bar[0], bar[1:])
+                    closed.append(period)
+                self.forming[key] = [start, price, price, price, price, traded]
+            else:
+                if price > bar[2]:
+                    bar[2] = price
+                if price < bar[3]:
+                    bar[3] = price
+                bar[4] = price
+                bar[5] += traded
+        return closed
+
+    def on_quotes(self, changed:list, quotes:dict):
+        """
+        take in the ticks of every changed contract
+
+        Args:
+            changed (list): contracts whose last price changed
+            quotes (dict): contract -> quote
+
+        Returns:
+            result (list): (contract, period) of every bar closed
+        """
+        closed = []
+        for s in changed:
+            quote = quotes[s]
+            for period in self.on_tick(s, tick_ns(quote.datetime), quote.last_price, getattr(quote, 'volume', math.nan)):
+                closed.append((s, period))
+        return closed
+
+    def kline(self, s:str, period:int, data_length = 0):
+        """
+        the bars of a contract in kline serial layout: closed bars oldest first, then the forming
+        bar as the last row (DonchianChannel.seed / update and the recorder take this directly).
+        Like a tqsdk serial, rows without data are NaN with datetime 0 at the front
+
+        Args:
+            s (str): contract name
+            period (int): bar period in seconds
+            data_length (int, optional): minimum number of rows. Defaults to 0
+
+        Returns:
+            result (dict): datetime (int64 ns), open, high, low, close, volume arrays
+        """
+        dts, values = self.ring(s, period).ordered()
+        bar = self.forming.get((s, period))
+        if bar is not None:
+            dts = np.append(dts, bar[0])
+            values = np.vstack([values, [bar[1:]]])
+        if len(dts) < data_length:
+            missing = data_length - len(dts)
+            dts = np.concatenate([np.zeros(missing, dtype=np.int64), dts])
+            values = np.vstack([np.full((missing, len(BAR_FIELDS)), math.nan), values])
+        result = {'datetime' : dts}
+        for j, f in enumerate(BAR_FIELDS):
+            result[f] = values[:, j]
+        return result
+
+    def seed(self, s:str, period:int, bars):
+        """
+        warm up with closed bars of the period (e.g. recorded by TickRecorder), oldest first
+
+        Args:
+            s (str): contract name
+            period (int): bar period in seconds
+            bars: mapping with datetime (int64 ns) and BAR_FIELDS columns
+        """
+        ring = self.ring(s, period)
+        dts = np.asarray(bars['datetime'], dtype=np.int64)
+        values = np.column_stack([np.asarray(bars[f], dtype=np.float64) for f in BAR_FIELDS])
+        for i in range(max(len(dts) - self.capacity, 0), len(dts)):
+            ring.append(int(dts[i]), values[i])
+
+    def warm_up(self, store, symbols:list):
+        """
+        seed every contract and period from a TickStore ('kline_<period>' tables), missing tables are skipped
+
+        Args:
+            store (TickStore): recorded bars
+            symbols (list): contracts
+        """
+        recorded = set(store.symbols())
+        for s in symbols:
+            if s not in recorded:
+                continue
+            for period in self.periods:
+                try:
+                    bars = store.columns(s, 'kline_%d' % period)
+                except FileNotFoundError:
+                    continue
+                if len(bars.get('datetime', ())):
+                    self.seed(s, period, bars)
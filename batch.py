@@ -0,0 +1,148 @@
+import numpy as np
+
+
+class BatchState(object):
+    """
+    Per-symbol DonMA state laid out as NumPy arrays (one row per symbol), so that the
+    extreme update and open/close/pendant decisions of one wakeup can be computed with
+    array operations over only the rows whose quote changed.
+
+    The dicts on DonMA (states, channel_up, t_0trades ...) stay the source of truth for
+    everything set_position touches; rows are re-loaded after each order dispatch.
+
+    An evaluate() call costs a fixed ~30 array operations whatever the number of rows, so a
+    wakeup with fewer than `min_rows` changed contracts is cheaper on the scalar path
+    (DonMA.on_ticks_batch falls back to on_tick and keeps the rows in sync)
+
+    Args:
+        symbols (list): contracts, one row each
+        market_cap (float, optional): max notional per contract. Defaults to 1e6
+        cost_percentage (float, optional): max loss per contract. Defaults to 1
+        pendant_step (float, optional): chandelier tightening per exit. Defaults to 0.001
+        min_rows (int, optional): changed contracts from which a wakeup is evaluated as arrays. Defaults to 128
+    """
+    def __init__(self, symbols:list, market_cap = 1e6, cost_percentage = 1, pendant_step = 0.001, min_rows = 128):
+        self.symbols = list(symbols) # 行号 -> 品种
+        self.index = {s : i for i, s in enumerate(self.symbols)} # 品种 -> 行号
+        self.market_cap = market_cap # 单个品种最大市值
+        self.cost_percentage = cost_percentage # 单个品种最大亏损
+        self.pendant_step = pendant_step # 每次吊灯出场后吊灯线收紧幅度
+        self.min_rows = min_rows # 向量化计算的最少行数
+        n = len(self.symbols)
+        self.position = np.zeros(n)
+        self.last_price = np.zeros(n) # 开仓价格
+        self.pendant_coef = np.ones(n)
+        self.extreme_since_entry = np.zeros(n)
+        self.open_ma = np.zeros(n)
+        self.channel_up = np.full(n, np.nan)
+        self.channel_down = np.full(n, np.nan)
+        self.ma = np.full(n, np.nan)
+        self.units = np.ones(n)
+        self.t0_trade = np.zeros(n, dtype=bool)
+        self.pendant_trade = np.zeros(n, dtype=bool)
+        self.ready = np.zeros(n, dtype=bool) # 已收到当日bar（curr_kline_updated）
+
+    def add_row(self, s:str):
+        """
+        append a row for a contract added mid-session (no-op if it already has one); rows of
+        removed contracts are kept, they are simply no longer evaluated
+
+        Args:
+            s (str): the contract name
+        """
+        if s in self.index:
+            return
+        self.index[s] = len(self.symbols)
+        self.symbols.append(s)
+        for name, fill in (('position', 0.0), ('last_price', 0.0), ('pendant_coef', 1.0), ('extreme_since_entry', 0.0), ('open_ma', 0.0),
+                           ('channel_up', np.nan), ('channel_down', np.nan), ('ma', np.nan), ('units', 1.0), ('t0_trade', False), ('pendant_trade', False), ('ready', False)):
+            setattr(self, name, np.append(getattr(self, name), np.array([fill], dtype=getattr(self, name).dtype)))
+
+    def load(self, donma):
+        """
+        load every row from the dicts of a DonMA instance
+
+        Args:
+            donma (DonMA): the strategy object owning the dict state
+        """
+        for s in self.symbols:
+            self.load_row(donma, s)
+
+    def load_row(self, donma, s:str):
+        """
+        reload one row after the dict state of a symbol changed (new bar, order dispatched)
+
+        Args:
+            donma (DonMA): the strategy object owning the dict state
+            s (str): the contract name
+        """
+        i = self.index[s]
+        state = donma.states[s]
+        self.position[i] = state['position']
+        self.last_price[i] = state['last_price']
+        self.pendant_coef[i] = state['pendant_coef']
+        self.extreme_since_entry[i] = state['extreme_since_entry']
+        self.open_ma[i] = state['open_ma']
+        self.channel_up[i] = donma.channel_up.get(s, np.nan)
+        self.channel_down[i] = donma.channel_down.get(s, np.nan)
+        self.ma[i] = donma.ma.get(s, np.nan)
+        self.units[i] = donma.units[s]
+        self.t0_trade[i] = donma.t_0trades[s]
+        self.pendant_trade[i] = donma.pendant_trades[s]
+        self.ready[i] = donma.curr_kline_updated[s]
+
+    def evaluate(self, idx, price):
+        """
+        update holding extremes and compute the trading decisions for the given rows.
+        Mirrors the scalar branching in DonMA.on_tick (python max/min are written as
+        np.where with the same comparison so NaN handling stays identical)
+
+        Args:
+            idx (np.ndarray): row numbers of the symbols whose last price changed
+            price (np.ndarray): the new last prices, aligned with idx
+
+        Returns:
+            signals (dict): arrays aligned with idx, keys are
+                open_qty (signed hands, 0 = no open), pendant (bool), ma_exit (bool),
+                open_cost, max_profit, pendant_boundary, actual_ma (for logging)
+        """
+        pos = self.position[idx]
+        ext = self.extreme_since_entry[idx]
+        ext = np.where(pos > 0, np.where(price > ext, price, ext),
+                       np.where(pos < 0, np.where(price < ext, price, ext), 0.0))
+        self.extreme_since_entry[idx] = ext
+
+        ma = self.ma[idx]
+        units = self.units[idx]
+        free = ~self.t0_trade[idx]
+        is_long = pos > 0
+        is_short = pos < 0
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # 开仓手数
+            cap_quantity = self.market_cap / (price * units)
+            risk_quantity = (self.market_cap * self.cost_percentage) / (np.abs(price - ma) * units)
+            op_quantity = np.where(price == ma, cap_quantity,
+                                   np.where(cap_quantity < risk_quantity, cap_quantity, risk_quantity))
+            op_quantity = np.where(np.isnan(op_quantity), 0.0, np.trunc(op_quantity))
+            flat = (pos == 0) & free
+            open_long = flat & (price >= self.channel_up[idx])
+            open_short = flat & ~open_long & (price <= self.channel_down[idx])
+            open_qty = np.where(open_long, np.where(op_quantity == 0, 1.0, op_quantity), 0.0)
+            open_qty = np.where(open_short, np.where(op_quantity == 0, -1.0, -op_quantity), open_qty)
+
+            # 平仓与吊灯
+            open_cost = self.last_price[idx]
+            open_ma = self.open_ma[idx]
+            max_profit = np.where(is_long, ext / open_cost - 1, open_cost / ext - 1)
+            actual_ma = np.where(is_long, np.where(open_ma > ma, open_ma, ma),
+                                 np.where(open_ma < ma, open_ma, ma))
+            step = self.pendant_coef[idx] * self.pendant_step / max_profit
+            pendant_boundary = ext * np.where(is_long, 1 - step, 1 + step)
+            pendant_long = is_long & (price <= pendant_boundary) & ~(price <= actual_ma) & (pendant_boundary > actual_ma)
+            pendant_short = is_short & (price >= pendant_boundary) & ~(price >= actual_ma) & (pendant_boundary < actual_ma)
+            pendant = (pendant_long | pendant_short) & free & (max_profit > 0) & (np.abs(pos) >= 3) & ~self.pendant_trade[idx]
+            ma_exit = free & ((is_long & (price <= actual_ma)) | (is_short & (price >= actual_ma)))
+
+        return {'open_qty' : open_qty, 'pendant' : pendant, 'ma_exit' : ma_exit, 'open_cost' : open_cost,
+                'max_profit' : max_profit, 'pendant_boundary' : pendant_boundary, 'actual_ma' : actual_ma}
@@ -0,0 +1,205 @@
+import argparse
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+import main
+from profiling import LatencyHistogram
+from replay import ReplayFinished
+from stubapi import StubApi, StubTargetPosTask
+
+
+def make_donma(symbols:int, ticks_per_update:int, updates:int, vectorized = False, bar_every = None, seed = 0):
+    """
+    a DonMA over `symbols` synthetic contracts driven by a StubApi random-walk feed
+
+    Returns:
+        result (DonMA): prepared for trading (channels calculated)
+    """
+    api = StubApi(latency=0, seed=seed, ticks_per_update=ticks_per_update, max_updates=updates, bar_every=bar_every)
+    donma = main.DonMA(['SHFE.s%03d' % i for i in range(symbols)], backtest=False, kq=api, target_pos_cls=StubTargetPosTask, vectorized=vectorized)
+    donma.prepare_trading()
+    return donma
+
+
+def bench_check_open_close(donma):
+    """
+    the check_open_close loop body (on_update after every wait_update) until the feed ends;
+    wait_update itself (the synthetic feed) is not timed
+
+    Returns:
+        result (tuple): (LatencyHistogram per tick in us, ticks, seconds in on_update)
+    """
+    hist = LatencyHistogram()
+    ticks = 0
+    busy = 0.0
+    api = donma.api
+    try:
+        while True:
+            before = api.tick_count
+            api.wait_update()
+            n = api.tick_count - before
+            start = time.perf_counter()
+            donma.on_update()
+            elapsed = time.perf_counter() - start
+            busy += elapsed
+            ticks += n
+            if n:
+                hist.add(elapsed * 1e6 / n)
+    except ReplayFinished:
+        pass
+    return hist, ticks, busy
+
+
+def bench_recalc_parameter(donma, rounds:int):
+    """
+    recalc_parameter of every contract after a new bar, `rounds` times
+
+    Returns:
+        result (tuple): (LatencyHistogram per call in us, calls, seconds)
+    """
+    hist = LatencyHistogram()
+    busy = 0.0
+    for _ in range(rounds):
+        for s in donma.symbols:
+            donma.api._roll_bar(s)
+            start = time.perf_counter()
+            donma.recalc_parameter(s)
+            elapsed = time.perf_counter() - start
+            busy += elapsed
+            hist.add(elapsed * 1e6)
+    return hist, rounds * len(donma.symbols), busy
+
+
+def bench_set_position(donma, rounds:int):
+    """
+    set_position cycling every contract through open / reduce / close
+
+    Returns:
+        result (tuple): (LatencyHistogram per call in us, calls, seconds)
+    """
+    hist = LatencyHistogram()
+    busy = 0.0
+    targets = (9, 6, 0, -9, -6, 0)
+    for r in range(rounds):
+        pos = targets[r % len(targets)]
+        for s in donma.symbols:
+            start = time.perf_counter()
+            donma.set_position(s, pos, is_pendant = pos in (6, -6))
+            elapsed = time.perf_counter() - start
+            busy += elapsed
+            hist.add(elapsed * 1e6)
+    return hist, rounds * len(donma.symbols), busy
+
+
+def bench_update_holding_extremes(donma, rounds:int, seed = 0):
+    """
+    update_holding_extremes on random prices with every contract long, short or flat
+
+    Returns:
+        result (tuple): (LatencyHistogram per call in us, calls, seconds)
+    """
+    rng = np.random.default_rng(seed)
+    for i, s in enumerate(donma.symbols):
+        donma.states[s]['position'] = (1, -1, 0)[i % 3]
+    prices = (3000 * np.exp(rng.normal(0, 0.01, (rounds, len(donma.symbols))))).tolist()
+    hist = LatencyHistogram()
+    busy = 0.0
+    for row in prices:
+        for s, price in zip(donma.symbols, row):
+            start = time.perf_counter()
+            donma.update_holding_extremes(s, price)
+            elapsed = time.perf_counter() - start
+            busy += elapsed
+            hist.add(elapsed * 1e6)
+    return hist, rounds * len(donma.symbols), busy
+
+
+def peak_memory(fn, *args):
+    """
+    tracemalloc peak (bytes) of one call, measured on a separate run so it does not skew timings
+    """
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_suite(symbols:int, ticks_per_update:int, updates:int, rounds:int, vectorized:bool):
+    """
+    Returns:
+        result (dict): benchmark name -> ticks_per_sec (or calls_per_sec), latency summary (us), peak_bytes
+    """
+    results = {}
+
+    def record(name, hist, count, busy, memory):
+        summary = hist.summary()
+        summary.update({'calls' : count, 'per_sec' : round(count / busy) if busy else None, 'peak_bytes' : memory})
+        results[name] = summary
+
+    hist, ticks, busy = bench_check_open_close(make_donma(symbols, ticks_per_update, updates, vectorized))
+    memory = peak_memory(bench_check_open_close, make_donma(symbols, ticks_per_update, updates, vectorized))
+    record('check_open_close', hist, ticks, busy, memory)
+
+    donma = make_donma(symbols, ticks_per_update, 0)
+    record('recalc_parameter', *bench_recalc_parameter(donma, rounds), peak_memory(bench_recalc_parameter, make_donma(symbols, ticks_per_update, 0), rounds))
+    record('set_position', *bench_set_position(donma, rounds), peak_memory(bench_set_position, make_donma(symbols, ticks_per_update, 0), rounds))
+    record('update_holding_extremes', *bench_update_holding_extremes(donma, rounds),
+           peak_memory(bench_update_holding_extremes, make_donma(symbols, ticks_per_update, 0), rounds))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current:dict, baseline:dict):
+    """
+    print the per_sec ratio (current / baseline) of every benchmark present in both runs
+    """
+    for key, runs in current['runs'].items():
+        base = baseline.get('runs', {}).get(key)
+        if base is None:
+            continue
+        for name, result in runs.items():
+            old = base.get(name, {}).get('per_sec')
+            if old and result['per_sec']:
+                print('%-40s %-24s %8.2fx' % (key, name, result['per_sec'] / old))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='DonMA hot path benchmarks against a synthetic tick feed')
+    parser.add_argument('--symbols', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--tick_rate', type=float, nargs='+', default=[0.2, 1.0], help='share of the contracts ticking per wakeup')
+    parser.add_argument('--updates', type=int, default=2000, help='wakeups per check_open_close run')
+    parser.add_argument('--rounds', type=int, default=200, help='rounds of the per-function benchmarks')
+    parser.add_argument('--vectorized', action='store_true', help='also run DonMA(vectorized=True)')
+    parser.add_argument('--out', default='bench_hotpath.json')
+    parser.add_argument('--compare', default=None, help='an earlier --out file to compare with')
+    args = parser.parse_args()
+    main.custom_logger.disabled = True
+
+    output = {'commit' : git_commit(), 'python' : platform.python_version(), 'time' : time.strftime('%Y-%m-%d %H:%M:%S'),
+              'updates' : args.updates, 'rounds' : args.rounds, 'runs' : {}}
+    for n in args.symbols:
+        for rate in args.tick_rate:
+            for vectorized in ([False, True] if args.vectorized else [False]):
+                key = 'symbols=%d rate=%g%s' % (n, rate, ' vectorized' if vectorized else '')
+                output['runs'][key] = run_suite(n, max(int(n * rate), 1), args.updates, args.rounds, vectorized)
+                for name, result in output['runs'][key].items():
+                    print('%-40s %-24s %10s/s p50 %7.1fus p99 %7.1fus max %8.1fus peak %8.1fKB' % (
+                        key, name, result['per_sec'], result['p50'], result['p99'], result['max'], result['peak_bytes'] / 1024))
+    with open(args.out, 'w') as f:
+        json.dump(output, f, indent=4)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(output, json.load(f))
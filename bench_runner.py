@@ -0,0 +1,157 @@
+import argparse
+import os
+import tempfile
+import time
+
+import main
+from bench_hotpath import make_donma
+from checkpoint import Checkpoint
+from profiling import LatencyHistogram
+from recorder import TickRecorder
+from replay import ReplayFinished
+from runner import AsyncRunner
+
+
+class Pacer(object):
+    """
+    Paces the synthetic feed: update k arrives at start + k * gap whether or not the strategy is
+    ready for it, so time spent blocked (e.g. in a save) shows up as queueing delay of the next
+    ticks. With gap 0 the feed is saturated and an update arrives when it is published
+
+    Args:
+        api (StubApi): the feed
+        gap (float): seconds between two updates
+    """
+    def __init__(self, api, gap:float):
+        self.api = api
+        self.gap = gap
+        self.due = None # 下一次更新的到达时间
+
+    def wait(self):
+        """
+        sleep until the next update is due (no-op when behind or saturated)
+        """
+        if not self.gap:
+            return
+        now = time.perf_counter()
+        self.due = now if self.due is None else self.due + self.gap
+        if self.due - now > 0.0005:
+            time.sleep(self.due - now - 0.0005)
+        # 最后半毫秒自旋，避免sleep唤醒误差计入延迟
+        while time.perf_counter() < self.due:
+            pass
+
+    def arrival(self):
+        return self.due if self.gap else self.api.published_at
+
+
+def trace_decisions(donma, hist:LatencyHistogram, pacer:Pacer):
+    """
+    record, for every evaluated tick, the time from its update arriving to the end of its on_tick
+    decision; the first update (a new bar for every contract) is left out
+    """
+    api = donma.api
+    on_tick = donma.on_tick
+
+    def traced(s:str, interday_restore = False):
+        on_tick(s, interday_restore)
+        if api.updates > 1:
+            hist.add((time.perf_counter() - pacer.arrival()) * 1e6)
+
+    donma.on_tick = traced
+
+
+def with_storage(donma, root:str):
+    """
+    give the strategy a checkpoint and a tick recorder under root, so that saves cost real file I/O
+    """
+    donma.checkpoint = Checkpoint(os.path.join(root, 'donma_state.json'))
+    donma.recorder = TickRecorder(os.path.join(root, 'ticks'))
+    return donma
+
+
+def bench_loop(donma, save_every = None, gap = 0.0):
+    """
+    the check_open_close loop: wait_update, then on_update until the feed ends; every
+    `save_every` wakeups the checkpoint is compacted inline and the recorder handed to its
+    writer thread, as the periodic save in check_open_close does. Updates arrive every `gap` seconds (Pacer)
+
+    Returns:
+        result (tuple): (LatencyHistogram wakeup to decision in us, seconds)
+    """
+    hist = LatencyHistogram()
+    api = donma.api
+    pacer = Pacer(api, gap)
+    trace_decisions(donma, hist, pacer)
+    start = time.perf_counter()
+    try:
+        while True:
+            pacer.wait()
+            api.wait_update()
+            donma.on_update()
+            if save_every and api.updates % save_every == 0:
+                donma.save_to_json()
+                donma.recorder.flush_async()
+    except ReplayFinished:
+        pass
+    return hist, time.perf_counter() - start
+
+
+def bench_runner(donma, save_every = None, gap = 0.0):
+    """
+    AsyncRunner: the contract coroutines decide inside wait_update; every `save_every` wakeups
+    the runner's save and flush jobs are started (their file I/O runs in the pool, which gets
+    the GIL while the feed is idle). Updates arrive every `gap` seconds (Pacer)
+
+    Returns:
+        result (tuple): (LatencyHistogram wakeup to decision in us, seconds)
+    """
+    hist = LatencyHistogram()
+    pacer = Pacer(donma.api, gap)
+    trace_decisions(donma, hist, pacer)
+    runner = AsyncRunner(donma)
+    # make_donma already prepared the strategy, only start the coroutines
+    runner.sync()
+    start = time.perf_counter()
+    try:
+        while True:
+            pacer.wait()
+            runner.step()
+            if save_every and donma.api.updates % save_every == 0:
+                donma.api.create_task(runner.save())
+                donma.api.create_task(runner.flush())
+    except ReplayFinished:
+        pass
+    finally:
+        runner.stop()
+    return hist, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='wakeup-to-decision latency, check_open_close loop vs AsyncRunner, against a synthetic feed')
+    parser.add_argument('--symbols', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--tick_rate', type=float, nargs='+', default=[0.1, 1.0], help='fraction of contracts ticking per wakeup')
+    parser.add_argument('--updates', type=int, default=1000, help='wakeups per run')
+    parser.add_argument('--save_every', type=int, default=100, help='wakeups between two checkpoint + recorder saves (0 = no I/O)')
+    parser.add_argument('--gap', type=float, default=0.01, help='seconds between two updates (0 = saturated feed)')
+    args = parser.parse_args()
+    main.custom_logger.disabled = True
+
+    print('%8s %6s %-8s %10s %10s %10s %12s' % ('symbols', 'rate', 'runner', 'p50 us', 'p99 us', 'max us', 'ticks/s'))
+    for n in args.symbols:
+        for rate in args.tick_rate:
+            ticks_per_update = max(int(n * rate), 1)
+            for name, bench in (('loop', bench_loop), ('async', bench_runner)):
+                with tempfile.TemporaryDirectory() as tmp:
+                    donma = make_donma(n, ticks_per_update, args.updates)
+                    if args.save_every:
+                        with_storage(donma, tmp)
+                    hist, seconds = bench(donma, args.save_every, args.gap)
+                    donma.api.close()
+                    # 临时目录删除前等待写线程结束
+                    if donma.recorder is not None:
+                        donma.recorder.close()
+                    if donma.checkpoint is not None:
+                        donma.checkpoint.close()
+                print('%8d %6.2f %-8s %10.1f %10.1f %10.1f %12.0f' % (n, rate, name, hist.percentile(50), hist.percentile(99), hist.max,
+                                                                      donma.api.tick_count / seconds))
@@ -0,0 +1,48 @@
+import argparse
+import functools
+import os
+import tempfile
+import time
+
+import main
+from shard import Supervisor
+from stubapi import StubApi, StubTargetPosTask
+
+
+def run(workers:int, symbols:int, updates:int, bar_every:int, checkpoint_dir:str):
+    """
+    run the supervisor over a synthetic tick feed, every wakeup ticks every contract of a shard
+
+    Args:
+        workers (int): number of shards
+        symbols (int): universe size
+        updates (int): wakeups per shard
+        bar_every (int): wakeups between two new daily bars
+        checkpoint_dir (str): where the merged snapshot goes
+
+    Returns:
+        result (tuple): (seconds, ticks processed)
+    """
+    factory = functools.partial(StubApi, latency=0, ticks_per_update=symbols, max_updates=updates, bar_every=bar_every)
+    supervisor = Supervisor(['SHFE.s%03d' % i for i in range(symbols)], workers, api_factory=factory,
+                            checkpoint_path=os.path.join(checkpoint_dir, 'donma_state_%d.json' % workers),
+                            report_interval=3600, log_dir=None, cutoff=None, target_pos_cls=StubTargetPosTask)
+    start = time.perf_counter()
+    summary = supervisor.run()
+    return time.perf_counter() - start, summary['ticks']
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='tick throughput of the sharded supervisor against a simulated feed')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--symbols', type=int, default=200)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--bar_every', type=int, default=500)
+    args = parser.parse_args()
+    main.custom_logger.disabled = True
+
+    print('%8s %10s %12s %14s' % ('workers', 'seconds', 'ticks', 'ticks/sec'))
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in args.workers:
+            seconds, ticks = run(workers, args.symbols, args.updates, args.bar_every, tmp)
+            print('%8d %9.2fs %12d %14.0f' % (workers, seconds, ticks, ticks / seconds))
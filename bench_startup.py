@@ -0,0 +1,47 @@
+import argparse
+import os
+import tempfile
+import time
+
+import main
+from startup import BarCache
+from stubapi import StubApi, StubTargetPosTask
+
+
+def time_startup(n:int, latency:float, parallel:bool, bar_cache = None):
+    """
+    seconds spent in DonMA.__init__ + prepare_trading for n contracts against a StubApi
+
+    Args:
+        n (int): number of contracts
+        latency (float): simulated server round trip in seconds
+        parallel (bool): parallel_startup
+        bar_cache (BarCache, optional): seed channels from this cache
+
+    Returns:
+        result (tuple): (seconds, DonMA)
+    """
+    symbols = ['SHFE.s%03d' % i for i in range(n)]
+    api = StubApi(latency)
+    start = time.perf_counter()
+    donma = main.DonMA(symbols, backtest=False, kq=api, target_pos_cls=StubTargetPosTask, parallel_startup=parallel, bar_cache=bar_cache)
+    donma.prepare_trading()
+    return time.perf_counter() - start, donma
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='DonMA startup time against a stub api')
+    parser.add_argument('--symbols', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--latency', type=float, default=0.005, help='simulated round trip (s)')
+    args = parser.parse_args()
+    main.custom_logger.disabled = True
+
+    print('%8s %12s %12s %12s' % ('symbols', 'sequential', 'parallel', 'cached'))
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.symbols:
+            sequential, _ = time_startup(n, args.latency, False)
+            parallel, donma = time_startup(n, args.latency, True)
+            cache = BarCache(os.path.join(tmp, 'bar_cache_%d.json' % n))
+            cache.save(donma.kline)
+            cached, _ = time_startup(n, args.latency, True, cache)
+            print('%8d %11.3fs %11.3fs %11.3fs' % (n, sequential, parallel, cached))
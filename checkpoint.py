@@ -0,0 +1,171 @@
+import json
+import os
+
+STATE_KEYS = ('pendant_coef', 'extreme_since_entry', 'open_ma', 't0_trade', 'pendant_trade')
+
+
+def atomic_dump(obj, path:str, fsync = True):
+    """
+    write json to a temp file next to path, then rename it over path, so a crash never leaves
+    a truncated file behind
+
+    Args:
+        obj: json serializable object
+        path (str): target file
+        fsync (bool, optional): fsync the temp file before the rename. Defaults to True
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(obj, f, sort_keys=True, indent=4)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Checkpoint(object):
+    """
+    Crash-safe state checkpoint: a snapshot (same format as donma_state.json) plus a
+    write-ahead log of one json line per changed symbol state. Every change is appended to the
+    log right away, compact() folds the log into a new snapshot (atomic rename) and truncates it,
+    restore() replays snapshot + log
+
+    Args:
+        path (str, optional): snapshot path, the log lives at path + '.wal'. Defaults to 'donma_state.json'
+        fsync (bool, optional): fsync the log after every append (survives power loss, not only
+            a process crash, at the cost of a disk round trip per change). Defaults to False
+    """
+    def __init__(self, path = 'donma_state.json', fsync = False):
+        self.path = path
+        self.wal_path = path + '.wal'
+        self.fsync = fsync
+        self.state = {} # 品种 -> 最近一次写入的状态
+        self.wal = None
+
+    def restore(self):
+        """
+        read the snapshot and replay the log on top of it. A torn last line is ignored and cut
+        off the log, so that the next record() starts on a line of its own
+
+        Returns:
+            result (dict): symbol -> state, in the load_from_json format
+        """
+        state = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        if os.path.exists(self.wal_path):
+            with open(self.wal_path, 'rb+') as f:
+                good = 0 # 最后一行完整记录的结束位置
+                newline = True
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 写入中途崩溃留下的半行
+                        break
+                    state[entry.pop('symbol')] = entry
+                    good += len(line)
+                    newline = line.endswith(b'\n')
+                f.seek(good)
+                f.truncate()
+                if not newline:
+                    # 记录完整但换行符未写入
+                    f.write(b'\n')
+        self.state = {s : dict(v) for s, v in state.items()}
+        return state
+
+    def record(self, symbol:str, entry:dict):
+        """
+        append the state of one symbol to the log if it differs from the last one written
+
+        Args:
+            symbol (str): contract name
+            entry (dict): state with STATE_KEYS
+
+        Returns:
+            result (bool): whether anything was written
+        """
+        if self.state.get(symbol) == entry:
+            return False
+        self.state[symbol] = entry
+        if self.wal is None:
+            self.wal = open(self.wal_path, 'a')
+        line = dict(entry)
+        line['symbol'] = symbol
+        self.wal.write(json.dumps(line) + '\n')
+        self.wal.flush()
+        if self.fsync:
+            os.fsync(self.wal.fileno())
+        return True
+
+    def compact(self, state = None):
+        """
+        write a snapshot atomically and start a fresh log
+
+        Args:
+            state (dict, optional): full state to snapshot, defaults to everything recorded so far
+        """
+        snapshot = self.prepare_compact(state)
+        self.commit_snapshot(snapshot, self.write_snapshot(snapshot))
+
+    def prepare_compact(self, state = None):
+        """
+        first step of a compaction split across threads (prepare_compact and commit_snapshot on
+        the thread calling record, write_snapshot anywhere, e.g. in an executor)
+
+        Args:
+            state (dict, optional): full state to snapshot, defaults to everything recorded so far
+
+        Returns:
+            result (dict): the snapshot, a copy record() does not touch
+        """
+        if state is not None:
+            self.state = {s : dict(v) for s, v in state.items()}
+        return {s : dict(v) for s, v in self.state.items()}
+
+    def write_snapshot(self, snapshot:dict):
+        """
+        write and fsync the snapshot to a temp file, the live snapshot is not touched
+
+        Returns:
+            result (str): the temp file, handed to commit_snapshot
+        """
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f, sort_keys=True, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        return tmp
+
+    def commit_snapshot(self, snapshot:dict, tmp:str):
+        """
+        rename the written snapshot over the live one and start a fresh log holding only the
+        changes recorded since prepare_compact
+
+        Args:
+            snapshot (dict): the prepare_compact result
+            tmp (str): the write_snapshot result
+        """
+        os.replace(tmp, self.path)
+        if self.wal is not None:
+            self.wal.close()
+        # 快照已落盘；新日志先写临时文件再替换，任何时刻崩溃重放的结果都相同
+        # （旧日志按时间顺序追加，重放到新快照上仍得到最新状态）
+        wal_tmp = self.wal_path + '.tmp'
+        with open(wal_tmp, 'w') as f:
+            for symbol, entry in self.state.items():
+                if snapshot.get(symbol) != entry:
+                    line = dict(entry)
+                    line['symbol'] = symbol
+                    f.write(json.dumps(line) + '\n')
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(wal_tmp, self.wal_path)
+        self.wal = open(self.wal_path, 'a')
+
+    def close(self):
+        if self.wal is not None:
+            self.wal.close()
+            self.wal = None
@@ -0,0 +1,164 @@
+import time
+
+
+class ChangeDispatcher(object):
+    """
+    Builds the set of contracts whose quote / kline changed in one wait_update wakeup from the
+    diffs TqSdk already keeps for is_changing, so that idle contracts cost nothing; candidates are
+    then confirmed with api.is_changing (same answer as polling every contract) and routed to the
+    handlers. Falls back to polling every contract if the api exposes no diffs.
+
+    Args:
+        api: TqApi (or a stand-in)
+        symbols (list): tracked contracts, dispatch order follows this list
+        quote (dict): contract -> quote
+        kline (dict): contract -> kline serial
+        on_kline (callable): on_kline(symbol), called on a new bar
+        on_quotes (callable): on_quotes(symbols, *args), called once with every contract whose last price changed
+    """
+    def __init__(self, api, symbols:list, quote:dict, kline:dict, on_kline, on_quotes):
+        self.api = api
+        self.quote = quote
+        self.kline = kline
+        self.on_kline = on_kline
+        self.on_quotes = on_quotes
+        self.order = {} # 品种 -> 分发顺序
+        self.version = 0 # 跟踪品种集合每变化一次加一
+        self.new_bars = set() # 下一次唤醒视为新bar的品种（数据已被启动时的 wait_update 消费）
+        for s in symbols:
+            self.track(s)
+
+        # 统计
+        self.wakeups = 0 # wait_update 返回次数
+        self.kline_changes = 0 # 新bar总数
+        self.quote_changes = 0 # 最新价变化总数
+        self.max_changed = 0 # 单次唤醒最多变化品种数
+        self.handler_time = 0.0 # 处理耗时合计（秒）
+
+    def track(self, s:str):
+        """
+        start dispatching changes of a contract
+
+        Args:
+            s (str): the contract name
+        """
+        if s not in self.order:
+            self.order[s] = len(self.order)
+            self.version += 1
+
+    def untrack(self, s:str):
+        """
+        stop dispatching changes of a contract
+
+        Args:
+            s (str): the contract name
+        """
+        if self.order.pop(s, None) is not None:
+            self.version += 1
+
+    def mark_new_bars(self, symbols):
+        """
+        report these contracts as having a new bar at the next wakeup, for kline data received
+        by wait_update calls before dispatching started (is_changing no longer shows it)
+
+        Args:
+            symbols (iterable): contract names
+        """
+        self.new_bars.update(symbols)
+
+    def _take_new_bars(self):
+        new_bars = self.new_bars
+        self.new_bars = set()
+        return {s for s in new_bars if s in self.order and s in self.kline}
+
+    def _diffs(self):
+        loop = getattr(self.api, '_loop', None)
+        if loop is not None and loop.is_running():
+            return getattr(self.api, '_diffs', None)
+        return getattr(self.api, '_sync_diffs', None)
+
+    def collect(self):
+        """
+        contracts with a new bar and contracts with a new last price in this wakeup
+
+        Returns:
+            result (tuple): (kline changed list, quote changed list), both in tracking order
+        """
+        diffs = self._diffs()
+        if diffs is None:
+            kline_candidates = quote_candidates = self.order
+        else:
+            kline_candidates = set()
+            quote_candidates = set()
+            for diff in diffs:
+                for s, fields in diff.get('quotes', {}).items():
+                    if s in self.order and fields is not None and 'last_price' in fields:
+                        quote_candidates.add(s)
+                for s in diff.get('klines', {}):
+                    if s in self.order:
+                        kline_candidates.add(s)
+        # 由本地聚合生成bar的品种没有K线订阅
+        klines = {s for s in kline_candidates if s in self.kline and self.api.is_changing(self.kline[s].iloc[-1], 'datetime')}
+        if self.new_bars:
+            klines |= self._take_new_bars()
+        klines = sorted(klines, key=self.order.get)
+        quotes = sorted((s for s in quote_candidates if self.api.is_changing(self.quote[s], 'last_price')), key=self.order.get)
+        return klines, quotes
+
+    def changed(self, s:str):
+        """
+        the changes of one contract in this wakeup, same rules as collect (for a task woken by
+        the update channel of this contract)
+
+        Args:
+            s (str): the contract name
+
+        Returns:
+            result (tuple): (new bar, new last price)
+        """
+        diffs = self._diffs()
+        if diffs is None:
+            kline_candidate = quote_candidate = True
+        else:
+            kline_candidate = quote_candidate = False
+            for diff in diffs:
+                if s in diff.get('klines', ()):
+                    kline_candidate = True
+                fields = diff.get('quotes', {}).get(s)
+                if fields is not None and 'last_price' in fields:
+                    quote_candidate = True
+        new_bar = kline_candidate and s in self.kline and self.api.is_changing(self.kline[s].iloc[-1], 'datetime')
+        if s in self.new_bars:
+            self.new_bars.discard(s)
+            new_bar = s in self.kline
+        new_price = quote_candidate and self.api.is_changing(self.quote[s], 'last_price')
+        return new_bar, new_price
+
+    def dispatch(self, *args):
+        """
+        route the changes of the last wakeup: new bars first, then the ticks
+
+        Args:
+            *args: passed on to on_quotes
+        """
+        start = time.perf_counter()
+        klines, quotes = self.collect()
+        for s in klines:
+            self.on_kline(s)
+        if quotes:
+            self.on_quotes(quotes, *args)
+        self.handler_time += time.perf_counter() - start
+        self.wakeups += 1
+        self.kline_changes += len(klines)
+        self.quote_changes += len(quotes)
+        self.max_changed = max(self.max_changed, len(quotes))
+
+    def stats(self):
+        """
+        Returns:
+            result (dict): wakeups, changes and mean handler time per wakeup (microseconds)
+        """
+        wakeups = max(self.wakeups, 1)
+        return {'wakeups' : self.wakeups, 'kline_changes' : self.kline_changes, 'quote_changes' : self.quote_changes,
+                'changed_per_wakeup' : self.quote_changes / wakeups, 'max_changed' : self.max_changed,
+                'handler_us_per_wakeup' : self.handler_time / wakeups * 1e6}
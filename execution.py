@@ -0,0 +1,291 @@
+import logging
+import math
+import time
+
+# 上期所/上期能源区分平今平昨
+CLOSE_TODAY_EXCHANGES = ('SHFE', 'INE')
+
+
+class ContractExecutor(object):
+    """
+    Per-contract order state machine with the TargetPosTask interface (set_target_volume),
+    trading through api.insert_order / cancel_order. One child order is live at a time:
+    closes before opens (close today before close yesterday on SHFE/INE), at most `max_child`
+    hands per child. A child first rests at our side of the touch (bid for a buy); if it is
+    not filled within the chase delay it is cancelled and re-sent crossing the spread (ask for
+    a buy), re-crossing at the new touch after every further delay. Opening prices are capped
+    at theoretical price * (1 +- max_slippage); closing children are never capped (an exit
+    must get out in a gapping market) and follow the touch. All prices stay within the daily limits
+
+    As TargetPosTask (InsertOrderUntilAllTradedTask), a finished child that traded is kept until its
+    trade records add up to its filled volume and the position reflects them: order status, trades
+    and position may arrive in different updates, and the next leg is computed from the position.
+    After `max_rejects` children in a row die unfilled an opening target is given up, a closing one
+    is retried every `retry_ms` (DonMA already counts the exit as done)
+
+    Created through OrderExecutor.task, not directly
+
+    Args:
+        executor (OrderExecutor): owner (settings, fill accounting)
+        api (TqApi): tqsdk api
+        symbol (str): contract name
+    """
+    def __init__(self, executor, api, symbol:str):
+        self.executor = executor
+        self.api = api
+        self.symbol = symbol
+        self.exchange_id = symbol.split('.')[0]
+        self.quote = None # 首次下单时获取（避免启动时逐个阻塞订阅）
+        self.position = api.get_position(symbol)
+        self.target = None # 目标净持仓
+        self.theoretical = math.nan # 信号触发时的最新价
+        self.order = None # 当前挂单
+        self.placed_at = 0.0 # 当前挂单发出时间
+        self.cancelling = False
+        self.chases = 0 # 当前目标的追单次数
+        self.rejects = 0 # 连续未成交即结束的委托数
+        self.retry_at = 0.0 # 拒单过多后平仓目标的下次重试时间
+        self.net_at_insert = 0 # 当前挂单发出时的净持仓
+        self.settling = None # 已结束但回报未到齐的委托 (order_id, 成交手数, 应到达的净持仓)
+
+    def set_target_volume(self, volume:int):
+        """
+        Args:
+            volume (int): target net position (positive long, negative short)
+        """
+        if self.quote is None:
+            self.quote = self.api.get_quote(self.symbol)
+        self.target = int(volume)
+        self.theoretical = self.quote.last_price
+        self.chases = 0
+        self.rejects = 0
+        self.retry_at = 0.0
+        if self.order is not None and not self.cancelling:
+            # 目标改变，撤掉旧目标的挂单后重新计算
+            self._cancel()
+        self.step()
+
+    def _cancel(self):
+        self.api.cancel_order(self.order)
+        self.cancelling = True
+        self.executor.cancels += 1
+
+    def _next_leg(self):
+        """
+        Returns:
+            result (tuple): (direction, offset, volume) of the next child order, None at target
+        """
+        position = self.position
+        net = position.pos_long - position.pos_short
+        delta = self.target - net
+        if delta == 0:
+            return None
+        direction = 'BUY' if delta > 0 else 'SELL'
+        held_today, held_his = (position.pos_short_today, position.pos_short_his) if delta > 0 else (position.pos_long_today, position.pos_long_his)
+        if held_today + held_his > 0:
+            # 先平后开
+            if self.exchange_id in CLOSE_TODAY_EXCHANGES:
+                offset, available = ('CLOSETODAY', held_today) if held_today > 0 else ('CLOSE', held_his)
+            else:
+                offset, available = 'CLOSE', held_today + held_his
+            volume = min(abs(delta), available)
+        else:
+            offset, volume = 'OPEN', abs(delta)
+        if self.executor.max_child:
+            volume = min(volume, self.executor.max_child)
+        return direction, offset, volume
+
+    def _price(self, direction:str, offset:str):
+        """
+        limit price of a new child: our side of the touch while passive, the other side once chasing
+        """
+        quote = self.quote
+        exiting = offset != 'OPEN'
+        wait = self.executor.exit_chase_ms if exiting else self.executor.chase_ms
+        aggressive = self.chases > 0 or wait <= 0
+        bid, ask = getattr(quote, 'bid_price1', math.nan), getattr(quote, 'ask_price1', math.nan)
+        if math.isnan(bid) or math.isnan(ask):
+            bid = ask = quote.last_price
+        # 只限制开仓滑点，平仓跟随盘口直至成交
+        capped = not exiting and self.executor.max_slippage is not None and not math.isnan(self.theoretical)
+        if direction == 'BUY':
+            price = ask if aggressive else bid
+            if capped:
+                price = min(price, self.theoretical * (1 + self.executor.max_slippage))
+            limit = getattr(quote, 'upper_limit', math.nan)
+            if not math.isnan(limit):
+                price = min(price, limit)
+        else:
+            price = bid if aggressive else ask
+            if capped:
+                price = max(price, self.theoretical * (1 - self.executor.max_slippage))
+            limit = getattr(quote, 'lower_limit', math.nan)
+            if not math.isnan(limit):
+                price = max(price, limit)
+        tick = getattr(quote, 'price_tick', math.nan)
+        if not math.isnan(tick) and tick > 0:
+            # 对齐最小变动价位，买价向下、卖价向上取整，不超出滑点上限
+            price = math.floor(price / tick + 1e-9) * tick if direction == 'BUY' else math.ceil(price / tick - 1e-9) * tick
+        return price
+
+    def step(self):
+        """
+        advance the state machine: retire a finished child, chase a stale one, or send the next child
+        """
+        order = self.order
+        if order is not None:
+            if order.status != 'FINISHED':
+                wait = self.executor.exit_chase_ms if order.offset != 'OPEN' else self.executor.chase_ms
+                if not self.cancelling and (self.executor.clock() - self.placed_at) * 1000 >= max(wait, self.executor.min_rest_ms):
+                    self.chases += 1
+                    self.executor.chases += 1
+                    self._cancel()
+                return
+            filled = order.volume_orig - order.volume_left
+            if filled == 0 and not self.cancelling:
+                # 未成交即结束（拒单/交易所撤单）
+                self.rejects += 1
+            elif filled > 0:
+                self.rejects = 0
+                self.settling = (order.order_id, filled, self.net_at_insert + (filled if order.direction == 'BUY' else -filled))
+            self.order = None
+            self.cancelling = False
+            self.executor.live -= 1
+        if self.settling is not None:
+            order_id, filled, expected = self.settling
+            if self.executor.traded.get(order_id, 0) < filled or self.position.pos_long - self.position.pos_short != expected:
+                # 成交/持仓回报晚于委托状态，到齐前不计算下一笔，避免重复下单
+                return
+            self.settling = None
+        if self.target is None:
+            return
+        leg = self._next_leg()
+        if leg is None:
+            return
+        direction, offset, volume = leg
+        if self.rejects >= self.executor.max_rejects:
+            closing = offset != 'OPEN'
+            if self.rejects == self.executor.max_rejects:
+                self.rejects += 1
+                if closing:
+                    self.executor.log.error("%s: %d orders rejected in a row, closing target %d retried every %d ms", self.symbol,
+                                            self.executor.max_rejects, self.target, self.executor.retry_ms)
+                else:
+                    self.executor.log.error("%s: %d orders rejected in a row, target %d abandoned", self.symbol, self.executor.max_rejects, self.target)
+            if not closing or self.executor.clock() < self.retry_at:
+                return
+            self.retry_at = self.executor.clock() + self.executor.retry_ms / 1000
+        price = self._price(direction, offset)
+        position = self.position
+        self.net_at_insert = position.pos_long - position.pos_short
+        self.order = self.api.insert_order(self.symbol, direction=direction, offset=offset, volume=volume, limit_price=price)
+        self.placed_at = self.executor.clock()
+        self.executor.on_insert(self.symbol, self.order, self.theoretical)
+
+
+class OrderExecutor(object):
+    """
+    Contract-level replacement for TargetPosTask. Pass as DonMA(..., executor=OrderExecutor());
+    each contract gets a ContractExecutor, all of them are stepped once per wakeup, and every
+    fill from api.get_trade() is attributed to its order and charged against the theoretical
+    (signal) price of that order:
+        slippage = (fill - theoretical) * volume * volume_multiple for a buy, the opposite for a sell
+
+    Args:
+        chase_ms (float, optional): how long an opening child rests at the touch before crossing. Defaults to 500
+        exit_chase_ms (float, optional): the same for closing children (MA / chandelier exits), 0 crosses at once. Defaults to 0
+        max_child (int, optional): hands per child order, None for no slicing. Defaults to 10
+        max_slippage (float, optional): furthest an opening limit may be from the theoretical price, as a
+            fraction, None for no cap; closing children are not capped. Defaults to 0.005
+        min_rest_ms (float, optional): minimum life of a crossing child before it is re-priced. Defaults to 200
+        max_rejects (int, optional): consecutive unfilled dead orders before an opening target is given up
+            (a closing one is then retried every retry_ms). Defaults to 3
+        retry_ms (float, optional): delay between two attempts of a closing target past max_rejects. Defaults to 1000
+        clock (callable, optional): seconds, for the chase timers. Defaults to time.perf_counter
+        log (logging.Logger, optional): defaults to the trade logger (custom_logger)
+    """
+    def __init__(self, chase_ms = 500, exit_chase_ms = 0, max_child = 10, max_slippage = 0.005, min_rest_ms = 200,
+                 max_rejects = 3, retry_ms = 1000, clock = time.perf_counter, log = None):
+        self.chase_ms = chase_ms
+        self.exit_chase_ms = exit_chase_ms
+        self.max_child = max_child
+        self.max_slippage = max_slippage
+        self.min_rest_ms = min_rest_ms
+        self.max_rejects = max_rejects
+        self.retry_ms = retry_ms
+        self.clock = clock
+        self.log = log if log is not None else logging.getLogger("custom_logger")
+        self.api = None
+        self.tasks = {} # 品种 -> ContractExecutor
+        self.orders = {} # order_id -> (品种, 理论价)
+        self.traded = {} # order_id -> 已收到的成交手数
+        self.seen_trades = 0 # 已处理的成交数（成交dict按插入顺序）
+        self.fills = {} # 品种 -> {'volume', 'slippage', 'orders'}
+        self.inserts = 0
+        self.live = 0 # 在途委托数
+        self.cancels = 0
+        self.chases = 0
+
+    def task(self, api, symbol:str, **kwargs):
+        """
+        TargetPosTask-compatible factory (DonMA target_pos_cls)
+
+        Returns:
+            result (ContractExecutor): the executor of this contract
+        """
+        self.api = api
+        task = self.tasks[symbol] = ContractExecutor(self, api, symbol)
+        return task
+
+    def on_insert(self, symbol:str, order, theoretical:float):
+        self.orders[order.order_id] = (symbol, theoretical)
+        self.inserts += 1
+        self.live += 1
+        self.fills.setdefault(symbol, {'volume' : 0, 'slippage' : 0.0, 'orders' : 0})['orders'] += 1
+
+    def step(self):
+        """
+        account for new fills, then step every contract; call once per wakeup
+        """
+        if self.api is None:
+            return
+        trades = self.api.get_trade()
+        if len(trades) != self.seen_trades:
+            for trade_id in list(trades)[self.seen_trades:]:
+                self.on_trade(trades[trade_id])
+            self.seen_trades = len(trades)
+        for task in self.tasks.values():
+            if task.target is not None:
+                task.step()
+
+    def on_trade(self, trade):
+        owner = self.orders.get(trade.order_id)
+        if owner is None:
+            # 不是本执行器发出的委托（手工单等）
+            return
+        symbol, theoretical = owner
+        self.traded[trade.order_id] = self.traded.get(trade.order_id, 0) + trade.volume
+        task = self.tasks[symbol]
+        unit = task.quote.volume_multiple if task.quote is not None else 1
+        sign = 1 if trade.direction == 'BUY' else -1
+        stats = self.fills[symbol]
+        stats['volume'] += trade.volume
+        if not math.isnan(theoretical):
+            stats['slippage'] += sign * (trade.price - theoretical) * trade.volume * unit
+
+    def slippage(self, symbol:str):
+        """
+        Returns:
+            result (float): slippage cost of a contract so far (positive = paid)
+        """
+        return self.fills.get(symbol, {}).get('slippage', 0.0)
+
+    def summary(self):
+        """
+        Returns:
+            result (dict): order counters and total slippage, plus the slippage of every traded contract
+        """
+        return {'inserts' : self.inserts, 'cancels' : self.cancels, 'chases' : self.chases,
+                'filled' : sum(f['volume'] for f in self.fills.values()),
+                'slippage' : round(sum(f['slippage'] for f in self.fills.values()), 2),
+                'contracts' : {s : {'volume' : f['volume'], 'slippage' : round(f['slippage'], 2)} for s, f in self.fills.items() if f['volume']}}
@@ -1,36 +1,47 @@
-import mysql.connector as sqlconnector
-# import pwds
 from datetime import date
 import datetime
 from tqsdk import TqApi, TargetPosTask, TqBacktest, TqSim
+from universe import SymbolUniverse, MySQLSource
 
-# mydb = sqlconnector.connect(
-#     host = pwds.host,
-#     user = pwds.user,
-#     password=pwds.password,
-#     db=pwds.default_db,
-#     port=pwds.port,
-#     auth_plugin = 'mysql_native_password'
-# )
-# mycursor = mydb.cursor()
+try:
+    import pwds # 数据库账号（不入库）
+except ImportError:
+    pwds = None
 
-def get_symbols():
+default_universe = None # 默认选股来源，首次调用 get_symbols 时创建
+
+def default_source():
+    """
+    MySQLSource on the server configured in pwds
+
+    Returns:
+        source (MySQLSource): speedtrade.selected on that server
     """
-    Get trading symbols from a remote server (detailed server obfuscated)
+    if pwds is None:
+        raise ImportError('pwds.py (database account) is required for the default symbol universe, '
+                          'or pass get_symbols a SymbolUniverse over another source')
+    return MySQLSource(host = pwds.host, user = pwds.user, password = pwds.password, db = pwds.default_db,
+                       port = pwds.port, auth_plugin = 'mysql_native_password')
+
+def get_symbols(universe = None):
+    """
+    Get trading symbols from a remote server (detailed server obfuscated), through a pooled
+    connection and a local cache of the last good universe (see universe.SymbolUniverse)
+
+    Args:
+        universe (SymbolUniverse, optional): where to read the universe from. Defaults to the
+            speedtrade.selected table on the server configured in pwds, connected to only when
+            the cache is missing or stale
 
     Returns:
         contract_names (list): a list of traded contract, in TQSDK's standard naming format
     """
-    contract_names = []
-    sql = 'SELECT exchange,instrument_id FROM speedtrade.selected'
-    mycursor.execute(sql)
-    result = mycursor.fetchall()
-    for i in result:
-        exchange = i[0].decode()
-        inst_id = i[1].decode()
-        actual_name = str(exchange) + '.' + str(inst_id)
-        contract_names.append(actual_name)
-    return contract_names
+    global default_universe
+    if universe is None:
+        if default_universe is None:
+            default_universe = SymbolUniverse(factory = default_source)
+        universe = default_universe
+    return universe.get()
 
 def pprint_positions(position):
     """
@@ -0,0 +1,173 @@
+import math
+from collections import deque
+
+import numpy as np
+
+
+class RollingExtreme(object):
+    """
+    Rolling max (or min) over the last `window` values, kept in a monotonic deque so that
+    each push and each read is amortized O(1). NaN follows python max()/min() over the window
+    slice: the result is NaN while the oldest value of the window is NaN, any other NaN is skipped
+    """
+    def __init__(self, window:int, is_max = True):
+        self.window = window
+        self.is_max = is_max
+        self.values = deque() # (序号, 值)，单调队列
+        self.nans = deque() # 窗口内 NaN 的序号
+        self.count = 0 # 已推入的数据个数
+
+    def push(self, value:float):
+        """
+        push one new value, drop the one leaving the window
+
+        Args:
+            value (float): the new value
+        """
+        n = self.count
+        self.count += 1
+        start = self.count - self.window # 窗口内最早的序号
+        while self.nans and self.nans[0] < start:
+            self.nans.popleft()
+        while self.values and self.values[0][0] < start:
+            self.values.popleft()
+        if math.isnan(value):
+            self.nans.append(n)
+            return
+        if self.is_max:
+            while self.values and self.values[-1][1] <= value:
+                self.values.pop()
+        else:
+            while self.values and self.values[-1][1] >= value:
+                self.values.pop()
+        self.values.append((n, value))
+
+    @property
+    def value(self):
+        start = max(self.count - self.window, 0) # 窗口内最早的序号
+        if (self.nans and self.nans[0] == start) or not self.values:
+            return math.nan
+        return self.values[0][1]
+
+
+class RollingMean(object):
+    """
+    Rolling mean over the last `window` values; NaN until the window is full, or while a NaN is
+    inside the window (same as tafunc.ma). The value is the correctly rounded sum of the window
+    (math.fsum, windows are short) divided by the window, so it does not drift with the history
+    """
+    def __init__(self, window:int):
+        self.window = window
+        self.values = deque()
+        self.nans = 0 # 窗口内 NaN 个数
+
+    def push(self, value:float):
+        """
+        push one new value, drop the one leaving the window
+
+        Args:
+            value (float): the new value
+        """
+        self.values.append(value)
+        if math.isnan(value):
+            self.nans += 1
+        if len(self.values) > self.window:
+            if math.isnan(self.values.popleft()):
+                self.nans -= 1
+
+    @property
+    def value(self):
+        if self.nans or len(self.values) < self.window:
+            return math.nan
+        return math.fsum(self.values) / self.window
+
+
+class DonchianChannel(object):
+    """
+    Incremental Don-chian channel and ma of one contract, computed over the closed bars only
+    (i.e. everything but the last, still forming, bar of a kline serial). Mirrors the full
+    recompute in DonMA.recalc_parameter:
+        channel_up = max(high[-window_hl - 1:-1])
+        channel_down = min(low[-window_hl - 1:-1])
+        ma = ma(close, window_ma).iloc[-2]
+    """
+    def __init__(self, window_hl = 5, window_ma = 5):
+        self.window_hl = window_hl # D-C参数
+        self.window_ma = window_ma # D-C参数
+        self.reset()
+
+    def reset(self):
+        """
+        drop every pushed bar
+        """
+        self.high = RollingExtreme(self.window_hl, is_max=True)
+        self.low = RollingExtreme(self.window_hl, is_max=False)
+        self.close = RollingMean(self.window_ma)
+        self.last_datetime = None # 最近一根已推入的收盘bar时间
+
+    def push(self, dt, high:float, low:float, close:float):
+        """
+        push one closed bar
+
+        Args:
+            dt: bar datetime (only used to detect gaps and duplicates)
+            high (float): bar high
+            low (float): bar low
+            close (float): bar close
+        """
+        self.high.push(high)
+        self.low.push(low)
+        self.close.push(close)
+        self.last_datetime = dt
+
+    def seed(self, kline, include_last = False):
+        """
+        cold start from a kline serial, every bar except the last one is pushed
+
+        Args:
+            kline (pandas.DataFrame): tqsdk kline serial (or a dict of datetime/high/low/close arrays)
+            include_last (bool, optional): the last bar is closed too (e.g. bars cached from the
+                previous session). Defaults to False
+        """
+        self.reset()
+        dts = np.asarray(kline['datetime'])
+        highs = np.asarray(kline['high'])
+        lows = np.asarray(kline['low'])
+        closes = np.asarray(kline['close'])
+        for i in range(len(dts) if include_last else len(dts) - 1):
+            self.push(dts[i], float(highs[i]), float(lows[i]), float(closes[i]))
+
+    def update(self, kline):
+        """
+        bring the channel up to date with a kline serial: O(1) when exactly one new bar closed
+        since the last call, otherwise (first call, missed bars) re-seed from the serial
+
+        Args:
+            kline (pandas.DataFrame): tqsdk kline serial (or a dict of arrays, e.g. BarAggregator.kline)
+
+        Returns:
+            result (bool): whether a new closed bar was taken in
+        """
+        dts = np.asarray(kline['datetime'])
+        if len(dts) < 2:
+            return False
+        closed_dt = dts[-2]
+        if self.last_datetime is not None and closed_dt == self.last_datetime:
+            return False
+        if self.last_datetime is not None and len(dts) >= 3 and dts[-3] == self.last_datetime:
+            self.push(closed_dt, float(np.asarray(kline['high'])[-2]), float(np.asarray(kline['low'])[-2]), float(np.asarray(kline['close'])[-2]))
+        else:
+            self.seed(kline)
+        return True
+
+    @property
+    def up(self):
+        return self.high.value
+
+    @property
+    def down(self):
+        return self.low.value
+
+    @property
+    def ma(self):
+        return self.close.value
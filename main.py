@@ -1,29 +1,46 @@
-import json
 import time
 import datetime
+import logging
 from datetime import date
 from tqsdk import TqApi, TargetPosTask, TqBacktest, TqKq, TqSim
 from tqsdk.tafunc import ma
 from tqsdk import api
 import helper
-import logging
 import math
+import operator
+import zlib
+import numpy as np
+import pandas as pd
+from batch import BatchState
+from indicator import DonchianChannel
+from checkpoint import Checkpoint, atomic_dump
+from dispatch import ChangeDispatcher
+from profiling import Profiler
+import startup
+from startup import BarCache
+from recorder import TickRecorder
+from execution import OrderExecutor
+from risk import RiskEngine
+from bars import BarAggregator
+from reload import ConfigWatcher
+from runner import AsyncRunner
+import tradelog
 
-# logger system setup
+# 交易日志：文件与写日志线程只在实盘入口（__main__）挂载，导入本模块（测试、回放、分片）不会改动交易日志
 custom_logger = logging.getLogger("custom_logger")
-custom_handler = logging.FileHandler('trade-related.log', mode='w')
-formater = logging.Formatter(fmt='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-custom_handler.setFormatter(formater)
-custom_logger.addHandler(custom_handler)
+custom_logger.addHandler(logging.NullHandler())
+
+_last_price = operator.attrgetter('last_price')
+
 
 class DonMA(object):
     """
     A Real-market trading class mirroring the piecewise-cta strategy 
     """
-    def __init__(self, symbols:list, account = None, window_ma = 5, window_hl = 5, market_cap = 1e6, cost_percentage = 1, backtest = True, debug = False, kq = None, tq_chan = None):
+    def __init__(self, symbols:list, account = None, window_ma = 5, window_hl = 5, market_cap = 1e6, cost_percentage = 1, backtest = True, debug = False, kq = None, tq_chan = None, vectorized = False, pendant_step = 0.001, target_pos_cls = TargetPosTask, checkpoint = None, profiler = None, parallel_startup = True, bar_cache = None, recorder = None, universe = None, shard = None, executor = None, risk = None, bar_period = 24*60*60, aggregator = None, reloader = None):
         self.debug = debug # debug开关
         self.account = account # 交易账号
-        self.symbols = symbols # 今日活跃交易品种
+        self.symbols = list(symbols) # 今日活跃交易品种
         self.units = {} # 买卖单位dict
         self.states = {} # 记录每个品种持仓和最新价格，和吊灯参数，入场ma，持仓最高/最低
         self.t_0trades = {} # 当日只能对一个品种进行一个大操作
@@ -33,10 +50,31 @@ class DonMA(object):
         self.window_hl = window_hl # D-C参数
         self.market_cap = market_cap # 单个品种最大市值
         self.cost_percentage = cost_percentage # 单个品种最大亏损
+        self.pendant_step = pendant_step # 每次吊灯出场后吊灯线收紧幅度
+        self.risk = risk # 实时风控（RiskEngine，可选），set_position 前检查目标仓位
+        self.executor = executor # 合约级下单执行（OrderExecutor，可选），设置后替代target_pos_cls
+        self.target_pos_cls = executor.task if executor is not None else target_pos_cls # 目标仓位执行器（默认TargetPosTask，回放时替换为模拟成交）
+        self.checkpoint = checkpoint # 增量状态存档（Checkpoint，可选）
+        self.profiler = profiler # 各环节耗时统计（Profiler，可选）
+        self.eval_start = None # 当前tick评估开始时间 (perf_counter)
+        self.bar_cache = bar_cache # 上一交易日日线缓存（BarCache，可选），用于启动时立即计算通道
+        self.cache_seeded = set() # 由缓存计算通道、尚未收到日线订阅数据的品种
+        self.recorder = recorder # tick/日线本地记录（TickRecorder，可选）
+        self.shard = shard # 多进程分片运行时的 (分片序号, 分片数)
+        self.bar_period = bar_period # 策略K线周期（秒），通道计算与当日标记重置都按此周期
+        self.aggregator = aggregator # 由tick本地合成多周期K线（BarAggregator，可选）
+        self.local_bars = aggregator is not None and bar_period in aggregator.periods # 策略周期的K线由本地合成，不订阅K线
+        self.reloader = reloader # 运行中重新加载品种池与参数（ConfigWatcher，可选）
+        self.windows = {} # 品种 -> (window_hl, window_ma)，单独设置的D-C参数
+        self.warming = {} # 后台订阅中的品种 -> {'task', 'kline', 'windows'}
 
         self.channel_up = {} # 各个品种上轨
         self.channel_down = {} # 下轨
         self.ma = {} # 各个品种中轨
+        self.channels = {} # 各个品种增量D-C通道与均线
+        self.skip_limiter = tradelog.RateLimiter(60) # 缺少日线时的跳过提示，每个品种每分钟最多一条
+        self.veto_limiter = tradelog.RateLimiter(60) # 风控拒绝信号的提示，每个品种每分钟最多一条
+        self.batch = BatchState(symbols, market_cap, cost_percentage, pendant_step) if vectorized else None # 向量化批量计算（可选）
 
         # Initialze tqsdk API for various use
         if backtest:
@@ -55,39 +93,89 @@ class DonMA(object):
         self.existing_positions = self.api.get_position() # 现有持仓（账户端获取，自动更新）
         self.trades = self.api.get_trade() # 今交易日交易，（账户获取，随时更新）
         self.symbols_old = []
+        selected = set(universe) if universe is not None else set(self.symbols) # 全部今日活跃品种（分片运行时包含其他分片的品种）
 
         for i in self.existing_positions:
-            # 获取所有之前有持仓但是现在不在选择池里的品种, 初始化
-            if (not (i in self.symbols)) and self.existing_positions[i].pos != 0:
+            # 获取所有之前有持仓但是现在不在选择池里的品种, 初始化（分片运行时只处理归属本分片的）
+            if shard is not None and zlib.crc32(i.encode()) % shard[1] != shard[0]:
+                continue
+            if (not (i in selected)) and self.existing_positions[i].pos != 0:
                 self.symbols_old.append(i)
-                self.quote[i] = self.api.get_quote(i)
-                self.target_pos[i] = TargetPosTask(self.api,symbol=i, trade_chan=tq_chan)
+                if not parallel_startup:
+                    self.quote[i] = self.api.get_quote(i)
+                self.target_pos[i] = self.target_pos_cls(self.api,symbol=i, trade_chan=tq_chan)
 
         kline_length = max(self.window_hl + 1,self.window_ma + 1) # 设定k线周期
+        self.kline_length = kline_length
+
+        if parallel_startup:
+            # 一次性发出所有订阅，行情一起等待，日线只发请求不等待
+            self.quote.update(startup.subscribe_quotes(self.api, self.symbols_old + list(self.symbols)))
+            if not self.local_bars:
+                self.kline = startup.subscribe_klines(self.api, self.symbols, self.bar_period, kline_length)
+        # 缓存的是日线，只用于日线策略
+        cached_bars = self.bar_cache.load() if self.bar_cache is not None and self.bar_period == 24*60*60 and not self.local_bars else {}
 
         for symbol in self.symbols:
-            # 对各个活跃交易品种初始化，从账户中获取持仓和开仓价格（入场均线和极端值默认重制为入场价格）
-            cloud_pos = 0
-            cloud_last_pricce = 0
-            if symbol in self.existing_positions:
-                cloud_pos = self.existing_positions[symbol].pos
-                if cloud_pos > 0 :
-                    cloud_last_pricce = self.existing_positions[symbol].open_price_long
-                elif cloud_pos < 0:
-                    cloud_last_pricce = self.existing_positions[symbol].open_price_short     
-            self.quote[symbol] = self.api.get_quote(symbol)
-            self.units[symbol] = self.quote[symbol].volume_multiple
-            self.kline[symbol] = self.api.get_kline_serial(symbol,24*60*60,kline_length) #日线
-            self.target_pos[symbol] = TargetPosTask(self.api,symbol=symbol)
-            self.t_0trades[symbol] = False
-            self.pendant_trades[symbol] = False
-            self.curr_kline_updated[symbol] = False
-            self.states[symbol] = {'position' : cloud_pos, "last_price" : cloud_last_pricce, 'pendant_coef' : 1, 'extreme_since_entry' : cloud_last_pricce, 'open_ma' : cloud_last_pricce}
+            if not parallel_startup:
+                self.quote[symbol] = self.api.get_quote(symbol)
+                if not self.local_bars:
+                    self.kline[symbol] = self.api.get_kline_serial(symbol,self.bar_period,kline_length) #日线（或配置的周期）
+            self.init_symbol(symbol)
+            if symbol in cached_bars:
+                # 缓存的日线均已收盘（当前交易日的bar在读取时已去掉），直接计算通道，收到行情即可交易
+                self.channels[symbol].seed(cached_bars[symbol], include_last=True)
+                self.cache_seeded.add(symbol)
+                self.curr_kline_updated[symbol] = True
+
+        if parallel_startup:
+            # 只等待没有缓存的品种的日线
+            uncached = {s : k for s, k in self.kline.items() if s not in self.cache_seeded}
+            startup.wait_until(self.api, lambda: startup.klines_ready(self.api, uncached))
 
         self.account = self.api.get_account()
+        if self.risk is not None:
+            # 风控从当前持仓开始累计敞口
+            for s in self.symbols_old + list(self.symbols):
+                quote = self.quote[s]
+                pos = self.states[s]['position'] if s in self.states else self.existing_positions[s].pos
+                self.risk.register(s, quote.volume_multiple, quote.last_price, pos, getattr(quote, 'margin', math.nan))
+            self.risk.on_account(self.account)
+        self.dispatcher = ChangeDispatcher(self.api, self.symbols, self.quote, self.kline, self.on_kline_update, self.on_quotes) # 只处理有变化的品种
+        if parallel_startup:
+            # 等待期间到达的日线已被 wait_update 消费，首次唤醒按新bar处理（与阻塞订阅一致）
+            self.dispatcher.mark_new_bars(uncached)
 
         custom_logger.warning("Initialization finished")
 
+    def init_symbol(self, symbol:str):
+        """
+        set up the dict state of one active contract (its quote must be subscribed), position and
+        open price from the account (entry ma and extreme default to the open price)
+
+        Args:
+            symbol (str): the contract name
+        """
+        # 对各个活跃交易品种初始化，从账户中获取持仓和开仓价格（入场均线和极端值默认重制为入场价格）
+        cloud_pos = 0
+        cloud_last_pricce = 0
+        if symbol in self.existing_positions:
+            cloud_pos = self.existing_positions[symbol].pos
+            if cloud_pos > 0 :
+                cloud_last_pricce = self.existing_positions[symbol].open_price_long
+            elif cloud_pos < 0:
+                cloud_last_pricce = self.existing_positions[symbol].open_price_short
+        window_hl, window_ma = self.windows.get(symbol, (self.window_hl, self.window_ma))
+        self.units[symbol] = self.quote[symbol].volume_multiple
+        if symbol not in self.target_pos:
+            # 从平仓列表重新加入的品种沿用原执行器
+            self.target_pos[symbol] = self.target_pos_cls(self.api,symbol=symbol)
+        self.channels[symbol] = DonchianChannel(window_hl, window_ma)
+        self.t_0trades[symbol] = False
+        self.pendant_trades[symbol] = False
+        self.curr_kline_updated[symbol] = False
+        self.states[symbol] = {'position' : cloud_pos, "last_price" : cloud_last_pricce, 'pendant_coef' : 1, 'extreme_since_entry' : cloud_last_pricce, 'open_ma' : cloud_last_pricce}
+
     def load_from_json(self,json_dict, interday_restore = False):
         """
         load local data from json to object dict
@@ -106,34 +194,106 @@ class DonMA(object):
                     self.t_0trades[i] = json_dict[i]['t0_trade']
                     self.pendant_trades[i] = json_dict[i]['pendant_trade']
     
+    def state_entry(self, s:str):
+        """
+        the persisted state of one symbol, in the load_from_json format
+
+        Args:
+            s (str): the contract name
+
+        Returns:
+            result (dict): pendant_coef, extreme_since_entry, open_ma, t0_trade, pendant_trade
+        """
+        state = self.states[s]
+        return {'pendant_coef' : state['pendant_coef'], 'extreme_since_entry' : state['extreme_since_entry'], 'open_ma' : state['open_ma'],
+                't0_trade' : self.t_0trades[s], 'pendant_trade' : self.pendant_trades[s]}
+
+    def checkpoint_symbol(self, s:str):
+        """
+        append the state of one symbol to the checkpoint log (no-op if unchanged or no checkpoint)
+
+        Args:
+            s (str): the contract name
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.record(s, self.state_entry(s))
+
     def save_to_json(self):
         """
-        Dump all settings to json file, use together with load_from_json
+        Dump all settings to json file, use together with load_from_json. Written atomically
+        (temp file + rename); with a checkpoint this is its compaction (snapshot + fresh log)
+        """
+        output_dict = self.snapshot()
+        if self.checkpoint is not None:
+            self.checkpoint.compact(output_dict)
+        else:
+            atomic_dump(output_dict, "donma_state.json")  # 保存数据
+
+    def snapshot(self):
+        """
+        Returns:
+            result (dict): symbol -> state, the save_to_json content
+        """
+        return {i : self.state_entry(i) for i in self.states}
+
+    def bars(self, s:str):
+        """
+        the bar serial of the strategy period: the subscribed kline serial, or the locally aggregated bars
+
+        Args:
+            s (str): the contract name
+
+        Returns:
+            result: pandas.DataFrame (tqsdk kline serial) or dict of arrays (BarAggregator.kline)
         """
-        output_dict = {}
-        for i in self.states:
-            output_dict[i] = {'pendant_coef' : self.states[i]['pendant_coef'], 'extreme_since_entry' : self.states[i]['extreme_since_entry'], 'open_ma' : self.states[i]['open_ma']}
-        for i in self.t_0trades:
-            output_dict[i]['t0_trade'] = self.t_0trades[i]
-            output_dict[i]['pendant_trade'] = self.pendant_trades[i]
-        json.dump(output_dict, open("donma_state.json", "w"),sort_keys=True,indent=4)  # 保存数据
+        if self.local_bars:
+            channel = self.channels[s]
+            return self.aggregator.kline(s, self.bar_period, max(channel.window_hl, channel.window_ma) + 1)
+        return self.kline[s]
 
-    def recalc_parameter(self,s:str):
+    def recalc_parameter(self,s:str, update = True):
         """
-        recalculate ma, mh, ml for new daily kline
+        recalculate ma, mh, ml for new daily kline, incrementally: only the bar that just
+        closed is pushed into the channel (re-seeded from the whole serial on first call or
+        after missed bars). test_indicator.py checks it against recalc_parameter_full
 
         Args:
             s (str): the contract name
+            update (bool, optional): take in the kline serial, False keeps the channel as seeded
+                (from the bar cache). Defaults to True
 
         Returns:
             result (bool): indicating it is done
         """
+        start = time.perf_counter()
         symbol = s
-        self.channel_up[symbol] = max(self.kline[symbol].high[-self.window_hl - 1:-1])
-        self.channel_down[symbol] = min(self.kline[symbol].low[-self.window_hl - 1:-1])
-        self.ma[symbol] = ma(self.kline[symbol].close, self.window_ma).iloc[-2]
-        custom_logger.warning("Don-chian {} upper middle low: {}, {}, {}".format( symbol, str(self.channel_up[symbol]), str(self.ma[symbol]) ,str(self.channel_down[symbol])))
+        channel = self.channels[symbol]
+        if update:
+            channel.update(self.bars(symbol))
+        self.channel_up[symbol] = channel.up
+        self.channel_down[symbol] = channel.down
+        self.ma[symbol] = channel.ma
+        custom_logger.warning("Don-chian %s upper middle low: %s, %s, %s", symbol, self.channel_up[symbol], self.ma[symbol], self.channel_down[symbol])
+        if self.profiler is not None:
+            self.profiler.add('recalc', time.perf_counter() - start)
         return True
+
+    def recalc_parameter_full(self,s:str):
+        """
+        full recompute of the channel from the kline serial (reference for the incremental one)
+
+        Args:
+            s (str): the contract name
+
+        Returns:
+            result (tuple): upper band, lower band, ma
+        """
+        kline = self.bars(s)
+        channel = self.channels[s]
+        up = max(np.asarray(kline['high'])[-channel.window_hl - 1:-1])
+        down = min(np.asarray(kline['low'])[-channel.window_hl - 1:-1])
+        mid = ma(pd.Series(np.asarray(kline['close'])), channel.window_ma).iloc[-2]
+        return up, down, mid
     
     def set_position(self, symbol:str, pos:float, is_pendant = False):
         """
@@ -143,8 +303,18 @@ class DonMA(object):
             symbol (str): name of contract
             pos (float): targeting amount
             is_pendant (bool): whether this is a pendant exit, default is False
+
+        Returns:
+            result (float): the target actually sent, the current position if the risk engine vetoed it
         """
         prev_pos = self.states[symbol]['position']
+        if self.risk is not None:
+            checked = self.risk.check(symbol, pos)
+            if checked != pos and checked == prev_pos:
+                # 风控拒绝
+                return prev_pos
+            pos = checked
+            self.risk.set_position(symbol, pos)
         self.states[symbol]['position'] = pos
         if prev_pos == 0 and pos!=0:
             self.states[symbol]['last_price'] = self.quote[symbol]['last_price']
@@ -162,6 +332,10 @@ class DonMA(object):
             self.states[symbol]['extreme_since_entry'] = self.quote[symbol]['last_price']
 
         self.target_pos[symbol].set_target_volume(pos)
+        if self.profiler is not None:
+            self.profiler.on_order(symbol, self.quote[symbol].datetime, self.eval_start)
+        self.checkpoint_symbol(symbol)
+        return pos
 
     def update_holding_extremes(self, symbol : str, curr_price : float):
         """
@@ -172,31 +346,510 @@ class DonMA(object):
             curr_price (float): current "last price" from tick
         """
         pos = self.states[symbol]['position']
+        prev = self.states[symbol]['extreme_since_entry']
         if  pos > 0:
             # 更新最高收益
-            self.states[symbol]['extreme_since_entry']  =  max([self.states[symbol]['extreme_since_entry'],curr_price])
+            self.states[symbol]['extreme_since_entry']  =  max([prev,curr_price])
         elif pos < 0:
             # 更新最高收益
-            self.states[symbol]['extreme_since_entry']  =  min([self.states[symbol]['extreme_since_entry'], curr_price])
+            self.states[symbol]['extreme_since_entry']  =  min([prev, curr_price])
         else:
             #完全平仓，reset
             self.states[symbol]['extreme_since_entry'] = 0
+        if self.states[symbol]['extreme_since_entry'] != prev:
+            self.checkpoint_symbol(symbol)
 
-    def check_open_close(self, interday_restore = False):
+    def signal(self, s:str, action:str, target:int, curr_time:str, curr_price:float, levels:dict, is_pendant = False):
         """
-        trading strategy
+        send the target of a signal through set_position and log it; a target vetoed by the risk
+        engine is logged as a veto (at most once a minute per contract, the signal repeats every tick)
+
+        Args:
+            s (str): name of contract
+            action (str): signal name for the trade log
+            target (int): requested target position
+            curr_time (str): tick datetime
+            curr_price (float): tick last price
+            levels (dict): the levels behind the signal, for the trade log
+            is_pendant (bool, optional): whether this is a pendant exit. Defaults to False
+
+        Returns:
+            result (bool): whether the order went through
         """
-        # initialize autosave reference time
-        last_save_time = datetime.datetime.now()
+        prev_pos = self.states[s]['position']
+        applied = self.set_position(s, target, is_pendant)
+        if applied != target and applied == prev_pos:
+            suppressed = self.veto_limiter.hit(s)
+            if suppressed is not None:
+                custom_logger.warning(tradelog.VETO_FORMAT, action, s, curr_time, curr_price, target, levels, suppressed)
+            return False
+        custom_logger.warning(tradelog.SIGNAL_FORMAT, action, s, curr_time, curr_price, applied, levels)
+        return True
+
+    def open_position(self, s:str, op_quantity:int, curr_time:str, curr_price:float):
+        """
+        open a breakout position (positive op_quantity for long, negative for short); a vetoed
+        open leaves the daily flag unset, so the breakout is retried on the next tick
+
+        Args:
+            s (str): name of contract
+            op_quantity (int): signed hands to open
+            curr_time (str): tick datetime
+            curr_price (float): tick last price
+        """
+        if self.signal(s, 'open long' if op_quantity > 0 else 'open short', op_quantity, curr_time, curr_price,
+                       {'upper_band' : self.channel_up[s], 'ma' : self.ma[s], 'lower_band' : self.channel_down[s]}):
+            self.t_0trades[s] = True
+            self.checkpoint_symbol(s)
+
+    def pendant_exit(self, s:str, open_cost:float, max_profit:float, pendant_boundary:float, curr_time:str, curr_price:float):
+        """
+        chandelier exit, reduce a third of the position
+
+        Args:
+            s (str): name of contract
+            open_cost (float): theoretical open price
+            max_profit (float): max profit ratio since entry
+            pendant_boundary (float): the chandelier line that has been crossed
+            curr_time (str): tick datetime
+            curr_price (float): tick last price
+        """
+        pos = self.states[s]['position']
+        if self.signal(s, 'pendant exit', pos - (int(pos/3)), curr_time, curr_price,
+                       {'pos' : pos, 'open_cost' : open_cost, 'max_profit' : max_profit, 'pendant_line' : pendant_boundary}, True):
+            self.pendant_trades[s] = True
+            self.checkpoint_symbol(s)
+
+    def ma_exit(self, s:str, open_cost:float, actual_ma:float, curr_time:str, curr_price:float):
+        """
+        close the whole position once price crosses back over the (entry-adjusted) ma
+
+        Args:
+            s (str): name of contract
+            open_cost (float): theoretical open price
+            actual_ma (float): the exit ma
+            curr_time (str): tick datetime
+            curr_price (float): tick last price
+        """
+        if self.signal(s, 'ma exit', 0, curr_time, curr_price,
+                       {'pos' : self.states[s]['position'], 'open_cost' : open_cost, 'actual_ma' : actual_ma}):
+            self.t_0trades[s] = True
+            self.checkpoint_symbol(s)
+
+    def on_kline_update(self, s:str):
+        """
+        new bar of the strategy period (daily by default): reset the daily flags and recalculate the channels
+
+        Args:
+            s (str): name of contract
+        """
+        custom_logger.warning(s + " calculated")
+        if self.recorder is not None and not self.local_bars:
+            self.recorder.record_bar(s, self.kline[s], self.bar_period)
+        if s in self.cache_seeded:
+            # 首次收到日线：仍是缓存所在交易日之后的同一交易日，不重置当日标记，用订阅数据重新计算通道
+            self.cache_seeded.discard(s)
+            self.channels[s].reset()
+        else:
+            self.t_0trades[s] = False
+            self.pendant_trades[s] = False
+        self.curr_kline_updated[s] = True
+        self.recalc_parameter(s)
+        self.checkpoint_symbol(s)
+        if self.batch is not None:
+            self.batch.load_row(self, s)
+
+    def on_tick(self, s:str, interday_restore = False):
+        """
+        evaluate open/close/pendant conditions for one symbol on a last price change
+
+        Args:
+            s (str): name of contract
+            interday_restore (bool, optional): trade before the first bar update. Defaults to False.
+        """
+        if not interday_restore:
+            if self.curr_kline_updated[s] == False:
+                suppressed = self.skip_limiter.hit(s)
+                if suppressed is not None:
+                    custom_logger.warning('%sskipped due to lack of updated kline (%d suppressed)', s, suppressed)
+                # Skip tick without previou day's daily k-line
+                return
+        curr_price = self.quote[s].last_price
+        curr_time = self.quote[s].datetime
+        if math.isnan(curr_price):
+            return
+        self.update_holding_extremes(s, curr_price)
+        if self.states[s]['position'] == 0 and not self.t_0trades[s]:
+            #当前无仓位，考虑是否开仓
+            if curr_price == self.ma[s]:
+                op_quantity = self.market_cap/(self.quote[s].last_price * self.units[s])
+            else:
+                op_quantity = min([(self.market_cap * self.cost_percentage)/(abs(curr_price - self.ma[s])* self.units[s]), self.market_cap/(self.quote[s].last_price * self.units[s])])
+            if math.isnan(op_quantity):
+                op_quantity = 0
+            op_quantity = int(op_quantity)
+            if  curr_price >= self.channel_up[s]:
+                # 达到开多仓条件
+                if op_quantity == 0:
+                    op_quantity = 1
+                self.open_position(s, op_quantity, curr_time, curr_price)
+            elif  curr_price <= self.channel_down[s]:
+                # 达到开空仓条件
+                op_quantity = op_quantity * -1
+                if op_quantity == 0:
+                    op_quantity = -1
+                self.open_position(s, op_quantity, curr_time, curr_price)
+        elif self.states[s]['position'] != 0:
+            # 考虑是否平仓
+            if self.states[s]['position'] > 0:
+                # 考虑多仓
+                open_cost = self.states[s]['last_price']
+                max_profit = self.states[s]['extreme_since_entry'] / open_cost - 1
+
+                actual_ma = max([self.ma[s],self.states[s]['open_ma']])
+                if max_profit > 0 and not self.t_0trades[s]:
+                    pendant_temp_coef = 1 - (self.states[s]['pendant_coef']*self.pendant_step/max_profit)
+                    pendant_boundary = self.states[s]['extreme_since_entry'] * pendant_temp_coef
+                    if curr_price <= pendant_boundary and not curr_price <= actual_ma:
+                        if pendant_boundary > actual_ma:
+                            if (self.states[s]['position'] >=3) and not self.pendant_trades[s]:
+                                self.pendant_exit(s, open_cost, max_profit, pendant_boundary, curr_time, curr_price)
+
+                if curr_price <= actual_ma and not self.t_0trades[s]:
+                    self.ma_exit(s, open_cost, actual_ma, curr_time, curr_price)
+            else:
+                #考虑空仓
+                open_cost = self.states[s]['last_price']
+                max_profit = open_cost / self.states[s]['extreme_since_entry']  - 1
+                actual_ma = min([self.ma[s],self.states[s]['open_ma']])
+                if max_profit > 0 and not self.t_0trades[s]:
+                    pendant_temp_coef = 1 + (self.states[s]['pendant_coef']*self.pendant_step/max_profit)
+                    pendant_boundary = self.states[s]['extreme_since_entry'] * pendant_temp_coef
+                    if curr_price >= pendant_boundary and not curr_price >= actual_ma:
+                        if pendant_boundary < actual_ma:
+                            if (abs(self.states[s]['position']) >=3) and not self.pendant_trades[s]:
+                                self.pendant_exit(s, open_cost, max_profit, pendant_boundary, curr_time, curr_price)
+
+                if curr_price >= actual_ma and not self.t_0trades[s]:
+                    self.ma_exit(s, open_cost, actual_ma, curr_time, curr_price)
+
+    def on_ticks_batch(self, changed:list, interday_restore = False):
+        """
+        vectorized on_tick: evaluate all symbols whose last price changed in one pass over
+        the BatchState arrays, then dispatch orders only for the rows that fire. Wakeups with
+        fewer than batch.min_rows changes take the scalar path (cheaper at that size)
+
+        Args:
+            changed (list): contracts whose last price changed in this wakeup
+            interday_restore (bool, optional): trade before the first bar update. Defaults to False.
+        """
+        batch = self.batch
+        n = len(changed)
+        if n < batch.min_rows:
+            # 变化品种少时数组运算的固定开销高于逐个判断，逐个计算后同步行
+            for s in changed:
+                i = batch.index[s]
+                position = self.states[s]['position']
+                self.on_tick(s, interday_restore)
+                if self.states[s]['position'] != position:
+                    batch.load_row(self, s)
+                else:
+                    batch.extreme_since_entry[i] = self.states[s]['extreme_since_entry']
+            return
+        idx = np.fromiter(map(batch.index.__getitem__, changed), dtype=np.intp, count=n)
+        price = np.fromiter(map(_last_price, map(self.quote.__getitem__, changed)), dtype=np.float64, count=n)
+        keep = ~np.isnan(price)
+        if not interday_restore:
+            ready = batch.ready[idx]
+            for k in np.flatnonzero(keep & ~ready).tolist():
+                suppressed = self.skip_limiter.hit(changed[k])
+                if suppressed is not None:
+                    custom_logger.warning('%sskipped due to lack of updated kline (%d suppressed)', changed[k], suppressed)
+            keep &= ready
+        if not keep.all():
+            idx = idx[keep]
+            price = price[keep]
+            if not len(idx):
+                return
+        extremes = batch.extreme_since_entry[idx]
+        signals = batch.evaluate(idx, price)
+
+        # 持仓极值回写到 states（只处理变化的行）
+        new_extremes = batch.extreme_since_entry[idx]
+        for k in np.flatnonzero(new_extremes != extremes).tolist():
+            s = batch.symbols[idx[k]]
+            self.states[s]['extreme_since_entry'] = float(new_extremes[k])
+            self.checkpoint_symbol(s)
 
+        fired = (signals['open_qty'] != 0) | signals['pendant'] | signals['ma_exit']
+        for k in np.flatnonzero(fired).tolist():
+            s = batch.symbols[idx[k]]
+            curr_price = float(price[k])
+            curr_time = self.quote[s].datetime
+            if signals['open_qty'][k] != 0:
+                self.open_position(s, int(signals['open_qty'][k]), curr_time, curr_price)
+            elif signals['pendant'][k]:
+                self.pendant_exit(s, float(signals['open_cost'][k]), float(signals['max_profit'][k]), float(signals['pendant_boundary'][k]), curr_time, curr_price)
+            else:
+                self.ma_exit(s, float(signals['open_cost'][k]), float(signals['actual_ma'][k]), curr_time, curr_price)
+            batch.load_row(self, s)
+
+    def prepare_trading(self):
+        """
+        flatten inactive contracts and calculate the initial channels, run once before the first update
+        """
         for old_s in self.symbols_old:
             # set target positions to zero for inactive contracts
             custom_logger.warning(old_s + " target to 0")
             self.target_pos[old_s].set_target_volume(0)
+            if self.risk is not None:
+                self.risk.set_position(old_s, 0)
         
         for s in self.symbols:
             # Calculate initial daily K line
+            self.recalc_parameter(s, update = s not in self.cache_seeded)
+        if self.batch is not None:
+            self.batch.load(self)
+
+    def on_quotes(self, changed:list, interday_restore = False):
+        """
+        evaluate every contract whose last price changed, one by one or as a batch
+
+        Args:
+            changed (list): contracts whose last price changed in this wakeup
+            interday_restore (bool, optional): trade before the first bar update. Defaults to False.
+        """
+        if self.recorder is not None:
+            self.recorder.record_quotes(changed, self.quote)
+        if self.aggregator is not None:
+            # 本地合成K线，策略周期的新bar先于本tick的评估处理
+            for s, period in self.aggregator.on_quotes(changed, self.quote):
+                if self.recorder is not None:
+                    self.recorder.record_bar(s, self.aggregator.kline(s, period), period)
+                if self.local_bars and period == self.bar_period and s in self.channels:
+                    self.on_kline_update(s)
+        if self.risk is not None:
+            self.risk.on_quotes(changed, self.quote)
+        if self.profiler is None:
+            if self.batch is not None:
+                self.on_ticks_batch(changed, interday_restore)
+            else:
+                for s in changed:
+                    self.on_tick(s, interday_restore)
+            return
+        if self.batch is not None:
+            self.eval_start = time.perf_counter()
+            self.on_ticks_batch(changed, interday_restore)
+            self.profiler.add('evaluate_batch', time.perf_counter() - self.eval_start)
+        else:
+            for s in changed:
+                self.eval_start = time.perf_counter()
+                self.on_tick(s, interday_restore)
+                self.profiler.add('evaluate', time.perf_counter() - self.eval_start)
+        self.eval_start = None
+
+    def on_update(self, interday_restore = False):
+        """
+        dispatch one wait_update wakeup: new bars first, then the ticks, only for the contracts that changed
+
+        Args:
+            interday_restore (bool, optional): trade before the first bar update. Defaults to False.
+        """
+        self.dispatcher.dispatch(interday_restore)
+        self.after_update()
+
+    def after_update(self):
+        """
+        per-wakeup housekeeping once the changes are handled: order execution, risk and latency
+        bookkeeping, warm-up and live configuration
+        """
+        if self.executor is not None:
+            self.executor.step()
+        if self.risk is not None:
+            self.risk.on_account(self.account)
+            if self.executor is not None:
+                self.risk.open_orders = self.executor.live
+        if self.profiler is not None:
+            self.profiler.on_trades(self.trades)
+        if self.warming:
+            self.finish_warmup()
+        if self.reloader is not None and self.reloader.due():
+            config = self.reloader.poll()
+            if config is not None:
+                self.apply_config(config)
+            self.release_flattened()
+
+    def add_symbol(self, s:str, window_hl = None, window_ma = None):
+        """
+        start trading a contract mid-session: its quote and kline are requested from a background
+        task, the contract joins the dispatch once the data has arrived (finish_warmup). A contract
+        still being flattened after remove_symbol is simply tracked again
+
+        Args:
+            s (str): the contract name
+            window_hl (int, optional): D-C window of this contract. Defaults to the strategy window
+            window_ma (int, optional): ma window of this contract. Defaults to the strategy window
+        """
+        if window_hl is not None or window_ma is not None:
+            self.windows[s] = (window_hl or self.window_hl, window_ma or self.window_ma)
+            if s in self.symbols:
+                self.set_windows(s, *self.windows[s])
+        if s in self.symbols or s in self.warming:
+            return
+        if s in self.symbols_old and s in self.states:
+            # 仍在平仓中，直接恢复交易
+            self.symbols_old.remove(s)
+            self.symbols.append(s)
+            self.dispatcher.track(s)
+            custom_logger.warning("%s re-added", s)
+            return
+        custom_logger.warning("%s added, warming up", s)
+        self.request_bars(s)
+
+    def request_bars(self, s:str):
+        """
+        subscribe the quote and the kline serial (sized for the windows of the contract) of a
+        contract from a task, without waiting for the data
+        """
+        window_hl, window_ma = self.windows.get(s, (self.window_hl, self.window_ma))
+        pending = {'kline' : {}, 'windows' : (window_hl, window_ma)}
+
+        async def request():
+            if s not in self.quote:
+                self.quote[s] = self.api.get_quote(s)
+            if not self.local_bars:
+                pending['kline'][s] = self.api.get_kline_serial(s, self.bar_period, max(window_hl, window_ma) + 1)
+
+        pending['task'] = self.api.create_task(request())
+        self.warming[s] = pending
+
+    def finish_warmup(self):
+        """
+        move every contract whose background subscription has been answered into trading
+        """
+        for s, pending in list(self.warming.items()):
+            if not pending['task'].done() or not startup.klines_ready(self.api, pending['kline']):
+                continue
+            quote = self.quote.get(s)
+            if quote is None or not quote.datetime:
+                continue
+            del self.warming[s]
+            window_hl, window_ma = pending['windows']
+            if s in pending['kline']:
+                self.kline[s] = pending['kline'][s]
+            if s not in self.states:
+                if s in self.symbols_old:
+                    self.symbols_old.remove(s)
+                self.init_symbol(s)
+                self.symbols.append(s)
+                if self.risk is not None:
+                    self.risk.register(s, quote.volume_multiple, quote.last_price, self.states[s]['position'], getattr(quote, 'margin', math.nan))
+            self.channels[s] = DonchianChannel(window_hl, window_ma)
             self.recalc_parameter(s)
+            # 订阅到的K线已包含当前bar
+            self.curr_kline_updated[s] = not self.local_bars
+            if self.batch is not None:
+                self.batch.add_row(s)
+                self.batch.load_row(self, s)
+            self.dispatcher.track(s)
+            custom_logger.warning("%s warmed up, windows %s", s, pending['windows'])
+
+    def remove_symbol(self, s:str):
+        """
+        stop trading a contract mid-session: it stops being dispatched, its target goes to 0 and
+        it waits in symbols_old until flat (release_flattened)
+
+        Args:
+            s (str): the contract name
+        """
+        self.warming.pop(s, None)
+        if s not in self.symbols:
+            return
+        self.symbols.remove(s)
+        self.dispatcher.untrack(s)
+        self.symbols_old.append(s)
+        custom_logger.warning("%s removed, target to 0", s)
+        if self.states[s]['position'] != 0:
+            self.set_position(s, 0)
+
+    def release_flattened(self):
+        """
+        drop every removed contract that is flat: its state, channel and executor. TqSdk has no
+        unsubscribe, the quote / kline objects are only released on our side
+        """
+        for s in list(self.symbols_old):
+            position = self.existing_positions.get(s)
+            if (position is not None and position.pos != 0) or (s in self.states and self.states[s]['position'] != 0):
+                continue
+            self.symbols_old.remove(s)
+            for table in (self.states, self.channels, self.t_0trades, self.pendant_trades, self.curr_kline_updated, self.target_pos,
+                          self.quote, self.kline, self.units, self.channel_up, self.channel_down, self.ma):
+                table.pop(s, None)
+            custom_logger.warning("%s flat, released", s)
+
+    def set_windows(self, s:str, window_hl:int, window_ma:int):
+        """
+        change the D-C windows of one contract; only its channel is rebuilt. If its kline serial
+        is too short for the new windows a longer one is requested in the background and the old
+        channel keeps trading until it has arrived
+
+        Args:
+            s (str): the contract name
+            window_hl (int): D-C window
+            window_ma (int): ma window
+        """
+        self.windows[s] = (window_hl, window_ma)
+        channel = self.channels.get(s)
+        if channel is None or (channel.window_hl, channel.window_ma) == (window_hl, window_ma):
+            return
+        if not self.local_bars and len(self.kline[s]) < max(window_hl, window_ma) + 1:
+            self.request_bars(s)
+            return
+        self.channels[s] = DonchianChannel(window_hl, window_ma)
+        self.recalc_parameter(s)
+        if self.batch is not None:
+            self.batch.load_row(self, s)
+
+    def apply_config(self, config:dict):
+        """
+        apply a new configuration (see reload.ConfigWatcher): strategy parameters, per-contract
+        windows and the universe; contracts whose settings did not change are not touched
+
+        Args:
+            config (dict): any of symbols, market_cap, cost_percentage, pendant_step, window_hl,
+                window_ma, windows ({contract : {'window_hl', 'window_ma'}})
+        """
+        for key in ('market_cap', 'cost_percentage', 'pendant_step'):
+            if key in config and config[key] != getattr(self, key):
+                custom_logger.warning("%s: %s -> %s", key, getattr(self, key), config[key])
+                setattr(self, key, config[key])
+                if self.batch is not None:
+                    setattr(self.batch, key, config[key])
+        self.window_hl = config.get('window_hl', self.window_hl)
+        self.window_ma = config.get('window_ma', self.window_ma)
+        windows = {s : (w.get('window_hl', self.window_hl), w.get('window_ma', self.window_ma)) for s, w in config.get('windows', {}).items()}
+        for s in list(self.windows):
+            if s not in windows:
+                del self.windows[s]
+        self.windows.update(windows)
+        if 'symbols' in config:
+            selected = list(dict.fromkeys(config['symbols']))
+            keep = set(selected)
+            for s in [s for s in self.symbols if s not in keep]:
+                self.remove_symbol(s)
+            for s in selected:
+                self.add_symbol(s)
+        for s in self.symbols:
+            self.set_windows(s, *self.windows.get(s, (self.window_hl, self.window_ma)))
+
+    def check_open_close(self, interday_restore = False):
+        """
+        trading strategy
+        """
+        # initialize autosave reference time
+        last_save_time = datetime.datetime.now()
+
+        self.prepare_trading()
         
         while True:
             # Main loop, guarded by the wait_update function from api
@@ -210,111 +863,21 @@ class DonMA(object):
                     last_save_time = curr_time
                     custom_logger.warning("save curr dict to json")
                     self.save_to_json()
-            self.api.wait_update()
-            for s in self.symbols:
-                if self.api.is_changing(self.kline[s].iloc[-1], 'datetime') :
-                    custom_logger.warning(s + " calculated")
-                    self.t_0trades[s] = False
-                    self.pendant_trades[s] = False
-                    self.curr_kline_updated[s] = True
-                    self.recalc_parameter(s)
-                if self.api.is_changing(self.quote[s], 'last_price'):
-                    if not interday_restore:
-                        if self.curr_kline_updated[s] == False:
-                            custom_logger.warning(s + 'skipped due to lack of updated kline')
-                            # Skip tick without previou day's daily k-line
-                            continue 
-                    curr_price = self.quote[s].last_price
-                    curr_time = self.quote[s].datetime
-                    if math.isnan(curr_price):
-                        continue
-                    self.update_holding_extremes(s, curr_price)
-                    if self.states[s]['position'] == 0 and not self.t_0trades[s]:
-                        #当前无仓位，考虑是否开仓
-                        if curr_price == self.ma[s]:
-                            op_quantity = self.market_cap/(self.quote[s].last_price * self.units[s])
-                        else:
-                            op_quantity = min([(self.market_cap * self.cost_percentage)/(abs(curr_price - self.ma[s])* self.units[s]), self.market_cap/(self.quote[s].last_price * self.units[s])])
-                        if math.isnan(op_quantity):
-                            op_quantity = 0
-                        op_quantity = int(op_quantity)
-                        if  curr_price >= self.channel_up[s]:
-                            # 达到开多仓条件
-                            if op_quantity == 0:
-                                op_quantity = 1
-                            custom_logger.warning("@ "+curr_time)
-                            custom_logger.warning("curr_price>upper_band (hold long): %d hand" % op_quantity)
-                            custom_logger.warning(" %s curr price: %f" % (s, curr_price))
-                            self.set_position(s,op_quantity)
-                            self.t_0trades[s] = True
-                        elif  curr_price <= self.channel_down[s]:
-                            # 达到开空仓条件
-                            op_quantity = op_quantity * -1
-                            if op_quantity == 0:
-                                op_quantity = -1
-                            custom_logger.warning("@ "+curr_time)
-                            custom_logger.warning("curr_price<upper_band(hold short): %d hand" % op_quantity)
-                            custom_logger.warning(" %s curr price: %f" % (s, curr_price))
-                            self.set_position(s,op_quantity)
-                            self.t_0trades[s] = True
-                    elif self.states[s]['position'] != 0:
-                        # 考虑是否平仓
-                        if self.states[s]['position'] > 0:
-                            # 考虑多仓
-                            open_cost = self.states[s]['last_price']
-                            max_profit = self.states[s]['extreme_since_entry'] / open_cost - 1
-                            
-                            actual_ma = max([self.ma[s],self.states[s]['open_ma']])
-                            if max_profit > 0 and not self.t_0trades[s]:
-                                pendant_temp_coef = 1 - (self.states[s]['pendant_coef']*0.001/max_profit)
-                                pendant_boundary = self.states[s]['extreme_since_entry'] * pendant_temp_coef
-                                if curr_price <= pendant_boundary and not curr_price <= actual_ma:
-                                    
-                                    if pendant_boundary > actual_ma:
-                                        if (self.states[s]['position'] >=3) and not self.pendant_trades[s]:
-                                            custom_logger.warning("@ "+curr_time)
-                                            custom_logger.warning(s + 'open cost(theory)' + str(open_cost))
-                                            custom_logger.warning(s + 'max profit(theory)' + str(max_profit))
-                                            custom_logger.warning(s + 'pendant line(theory)' + str(pendant_boundary))
-                                            custom_logger.warning(" %s curr price: %f" % (s, curr_price))
-                                            custom_logger.warning('pos change: {}, {}'.format(self.states[s]['position'], self.states[s]['position'] - (int(self.states[s]['position']/3))))
-                                            self.set_position(s,self.states[s]['position'] - (int(self.states[s]['position']/3)),True)
-                                            self.pendant_trades[s] = True
-                                            
-                            if curr_price <= actual_ma and not self.t_0trades[s]:
-                                custom_logger.warning("@ "+curr_time)
-                                custom_logger.warning(s + 'open cost:' + str(open_cost))
-                                custom_logger.warning(s + 'actual ma: ' + str(actual_ma))
-                                custom_logger.warning(s + 'curr price:' + str(curr_price))
-                                self.set_position(s,0)
-                                self.t_0trades[s] = True
-                        else:
-                            #考虑空仓
-                            open_cost = self.states[s]['last_price']
-                            max_profit = open_cost / self.states[s]['extreme_since_entry']  - 1
-                            actual_ma = min([self.ma[s],self.states[s]['open_ma']])
-                            if max_profit > 0 and not self.t_0trades[s]:
-                                pendant_temp_coef = 1 + (self.states[s]['pendant_coef']*0.001/max_profit)
-                                pendant_boundary = self.states[s]['extreme_since_entry'] * pendant_temp_coef
-                                if curr_price >= pendant_boundary and not curr_price >= actual_ma:
-                                    if pendant_boundary < actual_ma:
-                                        if (abs(self.states[s]['position']) >=3) and not self.pendant_trades[s]:
-                                            custom_logger.warning("@ "+curr_time)
-                                            custom_logger.warning(s + 'open cost(theory)' + str(open_cost))
-                                            custom_logger.warning(s + 'max profit(theory)' + str(max_profit))
-                                            custom_logger.warning(s + 'pendant line(theory)' + str(pendant_boundary))
-                                            custom_logger.warning('pos change: {}, {}'.format(self.states[s]['position'], self.states[s]['position'] - (int(self.states[s]['position']/3))))
-                                            custom_logger.warning(" %s curr price: %f" % (s, curr_price))
-                                            self.set_position(s,self.states[s]['position'] - (int(self.states[s]['position']/3)), True)
-                                            self.pendant_trades[s] = True
-                                            
-                            if curr_price >= actual_ma and not self.t_0trades[s]:
-                                custom_logger.warning("@ "+curr_time)
-                                custom_logger.warning(s + 'open cost:' + str(open_cost))
-                                custom_logger.warning(s + 'actual ma: ' + str(actual_ma))
-                                custom_logger.warning(s + 'curr price:' + str(curr_price))
-                                self.set_position(s,0)
-                                self.t_0trades[s] = True
+                    if self.profiler is not None:
+                        custom_logger.warning("latency (us): %s", self.profiler.summary())
+                    if self.recorder is not None:
+                        self.recorder.flush_async()
+                    if self.executor is not None:
+                        custom_logger.warning("execution: %s", self.executor.summary())
+                    if self.risk is not None:
+                        custom_logger.warning("risk: %s", self.risk.summary())
+            if self.profiler is not None:
+                wait_start = time.perf_counter()
+                self.api.wait_update()
+                self.profiler.add('wait', time.perf_counter() - wait_start)
+            else:
+                self.api.wait_update()
+            self.on_update(interday_restore)
             if self.debug:
                 # Exit all pos immediatly afterward in debug mode
                 for s in self.symbols:
@@ -322,6 +885,8 @@ class DonMA(object):
                         self.set_position(s,0)
                         while True:
                             self.api.wait_update()
+                            if self.executor is not None:
+                                self.executor.step()
                             if self.existing_positions[s].pos == 0:
                                 return
     def run_strategy(self, interday_restore = False):
@@ -333,17 +898,22 @@ class DonMA(object):
 
    
 if __name__ == "__main__":
-        
+
+    # logger system setup: records are queued on the tick thread, formatted and written in batches by a background writer
+    custom_logger, log_writer = tradelog.setup("custom_logger", 'trade-related.log', mode='a')
+
     # 手动写入今日活跃合约们 / 自动获取
     lst_of_contracts = helper.get_symbols()
     # lst_of_contracts = ['CZCE.AP010']
-    donma = DonMA(lst_of_contracts, market_cap = 1e6 , backtest = False, debug=False, kq = None)
+    checkpoint = Checkpoint('donma_state.json')
+    bar_cache = BarCache('bar_cache.json')
+    recorder = TickRecorder('ticks')
+    executor = OrderExecutor(chase_ms = 500, exit_chase_ms = 0, max_child = 10)
+    risk = RiskEngine(max_gross = 2e7, max_net = 1e7, max_margin_ratio = 0.6, max_orders_per_minute = 60, alert_hands = 100)
+    donma = DonMA(lst_of_contracts, market_cap = 1e6 , backtest = False, debug=False, kq = None, checkpoint = checkpoint, profiler = Profiler(), bar_cache = bar_cache, recorder = recorder, executor = executor, risk = risk, reloader = ConfigWatcher('donma_config.json'))
     
-    try:
-        custom_logger.warning('start loading json')
-        donma.load_from_json(json.load(open('donma_state.json', 'r')), interday_restore = False)
-    except FileNotFoundError:
-        pass
+    custom_logger.warning('start loading json')
+    donma.load_from_json(checkpoint.restore(), interday_restore = False)
 
     custom_logger.warning("strategy started")
 
@@ -353,14 +923,32 @@ if __name__ == "__main__":
     for i in donma.symbols_old:
         custom_logger.warning("curr inactive: %s " % (i))
 
+    # 协程模式（AsyncRunner，每个品种一个协程）在 bench_runner.py 的合成行情上延迟高于主循环，默认仍用主循环
+    use_async_runner = False
+    runner = AsyncRunner(donma, save_interval = 600, metrics_interval = 600) if use_async_runner else None
     try:
-        donma.run_strategy(interday_restore = False)
+        if runner is not None:
+            runner.run()
+        else:
+            donma.run_strategy(interday_restore = False)
     finally:
         for i in donma.existing_positions:
             custom_logger.critical(helper.pprint_positions(donma.existing_positions[i]))
         custom_logger.warning('------------------------------')
         for i in donma.trades:
             custom_logger.critical(helper.pprint_trades(donma.trades[i]))
+        bar_cache.save(donma.kline)
+        recorder.close()
         donma.api.close()
         donma.save_to_json()
+        checkpoint.close()
+        if runner is not None:
+            # 协程模式下不经过 dispatcher.dispatch，唤醒统计在 runner 中
+            custom_logger.warning("runner: %s", runner.stats())
+        else:
+            custom_logger.warning("dispatch stats: %s", donma.dispatcher.stats())
+        custom_logger.warning("latency (us): %s", donma.profiler.summary())
+        custom_logger.warning("execution: %s", executor.summary())
+        custom_logger.warning("risk: %s", risk.summary())
+        log_writer.stop()
         
\ No newline at end of file
@@ -0,0 +1,141 @@
+import math
+import time
+
+from bars import tick_ns
+
+SUB_BUCKETS = 8 # 每个2倍区间的细分桶数，分辨率约9%
+MAX_BUCKETS = SUB_BUCKETS * 40 # 覆盖到约 2^40 微秒
+_CST_NS = 8 * 3600 * 10**9 # 北京时间相对UTC的偏移
+
+
+class LatencyHistogram(object):
+    """
+    Log-bucketed latency histogram in microseconds: add() is one log2 and one list increment,
+    percentiles are read back with ~9% resolution, count / max / sum are exact
+    """
+    def __init__(self):
+        self.buckets = [0] * MAX_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, us:float):
+        """
+        record one sample
+
+        Args:
+            us (float): latency in microseconds (negative values count as 0)
+        """
+        if us < 0:
+            us = 0.0
+        i = int(math.log2(us + 1) * SUB_BUCKETS)
+        self.buckets[i if i < MAX_BUCKETS else MAX_BUCKETS - 1] += 1
+        self.count += 1
+        self.total += us
+        if us > self.max:
+            self.max = us
+
+    def percentile(self, p:float):
+        """
+        Args:
+            p (float): percentile in [0, 100]
+
+        Returns:
+            result (float): upper edge of the bucket holding the percentile, in microseconds
+        """
+        if self.count == 0:
+            return math.nan
+        rank = math.ceil(self.count * p / 100.0)
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(2 ** ((i + 1) / SUB_BUCKETS) - 1, self.max)
+        return self.max
+
+    def summary(self):
+        """
+        Returns:
+            result (dict): n, mean, p50, p99, max (microseconds)
+        """
+        mean = self.total / self.count if self.count else math.nan
+        return {'n' : self.count, 'mean' : round(mean, 1), 'p50' : round(self.percentile(50), 1),
+                'p99' : round(self.percentile(99), 1), 'max' : round(self.max, 1)}
+
+
+class Profiler(object):
+    """
+    Stage timings of the strategy loop, one LatencyHistogram per stage:
+        wait            time blocked in api.wait_update
+        evaluate        per-contract tick evaluation (on_tick)
+        evaluate_batch  one vectorized evaluation (on_ticks_batch)
+        recalc          recalc_parameter
+        signal_to_order start of the tick evaluation -> set_target_volume returned
+        tick_to_order   quote.datetime -> set_target_volume returned (wall clock, includes feed delay)
+        order_to_fill   set_target_volume -> first trade of the contract (trade_date_time)
+    """
+    def __init__(self):
+        self.stages = {}
+        self.pending_orders = {} # 品种 -> 下单时间 (epoch 纳秒)
+        self.seen_trades = set()
+
+    def add(self, stage:str, seconds:float):
+        """
+        record one sample of a stage
+
+        Args:
+            stage (str): stage name
+            seconds (float): duration in seconds
+        """
+        hist = self.stages.get(stage)
+        if hist is None:
+            hist = self.stages[stage] = LatencyHistogram()
+        hist.add(seconds * 1e6)
+
+    def on_order(self, symbol:str, tick_time:str, eval_start = None):
+        """
+        an order has just been handed to the executor
+
+        Args:
+            symbol (str): contract name
+            tick_time (str): quote.datetime of the tick that triggered it
+            eval_start (float, optional): perf_counter at the start of the tick evaluation
+        """
+        now = time.time_ns()
+        if eval_start is not None:
+            self.add('signal_to_order', time.perf_counter() - eval_start)
+        if tick_time:
+            try:
+                # 行情时间为交易所（北京）时间，与本机时区无关
+                self.add('tick_to_order', (now - (tick_ns(tick_time) - _CST_NS)) / 1e9)
+            except ValueError:
+                pass
+        self.pending_orders[symbol] = now
+
+    def on_trades(self, trades):
+        """
+        match new trades with the pending orders, the first fill of a contract closes its order_to_fill sample
+
+        Args:
+            trades (dict): tqsdk trade dict (api.get_trade())
+        """
+        if len(trades) == len(self.seen_trades):
+            return
+        for trade_id in list(trades):
+            if trade_id in self.seen_trades:
+                continue
+            self.seen_trades.add(trade_id)
+            trade = trades[trade_id]
+            symbol = trade.instrument_id
+            if '.' not in symbol:
+                symbol = trade.exchange_id + '.' + symbol
+            sent = self.pending_orders.pop(symbol, None)
+            if sent is not None:
+                self.add('order_to_fill', (trade.trade_date_time - sent) / 1e9)
+
+    def summary(self):
+        """
+        Returns:
+            result (dict): stage -> LatencyHistogram.summary()
+        """
+        return {stage : hist.summary() for stage, hist in sorted(self.stages.items())}
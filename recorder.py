@@ -0,0 +1,216 @@
+import concurrent.futures
+import logging
+import os
+
+import numpy as np
+
+QUOTE_FIELDS = ('last_price', 'bid_price1', 'ask_price1', 'bid_volume1', 'ask_volume1', 'volume')
+KLINE_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def _append(path:str, values:np.ndarray):
+    with open(path, 'ab') as f:
+        values.tofile(f)
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logging.getLogger("custom_logger").error("tick recorder write failed: %r", future.exception())
+
+
+class TickRecorder(object):
+    """
+    Appends ticks and closed bars to fixed-width binary column files, one directory per contract:
+        <root>/<symbol>/tick/datetime.i8   (quote.datetime as int64 nanoseconds, exchange local time)
+        <root>/<symbol>/tick/<field>.f8    (QUOTE_FIELDS, float64)
+        <root>/<symbol>/kline_<seconds>/datetime.i8, <field>.f8
+    record_* only appends a tuple to an in-memory buffer. Buffers are handed to a single writer
+    thread (flush_async, by the periodic save or once `flush_rows` rows are buffered) that
+    converts each one to arrays and writes every column with one call, so no file is touched on
+    the tick path; flush() waits for the writes (exit)
+
+    Args:
+        root (str, optional): store directory. Defaults to 'ticks'
+        flush_rows (int, optional): buffered rows that trigger a flush. Defaults to 100000
+    """
+    def __init__(self, root = 'ticks', flush_rows = 100000):
+        self.root = root
+        self.flush_rows = flush_rows
+        self.ticks = {} # 品种 -> [(datetime str, 字段...)]
+        self.bars = {} # (品种, 周期) -> [(datetime ns, 字段...)]
+        self.buffered = 0
+        self.writer = None # 写文件线程（首次flush时创建）
+
+    def record_quotes(self, symbols:list, quotes:dict):
+        """
+        buffer the current quote of every given contract
+
+        Args:
+            symbols (list): contracts whose quote changed
+            quotes (dict): contract -> quote
+        """
+        for s in symbols:
+            q = quotes[s]
+            buf = self.ticks.get(s)
+            if buf is None:
+                buf = self.ticks[s] = []
+            buf.append((q.datetime,) + tuple(getattr(q, f, np.nan) for f in QUOTE_FIELDS))
+        self.buffered += len(symbols)
+        if self.buffered >= self.flush_rows:
+            self.flush_async()
+
+    def record_bar(self, s:str, kline, duration_seconds = 86400):
+        """
+        buffer the last closed bar (second to last row) of a kline serial
+
+        Args:
+            s (str): contract name
+            kline (pandas.DataFrame): tqsdk kline serial (or a dict of arrays, e.g. BarAggregator.kline)
+            duration_seconds (int, optional): kline period. Defaults to 86400
+        """
+        dts = np.asarray(kline['datetime'])
+        if len(dts) < 2:
+            return
+        row = (int(dts[-2]),) + tuple(float(np.asarray(kline[f])[-2]) for f in KLINE_FIELDS)
+        self.bars.setdefault((s, duration_seconds), []).append(row)
+        self.buffered += 1
+
+    def flush_async(self):
+        """
+        hand every buffered row to the writer thread (writes stay in order)
+
+        Returns:
+            result (concurrent.futures.Future): done once the rows are on disk
+        """
+        if self.writer is None:
+            self.writer = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='recorder')
+        future = self.writer.submit(self.write, *self.detach())
+        future.add_done_callback(_log_failure)
+        return future
+
+    def flush(self):
+        """
+        write every buffered row to the column files, waiting for the writes already handed to
+        the writer thread
+        """
+        self.flush_async().result()
+
+    def close(self):
+        """
+        flush and stop the writer thread
+        """
+        self.flush()
+        self.writer.shutdown(wait=True)
+        self.writer = None
+
+    def detach(self):
+        """
+        take the buffered rows out of the recorder, so they can be written (write) from another
+        thread while new rows keep being buffered
+
+        Returns:
+            result (tuple): (ticks, bars) buffers
+        """
+        ticks, bars = self.ticks, self.bars
+        self.ticks = {}
+        self.bars = {}
+        self.buffered = 0
+        return ticks, bars
+
+    def write(self, ticks:dict, bars:dict):
+        """
+        append detached rows to the column files
+
+        Args:
+            ticks (dict): contract -> tick rows
+            bars (dict): (contract, period) -> bar rows
+        """
+        for s, rows in ticks.items():
+            if not rows:
+                continue
+            directory = os.path.join(self.root, s, 'tick')
+            os.makedirs(directory, exist_ok=True)
+            columns = list(zip(*rows))
+            _append(os.path.join(directory, 'datetime.i8'), np.array(columns[0], dtype='datetime64[ns]').view(np.int64))
+            for f, values in zip(QUOTE_FIELDS, columns[1:]):
+                _append(os.path.join(directory, f + '.f8'), np.array(values, dtype=np.float64))
+            rows.clear()
+        for (s, duration_seconds), rows in bars.items():
+            if not rows:
+                continue
+            directory = os.path.join(self.root, s, 'kline_%d' % duration_seconds)
+            os.makedirs(directory, exist_ok=True)
+            columns = list(zip(*rows))
+            _append(os.path.join(directory, 'datetime.i8'), np.array(columns[0], dtype=np.int64))
+            for f, values in zip(KLINE_FIELDS, columns[1:]):
+                _append(os.path.join(directory, f + '.f8'), np.array(values, dtype=np.float64))
+            rows.clear()
+
+
+class TickStore(object):
+    """
+    Reader for a TickRecorder directory: every column is memory-mapped read-only (no copy), time
+    range queries are a binary search on the datetime column and return views
+
+    Args:
+        root (str, optional): store directory. Defaults to 'ticks'
+    """
+    def __init__(self, root = 'ticks'):
+        self.root = root
+
+    def symbols(self):
+        """
+        Returns:
+            result (list): recorded contracts
+        """
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(os.listdir(self.root))
+
+    def columns(self, s:str, table = 'tick'):
+        """
+        Args:
+            s (str): contract name
+            table (str, optional): 'tick' or 'kline_<seconds>'. Defaults to 'tick'
+
+        Returns:
+            result (dict): column name -> read-only np.memmap ('datetime' is int64 nanoseconds),
+                cut to the shortest column
+        """
+        directory = os.path.join(self.root, s, table)
+        result = {}
+        for name in sorted(os.listdir(directory)):
+            column, ext = os.path.splitext(name)
+            dtype = np.int64 if ext == '.i8' else np.float64
+            if os.path.getsize(os.path.join(directory, name)) == 0:
+                result[column] = np.zeros(0, dtype=dtype)
+            else:
+                result[column] = np.memmap(os.path.join(directory, name), dtype=dtype, mode='r')
+        # 写入中途崩溃时各列长度可能不同，以最短列为准
+        n = min((len(values) for values in result.values()), default=0)
+        return {column : values[:n] for column, values in result.items()}
+
+    def range(self, s:str, start = None, end = None, table = 'tick'):
+        """
+        rows with start <= datetime < end (datetime column is appended in time order)
+
+        Args:
+            s (str): contract name
+            start (optional): anything np.datetime64 accepts, or int nanoseconds. Defaults to the first row
+            end (optional): same, exclusive. Defaults to after the last row
+            table (str, optional): 'tick' or 'kline_<seconds>'. Defaults to 'tick'
+
+        Returns:
+            result (dict): column name -> memmap view
+        """
+        columns = self.columns(s, table)
+        dts = columns['datetime']
+        lo = 0 if start is None else int(np.searchsorted(dts, _ns(start), side='left'))
+        hi = len(dts) if end is None else int(np.searchsorted(dts, _ns(end), side='left'))
+        return {name : values[lo:hi] for name, values in columns.items()}
+
+
+def _ns(t):
+    if isinstance(t, (int, np.integer)):
+        return int(t)
+    return int(np.datetime64(t, 'ns').view(np.int64))
@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+import time
+
+
+class ConfigWatcher(object):
+    """
+    Live configuration of a running DonMA (DonMA(..., reloader=ConfigWatcher('donma_config.json'))).
+    Every `interval` seconds the file's mtime is checked; a changed file is parsed and handed to
+    DonMA.apply_config, a file that does not parse is logged and ignored (the running settings
+    stay). The file holds any of:
+        {"symbols" : ["SHFE.rb2010", ...],
+         "market_cap" : 1e6, "cost_percentage" : 1, "pendant_step" : 0.001,
+         "window_hl" : 5, "window_ma" : 5,
+         "windows" : {"SHFE.rb2010" : {"window_hl" : 10, "window_ma" : 5}}}
+    With a SymbolUniverse, "symbols" comes from it instead whenever the file has none
+
+    Only edits made while running are applied: the mtime of a file already there at startup is
+    taken as loaded, so a leftover config never replaces the universe the strategy started with
+
+    Args:
+        path (str, optional): config file. Defaults to 'donma_config.json'
+        interval (float, optional): seconds between two checks. Defaults to 5
+        universe (SymbolUniverse, optional): universe source polled with the file. Defaults to None
+    """
+    def __init__(self, path = 'donma_config.json', interval = 5.0, universe = None):
+        self.path = path
+        self.interval = interval
+        self.universe = universe
+        self.next_check = 0.0
+        self.mtime = self._mtime() # 上次加载的文件修改时间（启动时已存在的文件视为已加载）
+        self.config = {} # 最近一次有效配置
+        self.symbols = None # 最近一次下发的品种池
+
+    def due(self):
+        """
+        Returns:
+            result (bool): whether a check is due (cheap, call on every wakeup)
+        """
+        now = time.monotonic()
+        if now < self.next_check:
+            return False
+        self.next_check = now + self.interval
+        return True
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _read(self):
+        mtime = self._mtime()
+        if mtime is None or mtime == self.mtime:
+            return None
+        self.mtime = mtime
+        try:
+            with open(self.path, 'r') as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.getLogger("custom_logger").error("config %s not loaded: %s", self.path, e)
+            return None
+        if not isinstance(config, dict):
+            logging.getLogger("custom_logger").error("config %s not loaded: not an object", self.path)
+            return None
+        return config
+
+    def poll(self):
+        """
+        Returns:
+            result (dict): the new configuration if the file (or the universe) changed, else None
+        """
+        config = self._read()
+        changed = config is not None
+        if changed:
+            self.config = config
+        config = dict(self.config)
+        if 'symbols' not in config and self.universe is not None:
+            config['symbols'] = self.universe.get()
+        symbols = config.get('symbols')
+        if symbols is not None and symbols != self.symbols:
+            self.symbols = list(symbols)
+            changed = True
+        return config if changed else None
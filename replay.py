@@ -0,0 +1,361 @@
+import argparse
+import itertools
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import main
+
+KLINE_COLUMNS = ['datetime', 'open', 'high', 'low', 'close', 'volume']
+
+
+class ReplayFinished(Exception):
+    """
+    raised by ReplayApi.wait_update once every recorded tick has been fed (like tqsdk's BacktestFinished)
+    """
+
+
+class ReplayObject(object):
+    """
+    attribute + item access record, standing in for tqsdk's Quote/Position/Trade/Account entities
+    """
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __getitem__(self, key):
+        return self.__dict__[key]
+
+    def __setitem__(self, key, value):
+        self.__dict__[key] = value
+
+
+class ReplayTargetPosTask(object):
+    """
+    TargetPosTask stand-in: the target is filled in one go at the next tick of the contract
+    (last price, adverse by `slippage` as a fraction of the price)
+    """
+    def __init__(self, api, symbol:str, **kwargs):
+        self.api = api
+        self.symbol = symbol
+        api._target_tasks[symbol] = self
+
+    def set_target_volume(self, volume):
+        self.api._pending[self.symbol] = int(volume)
+
+
+class ReplayApi(object):
+    """
+    Offline stand-in for TqApi: replays recorded daily klines and ticks, one tick timestamp per
+    wait_update, so DonMA runs its usual open/close/pendant logic without the TQ service
+
+    Args:
+        ticks (pandas.DataFrame): columns datetime, symbol, last_price
+        klines (pandas.DataFrame): columns datetime, symbol, open, high, low, close (volume optional).
+            A tick belongs to the latest bar whose datetime is not after the tick
+        units (dict, optional): volume_multiple per contract. Defaults to 1
+        slippage (float, optional): fill price slippage as a fraction of the price. Defaults to 0
+        commission (float, optional): cost per hand traded. Defaults to 0
+    """
+    def __init__(self, ticks:pd.DataFrame, klines:pd.DataFrame, units = None, slippage = 0.0, commission = 0.0):
+        units = units or {}
+        self.slippage = slippage
+        self.commission = commission
+        ticks = ticks.copy()
+        ticks['datetime'] = _to_ns(ticks['datetime'])
+        ticks = ticks.sort_values('datetime', kind='stable')
+        klines = klines.copy()
+        klines['datetime'] = _to_ns(klines['datetime'])
+        if 'volume' not in klines:
+            klines['volume'] = 0
+
+        self.symbols = list(dict.fromkeys(ticks['symbol'].tolist()))
+        self._bars = {} # 品种 -> 全部日线 open/high/low/close/volume (按时间排序)
+        self._bar_dt = {} # 品种 -> 全部日线时间
+        for s, frame in klines.groupby('symbol'):
+            frame = frame.sort_values('datetime')
+            self._bar_dt[s] = frame['datetime'].to_numpy(dtype=np.int64)
+            self._bars[s] = frame[KLINE_COLUMNS[1:]].to_numpy(dtype=np.float64)
+
+        # 按时间戳分组的tick
+        tick_dt = ticks['datetime'].to_numpy(dtype=np.int64)
+        self._tick_dt = tick_dt
+        self._tick_symbol = ticks['symbol'].to_numpy()
+        self._tick_price = ticks['last_price'].to_numpy(dtype=np.float64)
+        self._bounds = np.flatnonzero(np.diff(tick_dt)) + 1
+        self._bounds = np.concatenate([[0], self._bounds, [len(tick_dt)]]).astype(np.int64)
+        self._group = 0
+
+        self._quotes = {s : ReplayObject(instrument_id=s, last_price=math.nan, datetime='', volume_multiple=units.get(s, 1)) for s in self.symbols}
+        self._positions = {s : ReplayObject(instrument_id=s, pos=0, pos_long=0, pos_short=0, open_price_long=math.nan, open_price_short=math.nan) for s in self.symbols}
+        self._klines = {} # 品种 -> kline serial (原地更新)
+        self._kline_day = {} # 品种 -> 当前bar序号
+        self._trades = {}
+        self._account = ReplayObject(balance=0.0, available=0.0, margin=0.0, close_profit=0.0, commission=0.0)
+        self._target_tasks = {}
+        self._pending = {} # 品种 -> 待成交目标仓位
+        self._changed_quotes = set()
+        self._changed_klines = set()
+        self._sync_diffs = [] # 与tqsdk相同格式的本次更新diff，供ChangeDispatcher使用
+        self._first_update = True
+
+        # 成交统计
+        self.realized = {s : 0.0 for s in self.symbols}
+        self.avg_cost = {s : 0.0 for s in self.symbols}
+        self.trade_count = 0
+        self.volume = 0
+        self.commission_paid = 0.0
+        self.max_drawdown = 0.0
+        self._peak = 0.0
+
+        # 行情停在第一组tick之前，kline窗口对齐到第一组tick所在的bar
+        self._start_dt = int(tick_dt[0]) if len(tick_dt) else 0
+
+    def get_quote(self, symbol:str):
+        return self._quotes[symbol]
+
+    def get_position(self, symbol = None):
+        if symbol is not None:
+            return self._positions[symbol]
+        return self._positions
+
+    def get_trade(self):
+        return self._trades
+
+    def get_account(self):
+        return self._account
+
+    def get_kline_serial(self, symbol:str, duration_seconds:int, data_length = 200):
+        kline = pd.DataFrame({c : np.zeros(data_length) for c in KLINE_COLUMNS})
+        kline['symbol'] = symbol
+        kline['duration'] = duration_seconds
+        self._klines[symbol] = kline
+        self._kline_day[symbol] = None
+        self._roll_kline(symbol, self._start_dt, math.nan)
+        return kline
+
+    def is_changing(self, obj, key = None):
+        if isinstance(obj, pd.Series):
+            return obj['symbol'] in self._changed_klines
+        return obj.instrument_id in self._changed_quotes
+
+    def close(self):
+        pass
+
+    def wait_update(self):
+        """
+        feed the next tick timestamp: fills pending targets, rolls the kline serial of contracts
+        entering a new bar and updates the quotes
+        """
+        self._changed_quotes.clear()
+        self._changed_klines.clear()
+        if self._first_update:
+            # 与tqsdk一致，首次更新时所有订阅数据都视为变化
+            self._changed_klines.update(self._klines)
+            self._first_update = False
+        if self._group >= len(self._bounds) - 1:
+            raise ReplayFinished()
+        start, end = self._bounds[self._group], self._bounds[self._group + 1]
+        self._group += 1
+        dt = int(self._tick_dt[start])
+        curr_time = pd.Timestamp(dt).strftime('%Y-%m-%d %H:%M:%S.%f')
+        for k in range(start, end):
+            s = self._tick_symbol[k]
+            price = self._tick_price[k]
+            quote = self._quotes[s]
+            if s in self._klines and self._roll_kline(s, dt, price):
+                self._changed_klines.add(s)
+            if price != quote.last_price:
+                self._changed_quotes.add(s)
+            quote.last_price = price
+            quote.datetime = curr_time
+            if s in self._pending:
+                self._fill(s, self._pending.pop(s), price, dt)
+        self._sync_diffs = [{'quotes' : {s : {'last_price' : self._quotes[s].last_price} for s in self._changed_quotes},
+                             'klines' : {s : {} for s in self._changed_klines}}]
+        self._mark()
+
+    def _roll_kline(self, s:str, dt:int, price:float):
+        """
+        move the kline window of one contract to the bar containing dt
+
+        Returns:
+            result (bool): whether a new bar started
+        """
+        bars = self._bars.get(s)
+        if bars is None:
+            return False
+        day = int(np.searchsorted(self._bar_dt[s], dt, side='right')) - 1
+        if day == self._kline_day[s]:
+            return False
+        self._kline_day[s] = day
+        kline = self._klines[s]
+        n = len(kline)
+        dts = np.zeros(n, dtype=np.int64)
+        window = np.full((n, len(KLINE_COLUMNS) - 1), math.nan)
+        first = max(day - n + 1, 0) # 已收盘的bar
+        closed = max(day, 0) - first
+        if closed:
+            dts[n - 1 - closed:n - 1] = self._bar_dt[s][first:first + closed]
+            window[n - 1 - closed:n - 1] = bars[first:first + closed]
+        if day >= 0:
+            # 正在形成的bar，只有时间有意义
+            dts[n - 1] = self._bar_dt[s][day]
+            window[n - 1] = [price, price, price, price, 0]
+        kline['datetime'] = dts
+        for j, c in enumerate(KLINE_COLUMNS[1:]):
+            kline[c] = window[:, j]
+        return True
+
+    def _fill(self, s:str, target:int, price:float, dt:int):
+        """
+        trade the contract to the target volume at the given tick price
+        """
+        position = self._positions[s]
+        delta = target - position.pos
+        if delta == 0:
+            return
+        unit = self._quotes[s].volume_multiple
+        fill_price = price * (1 + self.slippage if delta > 0 else 1 - self.slippage)
+        prev = position.pos
+        # 先平后开
+        closing = min(abs(delta), abs(prev)) if prev * delta < 0 else 0
+        if closing:
+            direction = 1 if prev > 0 else -1
+            self.realized[s] += direction * closing * (fill_price - self.avg_cost[s]) * unit
+        opening = abs(delta) - closing
+        if opening:
+            new_abs = abs(prev) - closing + opening
+            held = abs(prev) - closing
+            self.avg_cost[s] = (self.avg_cost[s] * held + fill_price * opening) / new_abs
+        position.pos = target
+        position.pos_long = max(target, 0)
+        position.pos_short = max(-target, 0)
+        position.open_price_long = self.avg_cost[s] if target > 0 else math.nan
+        position.open_price_short = self.avg_cost[s] if target < 0 else math.nan
+        fee = abs(delta) * self.commission
+        self.commission_paid += fee
+        self.trade_count += 1
+        self.volume += abs(delta)
+        trade_id = str(len(self._trades))
+        self._trades[trade_id] = ReplayObject(instrument_id=s, direction='BUY' if delta > 0 else 'SELL', offset='CLOSE' if closing else 'OPEN',
+                                              price=fill_price, volume=abs(delta), trade_date_time=dt)
+
+    def pnl(self):
+        """
+        realized + mark-to-market pnl, net of commission
+        """
+        total = sum(self.realized.values()) - self.commission_paid
+        for s, position in self._positions.items():
+            if position.pos != 0:
+                total += position.pos * (self._quotes[s].last_price - self.avg_cost[s]) * self._quotes[s].volume_multiple
+        return total
+
+    def _mark(self):
+        equity = self.pnl()
+        self._peak = max(self._peak, equity)
+        self.max_drawdown = max(self.max_drawdown, self._peak - equity)
+
+
+def _to_ns(column):
+    """
+    datetime column (strings, datetimes or epoch nanoseconds) to int64 nanoseconds
+    """
+    if pd.api.types.is_integer_dtype(column):
+        return column.astype(np.int64)
+    return pd.to_datetime(column).astype('datetime64[ns]').astype(np.int64)
+
+
+def load_frame(path:str):
+    """
+    read a CSV or Parquet recording
+
+    Args:
+        path (str): file path, .parquet/.pq is read as Parquet, anything else as CSV
+
+    Returns:
+        pandas.DataFrame: the recording
+    """
+    if path.endswith('.parquet') or path.endswith('.pq'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def run_replay(params:dict, ticks:pd.DataFrame, klines:pd.DataFrame, units = None, slippage = 0.0, commission = 0.0, quiet = True):
+    """
+    replay one parameter set through DonMA
+
+    Args:
+        params (dict): DonMA keyword arguments (window_ma, window_hl, cost_percentage, pendant_step, market_cap ...)
+        ticks (pandas.DataFrame): recorded ticks
+        klines (pandas.DataFrame): recorded daily klines
+        units (dict, optional): volume_multiple per contract
+        slippage (float, optional): fill slippage as a fraction of price
+        commission (float, optional): cost per hand traded
+        quiet (bool, optional): silence the trade logger. Defaults to True
+
+    Returns:
+        result (dict): params plus pnl, trades, volume, max_drawdown
+    """
+    main.custom_logger.disabled = quiet
+    api = ReplayApi(ticks, klines, units, slippage, commission)
+    donma = main.DonMA(api.symbols, backtest=False, kq=api, target_pos_cls=ReplayTargetPosTask, **params)
+    donma.prepare_trading()
+    try:
+        while True:
+            api.wait_update()
+            donma.on_update()
+    except ReplayFinished:
+        pass
+    result = dict(params)
+    result.update({'pnl' : api.pnl(), 'trades' : api.trade_count, 'volume' : api.volume, 'max_drawdown' : api.max_drawdown})
+    return result
+
+
+def sweep(grid:dict, ticks:pd.DataFrame, klines:pd.DataFrame, units = None, slippage = 0.0, commission = 0.0, max_workers = None):
+    """
+    run every combination of a parameter grid in parallel
+
+    Args:
+        grid (dict): DonMA keyword -> list of values, e.g. {'window_ma' : [5, 10], 'window_hl' : [5, 20]}
+        ticks (pandas.DataFrame): recorded ticks
+        klines (pandas.DataFrame): recorded daily klines
+        units (dict, optional): volume_multiple per contract
+        slippage (float, optional): fill slippage as a fraction of price
+        commission (float, optional): cost per hand traded
+        max_workers (int, optional): process count, defaults to the cpu count
+
+    Returns:
+        pandas.DataFrame: one row per run, sorted by pnl
+    """
+    keys = list(grid)
+    runs = [dict(zip(keys, values)) for values in itertools.product(*[grid[k] for k in keys])]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(run_replay, params, ticks, klines, units, slippage, commission) for params in runs]
+        results = [f.result() for f in futures]
+    return pd.DataFrame(results).sort_values('pnl', ascending=False).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='offline DonMA replay and parameter sweep')
+    parser.add_argument('ticks', help='tick recording (csv/parquet): datetime, symbol, last_price')
+    parser.add_argument('klines', help='daily kline recording (csv/parquet): datetime, symbol, open, high, low, close')
+    parser.add_argument('--window_ma', type=int, nargs='+', default=[5])
+    parser.add_argument('--window_hl', type=int, nargs='+', default=[5])
+    parser.add_argument('--cost_percentage', type=float, nargs='+', default=[1])
+    parser.add_argument('--pendant_step', type=float, nargs='+', default=[0.001])
+    parser.add_argument('--market_cap', type=float, nargs='+', default=[1e6])
+    parser.add_argument('--unit', nargs='*', default=[], help='volume_multiple per contract, e.g. CZCE.AP010=10')
+    parser.add_argument('--slippage', type=float, default=0.0)
+    parser.add_argument('--commission', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', default='replay_result.csv')
+    args = parser.parse_args()
+
+    units = {k : float(v) for k, v in (u.split('=') for u in args.unit)}
+    grid = {'window_ma' : args.window_ma, 'window_hl' : args.window_hl, 'cost_percentage' : args.cost_percentage,
+            'pendant_step' : args.pendant_step, 'market_cap' : args.market_cap}
+    table = sweep(grid, load_frame(args.ticks), load_frame(args.klines), units, args.slippage, args.commission, args.workers)
+    table.to_csv(args.out, index=False)
+    print(table.to_string())
@@ -0,0 +1,263 @@
+import collections
+import logging
+import math
+import re
+import time
+
+import tradelog
+
+# 品种代码 -> 板块，未列出的归入 'other'
+SECTORS = {
+    'cu' : 'metal', 'al' : 'metal', 'zn' : 'metal', 'pb' : 'metal', 'ni' : 'metal', 'sn' : 'metal', 'au' : 'precious', 'ag' : 'precious',
+    'rb' : 'ferrous', 'hc' : 'ferrous', 'i' : 'ferrous', 'j' : 'ferrous', 'jm' : 'ferrous', 'SF' : 'ferrous', 'SM' : 'ferrous', 'ss' : 'ferrous',
+    'sc' : 'energy', 'fu' : 'energy', 'lu' : 'energy', 'bu' : 'energy', 'pg' : 'energy', 'ZC' : 'energy',
+    'ru' : 'chemical', 'nr' : 'chemical', 'sp' : 'chemical', 'l' : 'chemical', 'pp' : 'chemical', 'v' : 'chemical', 'eg' : 'chemical', 'eb' : 'chemical',
+    'TA' : 'chemical', 'MA' : 'chemical', 'FG' : 'chemical', 'SA' : 'chemical', 'UR' : 'chemical',
+    'a' : 'agri', 'b' : 'agri', 'm' : 'agri', 'y' : 'agri', 'p' : 'agri', 'c' : 'agri', 'cs' : 'agri', 'jd' : 'agri', 'rr' : 'agri', 'lh' : 'agri',
+    'CF' : 'agri', 'CY' : 'agri', 'SR' : 'agri', 'OI' : 'agri', 'RM' : 'agri', 'AP' : 'agri', 'CJ' : 'agri', 'PK' : 'agri',
+    'IF' : 'index', 'IH' : 'index', 'IC' : 'index', 'IM' : 'index', 'T' : 'bond', 'TF' : 'bond', 'TS' : 'bond',
+}
+
+
+def sector_of(symbol:str):
+    """
+    Args:
+        symbol (str): tqsdk contract name, e.g. 'SHFE.rb2010'
+
+    Returns:
+        result (str): sector of the product, 'other' if unknown
+    """
+    product = re.match(r'[A-Za-z]*', symbol.split('.')[-1]).group(0)
+    return SECTORS.get(product, 'other')
+
+
+class RiskEngine(object):
+    """
+    Pre-trade risk checks on running aggregates. Position and price changes update gross/net
+    notional, estimated margin and per-sector gross/net by their delta, so check() is a handful
+    of float operations: a target that adds risk is shrunk to the largest size within every
+    limit (0 hands more = veto), a target that only reduces risk always passes. Orders that are
+    unusually large, vetoes/shrinks and order-rate bursts are raised as alerts (critical log,
+    at most one per kind and contract per minute)
+
+    Positions are the targets handed to the executor, so orders in flight already count
+
+    Args:
+        max_gross (float, optional): gross notional limit. Defaults to None (no limit)
+        max_net (float, optional): absolute net notional limit. Defaults to None
+        sector_limits (dict, optional): sector -> gross notional limit. Defaults to None
+        max_margin_ratio (float, optional): margin / balance limit, read from the account. Defaults to None
+        max_open_orders (int, optional): live orders (with an OrderExecutor) above which new risk is refused. Defaults to None
+        max_orders_per_minute (int, optional): orders above which new risk is refused. Defaults to None
+        alert_hands (int, optional): order size (hands) raising an alert. Defaults to 100
+        alert_notional (float, optional): order notional raising an alert. Defaults to None
+        margin_rate (float, optional): margin per notional when the quote has no margin. Defaults to 0.1
+        sectors (callable, optional): contract -> sector. Defaults to sector_of
+        clock (callable, optional): seconds, for the order rate. Defaults to time.monotonic
+        log (logging.Logger, optional): defaults to the trade logger (custom_logger)
+    """
+    def __init__(self, max_gross = None, max_net = None, sector_limits = None, max_margin_ratio = None, max_open_orders = None,
+                 max_orders_per_minute = None, alert_hands = 100, alert_notional = None, margin_rate = 0.1, sectors = sector_of,
+                 clock = time.monotonic, log = None):
+        self.max_gross = max_gross
+        self.max_net = max_net
+        self.sector_limits = sector_limits or {}
+        self.max_margin_ratio = max_margin_ratio
+        self.max_open_orders = max_open_orders
+        self.max_orders_per_minute = max_orders_per_minute
+        self.alert_hands = alert_hands
+        self.alert_notional = alert_notional
+        self.margin_rate = margin_rate
+        self.sectors = sectors
+        self.clock = clock
+        self.log = log if log is not None else logging.getLogger("custom_logger")
+        self.limiter = tradelog.RateLimiter(60)
+
+        self.pos = {} # 品种 -> 目标持仓（手）
+        self.price = {} # 品种 -> 最新价
+        self.unit = {} # 品种 -> 合约乘数
+        self.margin = {} # 品种 -> 每手保证金（交易所给出，否则为nan，按margin_rate估算）
+        self.sector = {} # 品种 -> 板块
+        self.gross = 0.0
+        self.net = 0.0
+        self.margin_used = 0.0 # 估算保证金
+        self.sector_gross = collections.defaultdict(float)
+        self.sector_net = collections.defaultdict(float)
+        self.balance = math.nan # 账户权益
+        self.account_margin = math.nan # 账户保证金
+        self.open_orders = 0 # 在途委托数（由执行器更新）
+        self.order_times = collections.deque() # 最近一分钟的下单时间
+        self.vetoes = 0
+        self.shrinks = 0
+        self.alerts = 0
+
+    def _margin_per_hand(self, s:str):
+        margin = self.margin[s]
+        return margin if not math.isnan(margin) else self.margin_rate * self.price[s] * self.unit[s]
+
+    def _apply(self, s:str, sign:int):
+        """
+        add (sign 1) or remove (sign -1) the contribution of one contract to every aggregate
+        """
+        pos = self.pos[s]
+        if pos == 0 or math.isnan(self.price[s]):
+            return
+        value = pos * self.price[s] * self.unit[s]
+        sector = self.sector[s]
+        self.gross += sign * abs(value)
+        self.net += sign * value
+        self.sector_gross[sector] += sign * abs(value)
+        self.sector_net[sector] += sign * value
+        self.margin_used += sign * abs(pos) * self._margin_per_hand(s)
+
+    def register(self, s:str, unit:float, price:float, pos = 0, margin = math.nan):
+        """
+        start tracking a contract
+
+        Args:
+            s (str): contract name
+            unit (float): volume_multiple
+            price (float): last price
+            pos (int, optional): current position. Defaults to 0
+            margin (float, optional): margin per hand. Defaults to nan (estimated)
+        """
+        if s in self.pos:
+            self._apply(s, -1)
+        self.pos[s] = pos
+        self.price[s] = price
+        self.unit[s] = unit
+        self.margin[s] = margin
+        self.sector[s] = self.sectors(s)
+        self._apply(s, 1)
+
+    def on_price(self, s:str, price:float):
+        """
+        Args:
+            s (str): contract name
+            price (float): new last price
+        """
+        if math.isnan(price) or price == self.price[s]:
+            return
+        self._apply(s, -1)
+        self.price[s] = price
+        self._apply(s, 1)
+
+    def on_quotes(self, changed:list, quotes:dict):
+        """
+        Args:
+            changed (list): contracts whose last price changed
+            quotes (dict): contract -> quote
+        """
+        for s in changed:
+            if s in self.pos:
+                self.on_price(s, quotes[s].last_price)
+
+    def on_account(self, account):
+        """
+        Args:
+            account (tqsdk Account): reads balance and margin
+        """
+        self.balance = getattr(account, 'balance', math.nan)
+        self.account_margin = getattr(account, 'margin', math.nan)
+
+    def set_position(self, s:str, pos:int):
+        """
+        Args:
+            s (str): contract name
+            pos (int): new target position
+        """
+        self._apply(s, -1)
+        self.pos[s] = pos
+        self._apply(s, 1)
+
+    def alert(self, kind:str, s:str, message:str, *args):
+        """
+        log an abnormal order / limit breach, rate limited per (kind, contract)
+        """
+        self.alerts += 1
+        suppressed = self.limiter.hit((kind, s))
+        if suppressed is not None:
+            self.log.critical("risk alert [%s] %s: " + message + " (%d suppressed)", kind, s, *(args + (suppressed,)))
+
+    def _room(self, used:float, limit:float, per_hand:float):
+        """
+        hands that fit under a limit
+        """
+        if limit is None or per_hand <= 0:
+            return math.inf
+        return max(limit - used, 0.0) / per_hand
+
+    def check(self, s:str, target:int):
+        """
+        pre-trade check of a new target
+
+        Args:
+            s (str): contract name
+            target (int): requested target position
+
+        Returns:
+            result (int): the target to trade (the current position if vetoed)
+        """
+        cur = self.pos[s]
+        change = abs(target - cur)
+        price = self.price[s]
+        value = price * self.unit[s] # 每手名义价值
+        if change >= self.alert_hands:
+            self.alert('size', s, "order of %d hands (%d -> %d)", change, cur, target)
+        if self.alert_notional is not None and change * value >= self.alert_notional:
+            self.alert('notional', s, "order notional %.0f (%d -> %d)", change * value, cur, target)
+        now = self.clock()
+        times = self.order_times
+        while times and now - times[0] >= 60:
+            times.popleft()
+
+        if target * cur >= 0 and abs(target) <= abs(cur):
+            # 只减少风险的目标总是放行
+            times.append(now)
+            return target
+        if self.max_orders_per_minute is not None and len(times) >= self.max_orders_per_minute:
+            self.vetoes += 1
+            self.alert('rate', s, "%d orders in the last minute, target %d refused", len(times), target)
+            return cur
+        if self.max_open_orders is not None and self.open_orders >= self.max_open_orders:
+            self.vetoes += 1
+            self.alert('open_orders', s, "%d orders open, target %d refused", self.open_orders, target)
+            return cur
+        if math.isnan(value):
+            return target
+
+        # room: 目标方向上允许的最大手数（当前持仓的占用先扣除）
+        side = 1 if target > 0 else -1
+        held = abs(cur) if cur * side > 0 else 0
+        sector = self.sector[s]
+        room = min(self._room(self.gross - abs(cur) * value, self.max_gross, value),
+                   self._room(self.sector_gross[sector] - abs(cur) * value, self.sector_limits.get(sector), value))
+        if self.max_net is not None:
+            room = min(room, max(self.max_net - side * (self.net - cur * value), 0.0) / value)
+        if self.max_margin_ratio is not None and self.balance > 0:
+            used = self.account_margin if not math.isnan(self.account_margin) else self.margin_used
+            per_hand = self._margin_per_hand(s)
+            room = min(room, self._room(used - abs(cur) * per_hand, self.max_margin_ratio * self.balance, per_hand))
+        allowed = min(abs(target), int(room + 1e-9))
+        if allowed >= abs(target):
+            times.append(now)
+            return target
+        if allowed <= held:
+            self.vetoes += 1
+            self.alert('veto', s, "target %d refused (room %d hands, gross %.0f, net %.0f)", target, int(room), self.gross, self.net)
+            # 反手被拒时只平仓
+            return cur if held > 0 else 0
+        self.shrinks += 1
+        self.alert('shrink', s, "target %d shrunk to %d (gross %.0f, net %.0f)", target, side * allowed, self.gross, self.net)
+        times.append(now)
+        return side * allowed
+
+    def summary(self):
+        """
+        Returns:
+            result (dict): current aggregates and counters
+        """
+        return {'gross' : round(self.gross), 'net' : round(self.net), 'margin' : round(self.margin_used),
+                'sectors' : {k : round(v) for k, v in self.sector_gross.items() if v > 0.5},
+                'open_orders' : self.open_orders, 'orders_last_minute' : len(self.order_times),
+                'vetoes' : self.vetoes, 'shrinks' : self.shrinks, 'alerts' : self.alerts}
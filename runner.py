@@ -0,0 +1,255 @@
+import asyncio
+import concurrent.futures
+import datetime
+import logging
+import time
+
+from checkpoint import atomic_dump
+
+
+class AsyncRunner(object):
+    """
+    Runs a DonMA on TqSdk tasks instead of the blocking check_open_close loop: one coroutine per
+    tracked contract (api.create_task), woken by the register_update_notify channel of its quote and
+    kline, evaluates that contract as soon as its update is applied inside wait_update. Periodic
+    jobs are separate tasks (checkpoint, recorder flush, session end, metrics) and their file I/O
+    runs in a thread pool, so a slow disk never delays a tick. The main loop only drives
+    wait_update and the per-wakeup housekeeping (DonMA.after_update), and starts / cancels the
+    contract coroutines when the universe changes
+
+    With DonMA(vectorized=True) the contract coroutines only queue their changed contract; the
+    queue is evaluated once per wakeup, after every woken coroutine has run (loop.call_soon), so
+    the batch path sees every tick of the wakeup in one call instead of one-row arrays
+
+        runner = AsyncRunner(donma)
+        runner.run()
+
+    Args:
+        donma (DonMA): the strategy, not yet prepared (run calls prepare_trading)
+        save_interval (float, optional): seconds between two checkpoints. Defaults to 600
+        flush_interval (float, optional): seconds between two recorder flushes. Defaults to 10
+        metrics_interval (float, optional): seconds between two metric logs. Defaults to 600
+        cutoff (tuple, optional): (hour, minute) the session ends at. Defaults to (14, 59)
+        interday_restore (bool, optional): trade before the first bar update. Defaults to False
+        io_workers (int, optional): threads for blocking I/O. Defaults to 1 (writes stay ordered)
+        log (logging.Logger, optional): defaults to the trade logger (custom_logger)
+    """
+    def __init__(self, donma, save_interval = 600, flush_interval = 10, metrics_interval = 600, cutoff = (14, 59), interday_restore = False,
+                 io_workers = 1, log = None):
+        self.donma = donma
+        self.api = donma.api
+        self.save_interval = save_interval
+        self.flush_interval = flush_interval
+        self.metrics_interval = metrics_interval
+        self.cutoff = cutoff
+        self.interday_restore = interday_restore
+        self.log = log if log is not None else logging.getLogger("custom_logger")
+        self.pool = concurrent.futures.ThreadPoolExecutor(io_workers, thread_name_prefix='donma-io')
+        self.tasks = {} # 品种 -> 行情协程
+        self.jobs = [] # 周期任务
+        self.version = None # 已同步的 dispatcher.version
+        self.stopped = False
+        self.flatten = None # 调试模式下正在平仓的品种
+        self.pending = [] # 向量化模式下本次唤醒待批量计算的品种
+
+        # 统计
+        self.wakeups = 0 # 品种协程被唤醒次数
+        self.handler_time = 0.0 # 品种协程处理耗时合计（秒）
+        self.saves = 0
+        self.save_time = 0.0 # 后台写快照耗时合计（秒）
+
+    def _in_pool(self, fn, *args):
+        return self.api._loop.run_in_executor(self.pool, fn, *args)
+
+    async def watch(self, s:str):
+        """
+        coroutine of one contract: new bar first, then the tick, every time its quote or kline changes
+        """
+        donma = self.donma
+        api = self.api
+        dispatcher = donma.dispatcher
+        while True:
+            quote = donma.quote[s]
+            kline = donma.kline.get(s)
+            # 由本地聚合生成bar的品种只订阅行情
+            watched = [quote] if kline is None else [quote, kline]
+            async with api.register_update_notify(watched) as update_chan:
+                async for _ in update_chan:
+                    start = time.perf_counter()
+                    new_bar, new_price = dispatcher.changed(s)
+                    if new_bar:
+                        donma.on_kline_update(s)
+                    if new_price:
+                        if donma.batch is None:
+                            donma.on_quotes([s], self.interday_restore)
+                        else:
+                            if not self.pending:
+                                # 排在本次唤醒的所有品种协程之后
+                                api._loop.call_soon(self.evaluate_pending)
+                            self.pending.append(s)
+                    self.handler_time += time.perf_counter() - start
+                    self.wakeups += 1
+                    if donma.kline.get(s) is not kline:
+                        # K线被重新订阅（调整窗口），换新对象监听
+                        break
+
+    def evaluate_pending(self):
+        """
+        evaluate the contracts queued by the coroutines of this wakeup as one batch
+        """
+        changed = self.pending
+        self.pending = []
+        start = time.perf_counter()
+        # 排队期间被移出交易的品种不再计算
+        self.donma.on_quotes([s for s in changed if s in self.tasks], self.interday_restore)
+        self.handler_time += time.perf_counter() - start
+
+    def sync(self):
+        """
+        start a coroutine for every newly tracked contract and cancel the ones no longer tracked
+        """
+        tracked = self.donma.dispatcher.order
+        for s in list(self.tasks):
+            if s not in tracked:
+                self.tasks.pop(s).cancel()
+        for s in tracked:
+            if s not in self.tasks:
+                self.tasks[s] = self.api.create_task(self.watch(s))
+        self.version = self.donma.dispatcher.version
+
+    async def save(self):
+        """
+        compact the checkpoint (or dump donma_state.json): the snapshot is taken here, between
+        two updates, the file is written in the pool
+        """
+        donma = self.donma
+        start = time.perf_counter()
+        if donma.checkpoint is not None:
+            snapshot = donma.checkpoint.prepare_compact(donma.snapshot())
+            tmp = await self._in_pool(donma.checkpoint.write_snapshot, snapshot)
+            donma.checkpoint.commit_snapshot(snapshot, tmp)
+        else:
+            await self._in_pool(atomic_dump, donma.snapshot(), "donma_state.json")
+        self.saves += 1
+        self.save_time += time.perf_counter() - start
+
+    async def flush(self):
+        """
+        hand the rows buffered by the recorder to its writer thread
+        """
+        if self.donma.recorder is not None:
+            await asyncio.wrap_future(self.donma.recorder.flush_async())
+
+    async def every(self, interval:float, job):
+        """
+        run the coroutine function `job` every `interval` seconds; a failing job is logged and retried next time
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.log.exception("periodic job %s failed", job.__name__)
+
+    async def checkpoint(self):
+        self.log.warning("save curr dict to json")
+        await self.save()
+
+    async def metrics(self):
+        donma = self.donma
+        self.log.warning("runner: %s", self.stats())
+        if donma.profiler is not None:
+            self.log.warning("latency (us): %s", donma.profiler.summary())
+        if donma.executor is not None:
+            self.log.warning("execution: %s", donma.executor.summary())
+        if donma.risk is not None:
+            self.log.warning("risk: %s", donma.risk.summary())
+
+    async def session_end(self):
+        """
+        stop the runner at the cutoff (checked every second)
+        """
+        while True:
+            now = datetime.datetime.now()
+            if now.hour == self.cutoff[0] and now.minute >= self.cutoff[1]:
+                self.log.warning("Program exit")
+                # 临近收盘，今日推出
+                self.stopped = True
+                return
+            await asyncio.sleep(1)
+
+    def debug_exit(self):
+        """
+        debug mode: flatten the first contract holding a position, stop once it is flat
+        """
+        donma = self.donma
+        if self.flatten is None:
+            for s in donma.symbols:
+                if donma.existing_positions[s].pos != 0:
+                    donma.set_position(s, 0)
+                    self.flatten = s
+                    break
+        elif donma.existing_positions[self.flatten].pos == 0:
+            self.stopped = True
+
+    def start(self):
+        """
+        prepare the strategy and start the contract coroutines and periodic tasks
+        """
+        self.donma.prepare_trading()
+        self.sync()
+        if not self.donma.debug:
+            self.jobs = [self.api.create_task(self.every(self.save_interval, self.checkpoint)),
+                         self.api.create_task(self.every(self.flush_interval, self.flush)),
+                         self.api.create_task(self.every(self.metrics_interval, self.metrics)),
+                         self.api.create_task(self.session_end())]
+
+    def step(self):
+        """
+        one wait_update: the contract coroutines run inside it, the housekeeping after it
+        """
+        donma = self.donma
+        if donma.profiler is not None:
+            wait_start = time.perf_counter()
+            self.api.wait_update()
+            donma.profiler.add('wait', time.perf_counter() - wait_start)
+        else:
+            self.api.wait_update()
+        donma.after_update()
+        if donma.dispatcher.version != self.version:
+            self.sync()
+        if donma.debug:
+            self.debug_exit()
+
+    def stop(self):
+        """
+        cancel every task and wait for the pending file writes
+        """
+        for task in list(self.tasks.values()) + self.jobs:
+            task.cancel()
+        self.tasks = {}
+        self.jobs = []
+        self.pool.shutdown(wait=True)
+
+    def run(self):
+        """
+        run until the session ends (or, in debug mode, until the first position is flat)
+        """
+        self.log.warning("start monitoring ticks")
+        self.start()
+        try:
+            while not self.stopped:
+                self.step()
+        finally:
+            self.stop()
+
+    def stats(self):
+        """
+        Returns:
+            result (dict): contract coroutines, wakeups, mean handler time per wakeup and mean
+                checkpoint time (microseconds / milliseconds)
+        """
+        return {'tasks' : len(self.tasks), 'wakeups' : self.wakeups, 'handler_us_per_wakeup' : self.handler_time / max(self.wakeups, 1) * 1e6,
+                'saves' : self.saves, 'save_ms' : self.save_time / max(self.saves, 1) * 1e3}
@@ -0,0 +1,260 @@
+import datetime
+import multiprocessing
+import os
+import queue
+import time
+
+import main
+import tradelog
+from checkpoint import Checkpoint
+from replay import ReplayFinished
+
+
+def partition(symbols:list, count:int):
+    """
+    split the universe into `count` shards, round robin over the sorted contracts
+
+    Args:
+        symbols (list): contracts
+        count (int): number of shards
+
+    Returns:
+        result (list): one list of contracts per shard
+    """
+    ordered = sorted(symbols)
+    return [ordered[i::count] for i in range(count)]
+
+
+def make_tq_api(account = None):
+    """
+    default api factory of a live shard (called inside the worker process). Without an account
+    every shard gets its own TqSim, i.e. its own simulated account
+    """
+    from tqsdk import TqApi, TqSim
+    return TqApi(account if account is not None else TqSim())
+
+
+def shard_report(donma):
+    """
+    Args:
+        donma (DonMA): a shard
+
+    Returns:
+        result (dict): positions, their notional value (position * last price * volume multiple),
+            account figures and dispatch counters of the shard
+    """
+    account = donma.account
+    return {'positions' : {s : donma.states[s]['position'] for s in donma.symbols},
+            'notional' : {s : donma.states[s]['position'] * donma.quote[s].last_price * donma.units[s] for s in donma.symbols
+                          if donma.states[s]['position'] != 0},
+            'balance' : getattr(account, 'balance', float('nan')), 'margin' : getattr(account, 'margin', float('nan')),
+            'wakeups' : donma.dispatcher.wakeups, 'ticks' : donma.dispatcher.quote_changes}
+
+
+def run_shard(index:int, count:int, symbols:list, universe:list, api_factory, donma_kwargs:dict, reports, stop_event,
+              checkpoint_path:str, report_interval:float, log_path:str, save_interval = 600.0):
+    """
+    worker process: one DonMA over one shard with its own api, driven like check_open_close
+    until the supervisor sets stop_event (or the api runs out of data); reports go to the
+    supervisor, the final one carries the state of every contract of the shard
+
+    Args:
+        index (int): shard number
+        count (int): number of shards
+        symbols (list): contracts of this shard
+        universe (list): every active contract (so other shards' contracts are not treated as inactive)
+        api_factory (callable): builds the api inside the worker
+        donma_kwargs (dict): extra DonMA arguments
+        reports (multiprocessing.Queue): to the supervisor
+        stop_event (multiprocessing.Event): set by the supervisor at shutdown
+        checkpoint_path (str): shared snapshot path, the shard logs to checkpoint_path + '.shard<index>'
+        report_interval (float): seconds between two reports
+        log_path (str): trade log of this shard (None keeps logging off)
+        save_interval (float, optional): seconds between two compactions of the shard checkpoint
+            (snapshot + fresh log, as the periodic save of check_open_close). Defaults to 600
+    """
+    # 子进程不继承父进程的写日志线程，重新挂载
+    for handler in list(main.custom_logger.handlers):
+        main.custom_logger.removeHandler(handler)
+    writer = None
+    if log_path is not None:
+        _, writer = tradelog.setup('custom_logger', log_path)
+    else:
+        main.custom_logger.disabled = True
+
+    checkpoint = Checkpoint('%s.shard%d' % (checkpoint_path, index))
+    restored = Checkpoint(checkpoint_path).restore() if os.path.exists(checkpoint_path) else {}
+    restored.update(checkpoint.restore())
+    donma = main.DonMA(symbols, backtest=False, kq=api_factory(), universe=universe, shard=(index, count),
+                       checkpoint=checkpoint, **donma_kwargs)
+    donma.load_from_json(restored)
+    donma.prepare_trading()
+    last_report = last_save = time.time()
+    try:
+        while not stop_event.is_set():
+            donma.api.wait_update(deadline=time.time() + 1)
+            donma.on_update()
+            if time.time() - last_report > report_interval:
+                last_report = time.time()
+                reports.put(('report', index, shard_report(donma), None))
+            if time.time() - last_save > save_interval:
+                # 定期压缩分片日志，避免WAL整个交易日只增不减
+                last_save = time.time()
+                donma.save_to_json()
+    except ReplayFinished:
+        pass
+    finally:
+        reports.put(('final', index, shard_report(donma), {s : donma.state_entry(s) for s in donma.symbols}))
+        donma.api.close()
+        checkpoint.close()
+        if writer is not None:
+            writer.stop()
+
+
+class Supervisor(object):
+    """
+    Runs the universe (and the inactive contracts still held, split by contract hash) as `workers`
+    DonMA shards in separate processes, one api connection each. Aggregates their position/account
+    reports, stops every shard at the 14:59 cutoff and merges their final states into one
+    checkpoint snapshot
+
+    By default every shard trades its own account (make_tq_api gives each a TqSim) and the
+    aggregate balance and margin are their sums. Shards logged into one shared real account
+    must say so with shared_account=True, the figures are then read from one shard
+
+    Risk limits are per shard: a RiskEngine passed in donma_kwargs is copied into every worker
+    and only sees the exposure of its own shard, so the account-wide exposure can reach `workers`
+    times each limit. Divide the limits by the number of workers for an account-wide bound
+
+    Args:
+        symbols (list): the whole active universe
+        workers (int): number of shards / processes
+        api_factory (callable, optional): picklable, builds one api per worker. Defaults to make_tq_api
+        checkpoint_path (str, optional): merged snapshot. Defaults to 'donma_state.json'
+        report_interval (float, optional): seconds between two shard reports. Defaults to 60
+        save_interval (float, optional): seconds between two compactions of a shard checkpoint. Defaults to 600
+        shared_account (bool, optional): every shard trades the same account. Defaults to False
+        log_dir (str, optional): directory of the per-shard trade logs, None disables them. Defaults to '.'
+        cutoff (tuple, optional): (hour, minute) wall clock shutdown, None to run until the shards end. Defaults to (14, 59)
+        **donma_kwargs: passed to every DonMA (window_ma, market_cap, ...)
+    """
+    def __init__(self, symbols:list, workers:int, api_factory = make_tq_api, checkpoint_path = 'donma_state.json',
+                 report_interval = 60.0, log_dir = '.', cutoff = (14, 59), save_interval = 600.0, shared_account = False, **donma_kwargs):
+        self.symbols = list(symbols)
+        self.workers = workers
+        self.api_factory = api_factory
+        self.checkpoint_path = checkpoint_path
+        self.report_interval = report_interval
+        self.save_interval = save_interval
+        self.shared_account = shared_account
+        self.log_dir = log_dir
+        self.cutoff = cutoff
+        self.donma_kwargs = donma_kwargs
+        self.reports = {} # 分片序号 -> 最近一次报告
+        self.states = {} # 合并后的品种状态
+
+    def aggregate(self):
+        """
+        Returns:
+            result (dict): contracts held, gross/net notional over every shard, balance and margin
+                (summed over the shards' accounts, or of the shared account from the lowest shard
+                that reported)
+        """
+        positions = {}
+        notional = {}
+        wakeups = ticks = 0
+        if self.shared_account:
+            first = self.reports[min(self.reports)] if self.reports else {}
+            balance = first.get('balance', float('nan'))
+            margin = first.get('margin', float('nan'))
+        else:
+            balance = sum(report['balance'] for report in self.reports.values()) if self.reports else float('nan')
+            margin = sum(report['margin'] for report in self.reports.values()) if self.reports else float('nan')
+        for report in self.reports.values():
+            positions.update(report['positions'])
+            notional.update(report['notional'])
+            wakeups += report['wakeups']
+            ticks += report['ticks']
+        return {'holding' : sum(1 for p in positions.values() if p != 0), 'gross' : sum(abs(v) for v in notional.values()),
+                'net' : sum(notional.values()), 'balance' : balance, 'margin' : margin, 'wakeups' : wakeups, 'ticks' : ticks}
+
+    def _past_cutoff(self):
+        if self.cutoff is None:
+            return False
+        now = datetime.datetime.now()
+        return (now.hour, now.minute) >= self.cutoff and now.hour < 15
+
+    def run(self):
+        """
+        start the shards, collect reports until every shard has finished
+
+        Returns:
+            result (dict): the last aggregate()
+        """
+        ctx = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else multiprocessing.get_context()
+        reports = ctx.Queue()
+        stop_event = ctx.Event()
+        shards = partition(self.symbols, self.workers)
+        if self.donma_kwargs.get('risk') is not None and self.workers > 1:
+            main.custom_logger.warning("risk limits apply per shard (%d shards)", self.workers)
+        processes = []
+        for i, symbols in enumerate(shards):
+            log_path = None if self.log_dir is None else os.path.join(self.log_dir, 'trade-related.shard%d.log' % i)
+            p = ctx.Process(target=run_shard, name='donma-shard%d' % i,
+                            args=(i, self.workers, symbols, self.symbols, self.api_factory, self.donma_kwargs, reports, stop_event,
+                                  self.checkpoint_path, self.report_interval, log_path, self.save_interval))
+            p.start()
+            processes.append(p)
+
+        finished = set()
+        try:
+            while len(finished) < len(processes):
+                if not stop_event.is_set() and self._past_cutoff():
+                    main.custom_logger.warning("Program exit")
+                    stop_event.set()
+                try:
+                    kind, index, report, states = reports.get(timeout=1)
+                except queue.Empty:
+                    if all(not p.is_alive() for p in processes):
+                        # 子进程异常退出，没有最终报告
+                        break
+                    continue
+                self.reports[index] = report
+                if kind == 'final':
+                    finished.add(index)
+                    self.states.update(states)
+                else:
+                    main.custom_logger.warning("shards: %s", self.aggregate())
+        finally:
+            stop_event.set()
+            for p in processes:
+                p.join()
+        self.merge_checkpoint()
+        summary = self.aggregate()
+        main.custom_logger.warning("shards final: %s", summary)
+        return summary
+
+    def merge_checkpoint(self):
+        """
+        write the merged state of every shard as one snapshot and drop the per-shard logs
+        """
+        if not self.states:
+            return
+        merged = Checkpoint(self.checkpoint_path)
+        state = merged.restore() if os.path.exists(self.checkpoint_path) else {}
+        state.update(self.states)
+        merged.compact(state)
+        merged.close()
+        for i in range(self.workers):
+            for path in ('%s.shard%d' % (self.checkpoint_path, i), '%s.shard%d.wal' % (self.checkpoint_path, i)):
+                if os.path.exists(path):
+                    os.remove(path)
+        if os.path.exists(self.checkpoint_path + '.wal'):
+            os.remove(self.checkpoint_path + '.wal')
+
+
+if __name__ == "__main__":
+    import helper
+    supervisor = Supervisor(helper.get_symbols(), workers=max(os.cpu_count() // 2, 1), api_factory=make_tq_api,
+                            market_cap = 1e6)
+    supervisor.run()
@@ -0,0 +1,180 @@
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+_DAY_NS = 86400 * 10**9
+_CST_NS = 8 * 3600 * 10**9 # 北京时间相对UTC的偏移
+
+
+def wait_until(api, cond, deadline = None):
+    """
+    keep calling wait_update until cond() holds. The changes received meanwhile are consumed by
+    these wait_update calls, is_changing no longer reports them afterwards (see
+    ChangeDispatcher.mark_new_bars)
+
+    Args:
+        api: TqApi (or a stand-in)
+        cond (callable): condition
+        deadline (float, optional): time.time() deadline
+
+    Returns:
+        result (bool): False on timeout
+    """
+    while not cond():
+        if deadline is None:
+            api.wait_update()
+        elif not api.wait_update(deadline=deadline):
+            return False
+    return True
+
+
+def subscribe_quotes(api, symbols:list, deadline = None):
+    """
+    subscribe every quote with one request and wait for all of them together
+
+    Args:
+        api: TqApi (or a stand-in)
+        symbols (list): contracts
+        deadline (float, optional): time.time() deadline (only used by the fallback path)
+
+    Returns:
+        result (dict): contract -> quote
+    """
+    if not symbols:
+        return {}
+    if hasattr(api, 'get_quote_list'):
+        return dict(zip(symbols, api.get_quote_list(list(symbols))))
+    return {s : api.get_quote(s) for s in symbols}
+
+
+def subscribe_klines(api, symbols:list, duration_seconds:int, data_length:int):
+    """
+    issue every kline subscription up front without waiting for the data: the requests are made
+    from one TqSdk task (get_kline_serial does not block inside the event loop), use
+    klines_ready / wait_until to wait for them
+
+    Args:
+        api: TqApi (or a stand-in)
+        symbols (list): contracts
+        duration_seconds (int): kline period
+        data_length (int): serial length
+
+    Returns:
+        result (dict): contract -> kline serial (possibly not filled yet)
+    """
+    klines = {}
+    if not symbols:
+        return klines
+    if not hasattr(api, 'create_task'):
+        for s in symbols:
+            klines[s] = api.get_kline_serial(s, duration_seconds, data_length)
+        return klines
+
+    async def request():
+        for s in symbols:
+            klines[s] = api.get_kline_serial(s, duration_seconds, data_length)
+
+    task = api.create_task(request())
+    wait_until(api, task.done)
+    return klines
+
+
+def klines_ready(api, klines:dict):
+    """
+    Args:
+        api: TqApi (or a stand-in)
+        klines (dict): contract -> kline serial
+
+    Returns:
+        result (bool): whether the initial data of every serial has arrived
+    """
+    if not hasattr(api, 'is_serial_ready'):
+        return True
+    return all(api.is_serial_ready(kline) for kline in klines.values())
+
+
+def trading_day(timestamp_ns:int):
+    """
+    the trading day a moment belongs to, as tqsdk dates daily bars: Beijing midnight of the
+    day, the night session (from 18:00) counting for the next day and a weekend for Monday
+
+    Args:
+        timestamp_ns (int): epoch nanoseconds
+
+    Returns:
+        result (int): epoch nanoseconds of the trading day (the datetime of its daily bar)
+    """
+    days = (timestamp_ns + _CST_NS) // _DAY_NS
+    if (timestamp_ns + _CST_NS) % _DAY_NS >= 18 * 3600 * 10**9:
+        days += 1
+    week_day = (days + 3) % 7 # 1970-01-01 为星期四
+    if week_day >= 5:
+        days += 7 - week_day
+    return days * _DAY_NS - _CST_NS
+
+
+class BarCache(object):
+    """
+    The previous session's daily bars of every contract, saved at exit and used at startup to
+    seed the Don-chian channels before the kline subscriptions have answered
+
+    The last bar of a serial is saved as it is, whether or not its day has closed; load drops
+    the bars of the current trading day, so a restart within the day never seeds the channel
+    with the day's forming high / low
+
+    Args:
+        path (str, optional): cache file. Defaults to 'bar_cache.json'
+        max_age_days (float, optional): older caches are ignored (covers a weekend). Defaults to 4
+    """
+    def __init__(self, path = 'bar_cache.json', max_age_days = 4):
+        self.path = path
+        self.max_age_days = max_age_days
+
+    def load(self, now = None):
+        """
+        Args:
+            now (int, optional): epoch nanoseconds, for the current trading day. Defaults to time.time_ns()
+
+        Returns:
+            result (dict): contract -> {'datetime', 'high', 'low', 'close'} numpy arrays, every bar closed
+        """
+        try:
+            with open(self.path, 'r') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if time.time() - cache.get('time', 0) > self.max_age_days * 86400:
+            return {}
+        today = trading_day(time.time_ns() if now is None else now)
+        bars = {}
+        for s, columns in cache.get('bars', {}).items():
+            dts = np.array(columns['datetime'], dtype=np.int64)
+            # 当前交易日的bar尚未收盘
+            closed = dts < today
+            bars[s] = {'datetime' : dts[closed],
+                       'high' : np.array(columns['high'], dtype=np.float64)[closed],
+                       'low' : np.array(columns['low'], dtype=np.float64)[closed],
+                       'close' : np.array(columns['close'], dtype=np.float64)[closed]}
+        return bars
+
+    def save(self, klines:dict):
+        """
+        Args:
+            klines (dict): contract -> kline serial, the last (current) bar is saved too
+        """
+        bars = {}
+        for s, kline in klines.items():
+            close = kline['close'].values
+            if len(close) == 0 or math.isnan(close[-1]):
+                continue
+            bars[s] = {'datetime' : [int(x) for x in kline['datetime'].values],
+                       'high' : [float(x) for x in kline['high'].values],
+                       'low' : [float(x) for x in kline['low'].values],
+                       'close' : [float(x) for x in close]}
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'time' : time.time(), 'bars' : bars}, f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,364 @@
+import asyncio
+import time
+
+import numpy as np
+import pandas as pd
+
+from replay import ReplayObject, ReplayFinished
+
+
+class StubUpdateChannel(object):
+    """
+    register_update_notify stand-in: `async with api.register_update_notify([quote, kline]) as chan:
+    async for _ in chan:` wakes once per wait_update in which any of the objects changed
+    """
+    def __init__(self, api, keys:set):
+        self.api = api
+        self.keys = keys
+        self.queue = None
+
+    async def __aenter__(self):
+        self.queue = asyncio.Queue(maxsize=1)
+        for key in self.keys:
+            self.api._channels.setdefault(key, set()).add(self)
+        return self
+
+    async def __aexit__(self, *exc):
+        for key in self.keys:
+            self.api._channels.get(key, set()).discard(self)
+
+    def notify(self):
+        if self.queue is not None and self.queue.empty():
+            self.queue.put_nowait(True)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+
+class StubTargetPosTask(object):
+    """
+    TargetPosTask stand-in that only remembers the last target
+    """
+    def __init__(self, api, symbol:str, **kwargs):
+        self.api = api
+        self.symbol = symbol
+        self.target = None
+
+    def set_target_volume(self, volume):
+        self.target = volume
+
+
+class StubApi(object):
+    """
+    In-memory TqApi stand-in with a simulated server round trip: a blocking request (get_quote,
+    get_kline_serial outside a task) sleeps `latency`, get_quote_list sleeps once for the whole
+    list, and kline requests made inside create_task return at once and become ready `latency`
+    later, in wait_update. Klines are random-walk daily bars.
+
+    With ticks_per_update set, every wait_update after startup is a synthetic tick feed: that many
+    subscribed contracts (all of them if larger) get a random-walk last price, a new daily bar is
+    rolled into every serial each `bar_every` updates, and ReplayFinished is raised after `max_updates`
+
+    Tasks (create_task) run on a real asyncio loop inside wait_update, as in TqApi: they are run
+    until they all wait, after the update is applied; register_update_notify channels are woken
+    for the quotes / klines that changed, and `published_at` is the perf_counter of the update
+
+    insert_order / cancel_order trade against a one-level book around the last price (bid/ask one
+    price_tick away): orders and cancels reach the book at the next wait_update, a live limit order
+    fills at the ask (buy) / bid (sell) once the touch is at or through its price, up to
+    `book_volume` hands per update. The trade records and position of a fill can lag its order
+    status by `report_delay` updates (tqsdk does not send them in one packet either)
+
+    Args:
+        latency (float, optional): seconds per server round trip. Defaults to 0.005
+        seed (int, optional): random seed. Defaults to 0
+        ticks_per_update (int, optional): contracts ticking per wakeup. Defaults to None (no feed)
+        max_updates (int, optional): wakeups before ReplayFinished. Defaults to None (endless)
+        bar_every (int, optional): wakeups between two new daily bars. Defaults to None (never)
+        volatility (float, optional): stdev of the log return per tick. Defaults to 0.002
+        book_volume (int, optional): hands at the touch per update, None to fill in full. Defaults to None
+        report_delay (int, optional): updates between a fill and its trade record / position. Defaults to 0
+    """
+    def __init__(self, latency = 0.005, seed = 0, ticks_per_update = None, max_updates = None, bar_every = None, volatility = 0.002,
+                 book_volume = None, report_delay = 0):
+        self.latency = latency
+        self.ticks_per_update = ticks_per_update
+        self.max_updates = max_updates
+        self.bar_every = bar_every
+        self.volatility = volatility
+        self.book_volume = book_volume
+        self.report_delay = report_delay
+        self.updates = 0 # 行情推送次数
+        self.tick_count = 0 # 推送的tick总数
+        self._subscribed = [] # 已订阅行情的品种（顺序）
+        self._klines = {}
+        self._changed_quotes = set()
+        self._changed_klines = set()
+        self._sync_diffs = []
+        self._diffs = [] # 任务内看到的本次更新（与TqApi._diffs同名），与 _sync_diffs 相同
+        self.rng = np.random.default_rng(seed)
+        self._loop = asyncio.new_event_loop()
+        self._channels = {} # ('quote'|'kline', 品种) -> 等待更新的StubUpdateChannel
+        self.published_at = 0.0 # 本次行情推送时间 (perf_counter)
+        self._serials = {} # id(kline) -> {'init', 'ready_at'}，与TqApi._serials同名
+        self._quotes = {}
+        self._positions = {}
+        self._trades = {}
+        self._orders = {} # order_id -> 委托（与tqsdk Order同名字段）
+        self._live = [] # 已到达撮合的挂单
+        self._sent = [] # 下一次wait_update到达撮合的 (委托, 是否撤单)
+        self._reports = [] # 延迟到达的成交回报 (到达的推送序号, 成交)
+        self._account = ReplayObject(balance=0.0, available=0.0, margin=0.0)
+
+    def _blocking(self):
+        if not self._loop.is_running() and self.latency:
+            time.sleep(self.latency)
+
+    def _quote(self, symbol:str):
+        quote = self._quotes.get(symbol)
+        if quote is None:
+            price = float(3000 + self.rng.integers(-500, 500))
+            quote = self._quotes[symbol] = ReplayObject(instrument_id=symbol, last_price=price, bid_price1=price - 1, ask_price1=price + 1, price_tick=1.0,
+                                                        datetime='2020-07-28 09:00:00.000000', volume_multiple=10)
+            self._subscribed.append(symbol)
+        return quote
+
+    def get_quote(self, symbol:str):
+        self._blocking()
+        return self._quote(symbol)
+
+    def get_quote_list(self, symbols:list):
+        self._blocking()
+        return [self._quote(s) for s in symbols]
+
+    def get_kline_serial(self, symbol:str, duration_seconds:int, data_length = 200):
+        close = 3000 * np.exp(np.cumsum(self.rng.normal(0, 0.01, data_length)))
+        spread = close * self.rng.uniform(0, 0.01, data_length)
+        start = pd.Timestamp('2020-07-28').value
+        kline = pd.DataFrame({'datetime' : start + np.arange(data_length, dtype=np.int64) * duration_seconds * 1000000000,
+                              'open' : close, 'high' : close + spread, 'low' : close - spread, 'close' : close,
+                              'volume' : np.zeros(data_length)})
+        kline['symbol'] = symbol
+        kline['duration'] = duration_seconds
+        self._klines[symbol] = kline
+        if self._loop.is_running():
+            self._serials[id(kline)] = {'init' : False, 'ready_at' : time.perf_counter() + self.latency}
+        else:
+            self._blocking()
+            self._serials[id(kline)] = {'init' : True, 'ready_at' : 0.0}
+        return kline
+
+    def is_serial_ready(self, obj):
+        serial = self._serials.get(id(obj))
+        return serial is None or serial['init']
+
+    def create_task(self, coro):
+        # 协程内的请求不阻塞（与TqApi在事件循环内的行为一致），新任务立即运行到第一次等待
+        task = self._loop.create_task(coro)
+        self._run_tasks()
+        return task
+
+    def _run_tasks(self):
+        """
+        run every task until they all wait
+        """
+        if self._loop.is_running():
+            return
+        self._loop.run_until_complete(asyncio.sleep(0))
+        while self._loop._ready:
+            self._loop.run_until_complete(asyncio.sleep(0))
+
+    def register_update_notify(self, obj = None):
+        objs = obj if isinstance(obj, (list, tuple)) else [obj]
+        keys = set()
+        for o in objs:
+            if isinstance(o, pd.DataFrame):
+                keys.add(('kline', o['symbol'].iloc[-1]))
+            else:
+                keys.add(('quote', o.instrument_id))
+        return StubUpdateChannel(self, keys)
+
+    def _notify(self):
+        for kind, changed in (('quote', self._changed_quotes), ('kline', self._changed_klines)):
+            for s in changed:
+                for channel in self._channels.get((kind, s), ()):
+                    channel.notify()
+
+    def wait_update(self, deadline = None):
+        """
+        sleep until the next pending kline request is answered; once every request is answered,
+        push the next batch of synthetic ticks (if the feed is enabled)
+        """
+        self._run_tasks()
+        self._changed_quotes.clear()
+        self._changed_klines.clear()
+        self._sync_diffs = []
+        self._diffs = []
+        pending = [serial for serial in self._serials.values() if not serial['init']]
+        if pending:
+            ready_at = min(serial['ready_at'] for serial in pending)
+            delay = ready_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.perf_counter()
+            for serial in pending:
+                if serial['ready_at'] <= now:
+                    serial['init'] = True
+            return True
+        if self.ticks_per_update is None or not self._subscribed:
+            return True
+        if self.max_updates is not None and self.updates >= self.max_updates:
+            raise ReplayFinished()
+        self.updates += 1
+        if self.updates == 1:
+            # 与tqsdk一致，首次推送时所有订阅的K线都视为变化
+            self._changed_klines.update(self._klines)
+        if self.bar_every and self.updates % self.bar_every == 0:
+            for s in self._klines:
+                self._roll_bar(s)
+        n = len(self._subscribed)
+        if self.ticks_per_update >= n:
+            ticking = self._subscribed
+        else:
+            ticking = [self._subscribed[i] for i in self.rng.choice(n, self.ticks_per_update, replace=False)]
+        returns = np.exp(self.rng.normal(0, self.volatility, len(ticking)))
+        curr_time = (pd.Timestamp('2020-07-28 09:00:00') + pd.Timedelta(milliseconds=500 * self.updates)).strftime('%Y-%m-%d %H:%M:%S.%f')
+        for s, r in zip(ticking, returns.tolist()):
+            quote = self._quotes[s]
+            price = float(round(quote.last_price * r))
+            if price != quote.last_price:
+                quote.last_price = price
+                quote.bid_price1 = price - quote.price_tick
+                quote.ask_price1 = price + quote.price_tick
+                self._changed_quotes.add(s)
+            quote.datetime = curr_time
+        self.tick_count += len(ticking)
+        self._match()
+        self._sync_diffs = [{'quotes' : {s : {'last_price' : self._quotes[s].last_price} for s in self._changed_quotes},
+                             'klines' : {s : {} for s in self._changed_klines}}]
+        self._diffs = self._sync_diffs
+        self.published_at = time.perf_counter()
+        if self._channels:
+            self._notify()
+            self._run_tasks()
+        return True
+
+    def _roll_bar(self, s:str):
+        """
+        close the current bar of a kline serial at the last price and open a new one
+        """
+        kline = self._klines[s]
+        price = self._quotes[s].last_price if s in self._quotes else float(kline['close'].values[-1])
+        step = int(kline['duration'].values[-1]) * 1000000000
+        new = {'datetime' : int(kline['datetime'].values[-1]) + step, 'open' : price, 'high' : price, 'low' : price, 'close' : price, 'volume' : 0.0}
+        for c, value in new.items():
+            kline[c] = np.append(kline[c].values[1:], value)
+        self._changed_klines.add(s)
+
+    def is_changing(self, obj, key = None):
+        if isinstance(obj, pd.Series):
+            return obj['symbol'] in self._changed_klines
+        return getattr(obj, 'instrument_id', None) in self._changed_quotes
+
+    def get_position(self, symbol = None):
+        if symbol is not None:
+            return self._positions.setdefault(symbol, ReplayObject(instrument_id=symbol, pos=0, pos_long=0, pos_short=0, pos_long_today=0, pos_long_his=0,
+                                                                   pos_short_today=0, pos_short_his=0))
+        return self._positions
+
+    def get_order(self, order_id = None):
+        if order_id is not None:
+            return self._orders[order_id]
+        return self._orders
+
+    def insert_order(self, symbol:str, direction:str, offset:str, volume:int, limit_price = None):
+        order_id = 'stub%d' % len(self._orders)
+        exchange_id, instrument_id = symbol.split('.', 1)
+        order = self._orders[order_id] = ReplayObject(order_id=order_id, exchange_id=exchange_id, instrument_id=instrument_id, direction=direction,
+                                                      offset=offset, volume_orig=volume, volume_left=volume, limit_price=limit_price, status='ALIVE')
+        self._sent.append((order, False))
+        return order
+
+    def cancel_order(self, order):
+        self._sent.append((order, True))
+
+    def _match(self):
+        """
+        deliver the delayed trade reports that are due, fill every live order whose price the touch
+        has reached, then let the orders / cancels sent since the last update reach the book (they
+        can fill from the next update on)
+        """
+        due = [trade for at, trade in self._reports if at <= self.updates]
+        self._reports = [(at, trade) for at, trade in self._reports if at > self.updates]
+        for trade in due:
+            self._report(trade)
+        live = []
+        for order in self._live:
+            quote = self._quotes[order.exchange_id + '.' + order.instrument_id]
+            if order.direction == 'BUY' and quote.ask_price1 <= order.limit_price:
+                self._fill_order(order, quote.ask_price1)
+            elif order.direction == 'SELL' and quote.bid_price1 >= order.limit_price:
+                self._fill_order(order, quote.bid_price1)
+            if order.status != 'FINISHED':
+                live.append(order)
+        for order, cancel in self._sent:
+            if order.status == 'FINISHED':
+                continue
+            if cancel:
+                order.status = 'FINISHED'
+                if order in live:
+                    live.remove(order)
+            else:
+                live.append(order)
+        self._sent = []
+        self._live = live
+
+    def _fill_order(self, order, price:float):
+        volume = order.volume_left if self.book_volume is None else min(order.volume_left, self.book_volume)
+        order.volume_left -= volume
+        if order.volume_left == 0:
+            order.status = 'FINISHED'
+        trade_id = '%s|%d' % (order.order_id, len(self._trades) + len(self._reports))
+        trade = ReplayObject(trade_id=trade_id, order_id=order.order_id, exchange_id=order.exchange_id, instrument_id=order.instrument_id,
+                             direction=order.direction, offset=order.offset, price=price, volume=volume, trade_date_time=time.time_ns())
+        if self.report_delay:
+            self._reports.append((self.updates + self.report_delay, trade))
+        else:
+            self._report(trade)
+
+    def _report(self, trade):
+        """
+        the trade record of a fill and its effect on the position
+        """
+        position = self.get_position(trade.exchange_id + '.' + trade.instrument_id)
+        volume = trade.volume
+        side = 'long' if (trade.direction == 'BUY') == (trade.offset == 'OPEN') else 'short'
+        if trade.offset == 'OPEN':
+            position['pos_%s_today' % side] += volume
+        else:
+            # 平今优先扣今仓，平仓（非上期所）先扣昨仓
+            first, second = ('today', 'his') if trade.offset == 'CLOSETODAY' else ('his', 'today')
+            taken = min(volume, position['pos_%s_%s' % (side, first)])
+            position['pos_%s_%s' % (side, first)] -= taken
+            position['pos_%s_%s' % (side, second)] -= volume - taken
+        position.pos_long = position.pos_long_today + position.pos_long_his
+        position.pos_short = position.pos_short_today + position.pos_short_his
+        position.pos = position.pos_long - position.pos_short
+        self._trades[trade.trade_id] = trade
+
+    def get_trade(self):
+        return self._trades
+
+    def get_account(self):
+        return self._account
+
+    def close(self):
+        tasks = asyncio.all_tasks(self._loop)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._loop.close()
@@ -0,0 +1,38 @@
+import main
+from bench_hotpath import make_donma
+from replay import ReplayFinished
+
+
+def _run(seed:int, vectorized:bool, min_rows = None):
+    """
+    drive a DonMA over the synthetic feed; every target sent and the final state of every contract
+    """
+    donma = make_donma(60, 40, 1500, vectorized=vectorized, bar_every=250, seed=seed)
+    if min_rows is not None:
+        donma.batch.min_rows = min_rows
+    targets = []
+    set_position = donma.set_position
+
+    def traced(symbol:str, pos:float, is_pendant = False):
+        targets.append((donma.api.updates, symbol, pos, is_pendant))
+        return set_position(symbol, pos, is_pendant)
+
+    donma.set_position = traced
+    try:
+        while True:
+            donma.api.wait_update()
+            donma.on_update()
+    except ReplayFinished:
+        pass
+    donma.api.close()
+    return targets, {s : dict(v) for s, v in donma.states.items()}, dict(donma.t_0trades), dict(donma.pendant_trades)
+
+
+def test_batch_decisions_match_the_scalar_path():
+    main.custom_logger.disabled = True
+    for seed in range(4):
+        scalar = _run(seed, False)
+        assert scalar[0], 'the feed should trigger signals'
+        # 全部走数组计算 / 按 min_rows 混合
+        assert _run(seed, True, 0) == scalar
+        assert _run(seed, True, 30) == scalar
@@ -0,0 +1,169 @@
+import logging
+
+from execution import OrderExecutor
+from stubapi import StubApi
+
+
+class Clock(object):
+    """
+    manual clock for the chase timers
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _setup(symbol = 'SHFE.cu2101', book_volume = None, report_delay = 0, **kwargs):
+    """
+    an executor of one contract over a StubApi book whose prices only move when a test moves them
+    """
+    api = StubApi(latency=0, ticks_per_update=1, volatility=0.0, book_volume=book_volume, report_delay=report_delay)
+    clock = Clock()
+    executor = OrderExecutor(clock=clock, log=logging.getLogger('test_execution'), **kwargs)
+    task = executor.task(api, symbol)
+    _touch(api.get_quote(symbol), 3000)
+    return api, executor, task, clock
+
+
+def _touch(quote, price:float, bid = None, ask = None):
+    quote.last_price = price
+    quote.bid_price1 = price - 1 if bid is None else bid
+    quote.ask_price1 = price + 1 if ask is None else ask
+
+
+def _hold(api, symbol:str, today = 0, his = 0):
+    """
+    start from a long position
+    """
+    position = api.get_position(symbol)
+    position.pos_long_today, position.pos_long_his = today, his
+    position.pos_long = position.pos = today + his
+
+
+def _run(api, executor, updates = 1):
+    for _ in range(updates):
+        api.wait_update()
+        executor.step()
+
+
+def _orders(api):
+    return [(o.direction, o.offset, o.volume_orig, o.limit_price) for o in api.get_order().values()]
+
+
+def test_passive_child_rests_then_crosses_after_chase_ms():
+    api, executor, task, clock = _setup(chase_ms=500, min_rest_ms=0)
+    task.set_target_volume(2)
+    _run(api, executor, 3)
+    # 挂在买一，盘口未动不成交
+    assert _orders(api) == [('BUY', 'OPEN', 2, 2999)]
+    assert task.position.pos == 0
+    clock.now = 0.6
+    _run(api, executor, 4)
+    assert _orders(api) == [('BUY', 'OPEN', 2, 2999), ('BUY', 'OPEN', 2, 3001)]
+    assert task.position.pos == 2
+    assert executor.summary()['chases'] == 1
+
+
+def test_partial_fill_then_chase_sends_only_the_rest():
+    api, executor, task, clock = _setup(book_volume=1, chase_ms=0, min_rest_ms=200)
+    task.set_target_volume(3)
+    _run(api, executor, 2)
+    assert task.position.pos == 1
+    # 价格离开，剩余2手不再成交，到时撤单后在新的卖一追单
+    _touch(api.get_quote('SHFE.cu2101'), 3004)
+    clock.now = 0.3
+    _run(api, executor, 2)
+    assert _orders(api) == [('BUY', 'OPEN', 3, 3001), ('BUY', 'OPEN', 2, 3005)]
+    _run(api, executor, 4)
+    assert task.position.pos == 3
+    assert len(api.get_order()) == 2
+
+
+def test_shfe_closes_today_before_yesterday():
+    api, executor, task, clock = _setup(exit_chase_ms=0)
+    _hold(api, 'SHFE.cu2101', today=2, his=3)
+    task.set_target_volume(0)
+    _run(api, executor, 4)
+    assert [o[:3] for o in _orders(api)] == [('SELL', 'CLOSETODAY', 2), ('SELL', 'CLOSE', 3)]
+    assert task.position.pos == 0
+
+    api, executor, task, clock = _setup('DCE.m2101', exit_chase_ms=0)
+    _hold(api, 'DCE.m2101', today=2, his=3)
+    task.set_target_volume(0)
+    _run(api, executor, 2)
+    assert [o[:3] for o in _orders(api)] == [('SELL', 'CLOSE', 5)]
+    assert task.position.pos == 0
+
+
+def test_max_slippage_caps_opens_not_closes():
+    api, executor, task, clock = _setup(chase_ms=0, max_slippage=0.001)
+    _touch(api.get_quote('SHFE.cu2101'), 3000, bid=2990, ask=3010)
+    task.set_target_volume(1)
+    assert _orders(api)[-1] == ('BUY', 'OPEN', 1, 3003)
+
+    api, executor, task, clock = _setup(exit_chase_ms=0, max_slippage=0.001)
+    _hold(api, 'SHFE.cu2101', today=1)
+    _touch(api.get_quote('SHFE.cu2101'), 3000, bid=2990, ask=3010)
+    task.set_target_volume(0)
+    assert _orders(api)[-1] == ('SELL', 'CLOSETODAY', 1, 2990)
+
+
+def _reject_everything(api):
+    insert_order = api.insert_order
+
+    def rejected(*args, **kwargs):
+        order = insert_order(*args, **kwargs)
+        order.status = 'FINISHED'
+        return order
+
+    api.insert_order = rejected
+
+
+def test_max_rejects_gives_up_an_open_but_retries_a_close():
+    api, executor, task, clock = _setup(chase_ms=0, max_rejects=2, retry_ms=1000)
+    _reject_everything(api)
+    task.set_target_volume(1)
+    _run(api, executor, 5)
+    assert len(api.get_order()) == 2
+    clock.now = 10.0
+    _run(api, executor, 5)
+    assert len(api.get_order()) == 2
+
+    api, executor, task, clock = _setup(exit_chase_ms=0, max_rejects=2, retry_ms=1000)
+    _hold(api, 'SHFE.cu2101', today=1)
+    _reject_everything(api)
+    task.set_target_volume(0)
+    _run(api, executor, 5)
+    assert len(api.get_order()) == 3
+    _run(api, executor, 5)
+    assert len(api.get_order()) == 3
+    clock.now = 1.5
+    _run(api, executor, 1)
+    assert len(api.get_order()) == 4
+
+
+def test_late_position_update_does_not_overfill():
+    api, executor, task, clock = _setup(chase_ms=0, report_delay=3)
+    task.set_target_volume(2)
+    _run(api, executor, 2)
+    # 委托已全部成交，成交与持仓回报尚未到达
+    order = list(api.get_order().values())[0]
+    assert order.status == 'FINISHED' and order.volume_left == 0
+    assert task.position.pos == 0
+    _run(api, executor, 6)
+    assert len(api.get_order()) == 1
+    assert task.position.pos == 2
+    assert executor.summary()['filled'] == 2
+
+
+def test_late_report_after_partially_filled_chase_does_not_overfill():
+    api, executor, task, clock = _setup(book_volume=1, report_delay=2, chase_ms=0, min_rest_ms=200)
+    task.set_target_volume(3)
+    _run(api, executor, 2)
+    _touch(api.get_quote('SHFE.cu2101'), 3004)
+    clock.now = 0.3
+    _run(api, executor, 10)
+    assert [o[2] for o in _orders(api)] == [3, 2]
+    assert task.position.pos == 3
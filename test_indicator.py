@@ -0,0 +1,101 @@
+import math
+import types
+
+import numpy as np
+import pandas as pd
+
+import main
+from indicator import DonchianChannel, RollingExtreme, RollingMean
+
+
+def _same(a:float, b:float, rel_tol = 0.0):
+    """
+    float equality where NaN == NaN
+    """
+    if math.isnan(a) or math.isnan(b):
+        return math.isnan(a) and math.isnan(b)
+    return math.isclose(a, b, rel_tol=rel_tol, abs_tol=0.0) if rel_tol else a == b
+
+
+def _full(kline:pd.DataFrame, channel:DonchianChannel):
+    """
+    DonMA.recalc_parameter_full on one serial
+    """
+    donma = types.SimpleNamespace(bars=lambda s: kline, channels={'s' : channel})
+    return main.DonMA.recalc_parameter_full(donma, 's')
+
+
+def _serial(rng, length:int, padding:int, nan_rate:float):
+    """
+    random daily serial in tqsdk layout: `padding` NaN rows (datetime 0) in front, then bars with
+    an occasional NaN value
+    """
+    close = np.round(3000 * np.exp(np.cumsum(rng.normal(0, 0.02, length)))) * rng.choice([1.0, 0.5, 0.2])
+    high = close + np.round(rng.uniform(0, 30, length))
+    low = close - np.round(rng.uniform(0, 30, length))
+    for values in (high, low, close):
+        values[rng.random(length) < nan_rate] = math.nan
+    datetime = np.arange(length, dtype=np.int64) * 86400 * 10**9 + 10**18
+    for values in (high, low, close):
+        values[:padding] = math.nan
+    datetime[:padding] = 0
+    return pd.DataFrame({'datetime' : datetime, 'high' : high, 'low' : low, 'close' : close})
+
+
+def test_rolling_extreme_matches_python_max_over_the_slice():
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        window = int(rng.integers(1, 12))
+        values = rng.normal(0, 1, 60)
+        values[rng.random(60) < 0.2] = math.nan
+        high, low = RollingExtreme(window, True), RollingExtreme(window, False)
+        for i, v in enumerate(values.tolist()):
+            high.push(v)
+            low.push(v)
+            window_slice = values[max(i + 1 - window, 0):i + 1].tolist()
+            assert _same(high.value, max(window_slice))
+            assert _same(low.value, min(window_slice))
+
+
+def test_rolling_mean_is_the_exact_window_mean():
+    rng = np.random.default_rng(2)
+    for _ in range(200):
+        window = int(rng.integers(1, 56))
+        values = np.round(rng.normal(3000, 300, 200)) * rng.choice([1.0, 0.1, 0.2])
+        values[rng.random(200) < 0.02] = math.nan
+        mean = RollingMean(window)
+        for i, v in enumerate(values.tolist()):
+            mean.push(v)
+            window_slice = values[i + 1 - window:i + 1] if i + 1 >= window else values[:0]
+            expected = math.fsum(window_slice) / window if len(window_slice) == window and not np.isnan(window_slice).any() else math.nan
+            assert _same(mean.value, expected)
+
+
+def test_incremental_channel_matches_full_recompute():
+    """
+    the serial slides like a tqsdk kline serial: mostly one new bar, sometimes only the forming
+    bar changes, sometimes several bars arrive at once (missed updates, the channel re-seeds)
+    """
+    rng = np.random.default_rng(3)
+    for _ in range(60):
+        window_hl, window_ma = int(rng.integers(2, 20)), int(rng.integers(2, 20))
+        length = max(window_hl, window_ma) + int(rng.integers(1, 10))
+        total = length + 120
+        serial = _serial(rng, total, int(rng.integers(0, length)), float(rng.choice([0.0, 0.05])))
+        channel = DonchianChannel(window_hl, window_ma)
+        end = length
+        forming = False
+        while end <= total:
+            kline = serial.iloc[end - length:end].reset_index(drop=True)
+            if forming:
+                # 只有当前bar变化
+                kline.loc[length - 1, ['high', 'low', 'close']] += rng.normal(0, 10)
+            channel.update(kline)
+            up, down, mid = _full(kline, channel)
+            assert _same(channel.up, up)
+            assert _same(channel.down, down)
+            # tafunc.ma 为 pandas 的补偿累加，与精确的窗口均值至多相差舍入误差
+            assert _same(channel.ma, mid, 1e-12)
+            step = int(rng.choice([0, 1, 1, 1, 1, 3]))
+            forming = step == 0
+            end += step
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from startup import BarCache, trading_day
+
+
+def _ns(text:str):
+    """
+    Beijing wall time to epoch nanoseconds
+    """
+    return pd.Timestamp(text, tz='Asia/Shanghai').value
+
+
+def test_trading_day_rolls_over_at_the_night_session_and_the_weekend():
+    assert trading_day(_ns('2020-07-28 10:00')) == _ns('2020-07-28')
+    assert trading_day(_ns('2020-07-28 21:30')) == _ns('2020-07-29')
+    # 周五夜盘属于下周一
+    assert trading_day(_ns('2020-07-31 21:30')) == _ns('2020-08-03')
+    assert trading_day(_ns('2020-08-01 12:00')) == _ns('2020-08-03')
+
+
+def test_bar_cache_drops_the_forming_bar_of_the_current_trading_day(tmp_path):
+    days = ['2020-07-24', '2020-07-27', '2020-07-28']
+    kline = pd.DataFrame({'datetime' : [_ns(d) for d in days], 'high' : [11.0, 12.0, 99.0],
+                          'low' : [9.0, 8.0, 1.0], 'close' : [10.0, 10.0, 50.0]})
+    cache = BarCache(str(tmp_path / 'bar_cache.json'))
+    cache.save({'SHFE.cu2101' : kline})
+
+    # 当日盘中重启：当日未收盘的bar不用于计算通道
+    bars = cache.load(now=_ns('2020-07-28 14:00'))['SHFE.cu2101']
+    assert bars['datetime'].tolist() == [_ns(d) for d in days[:2]]
+    assert np.max(bars['high']) == 12.0
+    # 次一交易日（夜盘起）启动：前一交易日的bar已收盘
+    bars = cache.load(now=_ns('2020-07-28 21:00'))['SHFE.cu2101']
+    assert bars['datetime'].tolist() == [_ns(d) for d in days]
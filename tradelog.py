@@ -0,0 +1,127 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+SIGNAL_FORMAT = "%s %s @ %s curr price: %f target pos: %d levels: %s"
+VETO_FORMAT = "%s %s vetoed by risk @ %s curr price: %f target pos: %d levels: %s (%d suppressed)"
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that puts the record on the queue untouched: the message is not merged with
+    its args in the calling (tick) thread, formatting happens in the writer thread
+    """
+    def prepare(self, record):
+        return record
+
+
+class BatchWriter(threading.Thread):
+    """
+    Background writer draining the log queue: blocks for the first record, then takes whatever
+    else is queued (up to batch_size), formats the whole batch, writes it in one call and flushes once
+
+    Args:
+        log_queue (queue.SimpleQueue): the queue the DeferredQueueHandler feeds
+        path (str): log file path
+        mode (str, optional): open mode. Defaults to 'a'
+        batch_size (int, optional): max records per write. Defaults to 512
+        formatter (logging.Formatter, optional): record formatter
+    """
+    def __init__(self, log_queue:queue.SimpleQueue, path:str, mode = 'a', batch_size = 512, formatter = None):
+        super().__init__(name='trade-log-writer', daemon=True)
+        self.queue = log_queue
+        self.stream = open(path, mode, encoding='utf-8')
+        self.batch_size = batch_size
+        self.formatter = formatter or logging.Formatter()
+        self._stop_token = object()
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            stop = False
+            for record in batch:
+                if record is self._stop_token:
+                    stop = True
+                    continue
+                try:
+                    lines.append(self.formatter.format(record) + '\n')
+                except Exception:
+                    lines.append('unformattable record: %r %r\n' % (record.msg, record.args))
+            self.stream.write(''.join(lines))
+            self.stream.flush()
+            if stop:
+                self.stream.close()
+                return
+
+    def stop(self, timeout = 5.0):
+        """
+        write out everything already queued, then close the file
+        """
+        if self.is_alive():
+            self.queue.put(self._stop_token)
+            self.join(timeout)
+
+
+class RateLimiter(object):
+    """
+    At most one message per key per interval; repeats in between are only counted
+
+    Args:
+        interval (float, optional): seconds between two messages of the same key. Defaults to 60
+    """
+    def __init__(self, interval = 60.0):
+        self.interval = interval
+        self.last = {} # key -> 上次输出时间
+        self.suppressed = {} # key -> 被抑制次数
+
+    def hit(self, key):
+        """
+        register one occurrence
+
+        Args:
+            key: what is being rate limited (e.g. contract name)
+
+        Returns:
+            result (int or None): None if the message should be dropped, otherwise the number of
+                occurrences suppressed since the last message
+        """
+        now = time.monotonic()
+        last = self.last.get(key)
+        if last is not None and now - last < self.interval:
+            self.suppressed[key] = self.suppressed.get(key, 0) + 1
+            return None
+        self.last[key] = now
+        return self.suppressed.pop(key, 0)
+
+
+def setup(name:str, path:str, mode = 'a', batch_size = 512):
+    """
+    attach a queue-based, batched file pipeline to a logger, the writer is stopped (and the file
+    flushed) at interpreter exit, or earlier via the returned writer's stop()
+
+    Args:
+        name (str): logger name
+        path (str): log file path
+        mode (str, optional): open mode. Defaults to 'a' (a restart never wipes the day's log)
+        batch_size (int, optional): max records per write. Defaults to 512
+
+    Returns:
+        result (tuple): the logger and its BatchWriter
+    """
+    logger = logging.getLogger(name)
+    log_queue = queue.SimpleQueue()
+    formatter = logging.Formatter(fmt='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    writer = BatchWriter(log_queue, path, mode, batch_size, formatter)
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    writer.start()
+    atexit.register(writer.stop)
+    return logger, writer
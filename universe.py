@@ -0,0 +1,200 @@
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import mysql.connector.pooling as sqlpooling
+except ImportError:
+    sqlpooling = None
+
+SELECT_SQL = 'SELECT exchange,instrument_id FROM speedtrade.selected'
+
+
+def _contract_name(exchange, inst_id):
+    """
+    exchange + instrument id (bytes or str) to TQSDK's standard naming format
+    """
+    if isinstance(exchange, (bytes, bytearray)):
+        exchange = exchange.decode()
+    if isinstance(inst_id, (bytes, bytearray)):
+        inst_id = inst_id.decode()
+    return str(exchange) + '.' + str(inst_id)
+
+
+class MySQLSource(object):
+    """
+    speedtrade.selected on the remote MySQL server, through a small connection pool with
+    connect timeout and retries
+
+    Args:
+        pool_size (int, optional): pooled connections. Defaults to 2
+        timeout (int, optional): connect timeout in seconds. Defaults to 5
+        retries (int, optional): attempts before giving up. Defaults to 3
+        backoff (float, optional): seconds before the first retry, doubled each time. Defaults to 0.5
+        sql (str, optional): the query, returning exchange and instrument_id columns
+        **connect_args: host, user, password, db, port ... for mysql.connector
+    """
+    def __init__(self, pool_size = 2, timeout = 5, retries = 3, backoff = 0.5, sql = SELECT_SQL, **connect_args):
+        if sqlpooling is None:
+            raise ImportError('mysql-connector-python is required for MySQLSource')
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.sql = sql
+        self.connect_args = connect_args
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def _get_pool(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = sqlpooling.MySQLConnectionPool(pool_name='speedtrade', pool_size=self.pool_size,
+                                                           connection_timeout=self.timeout, **self.connect_args)
+            return self.pool
+
+    def fetch(self):
+        """
+        Returns:
+            contract_names (list): selected contracts
+
+        Raises:
+            the last database error once every retry failed
+        """
+        delay = self.backoff
+        for attempt in range(self.retries):
+            try:
+                conn = self._get_pool().get_connection()
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute(self.sql)
+                    result = cursor.fetchall()
+                    cursor.close()
+                finally:
+                    conn.close() # 归还连接池
+                return [_contract_name(i[0], i[1]) for i in result]
+            except Exception:
+                if attempt == self.retries - 1:
+                    raise
+                with self.lock:
+                    self.pool = None # 连接池可能已失效，下次重建
+                time.sleep(delay)
+                delay *= 2
+
+
+class SQLiteSource(object):
+    """
+    same query against a local SQLite file (stand-in for the MySQL table in tests / offline runs)
+
+    Args:
+        path (str): sqlite database file
+        sql (str, optional): the query, returning exchange and instrument_id columns.
+            Defaults to 'SELECT exchange,instrument_id FROM selected'
+    """
+    def __init__(self, path:str, sql = 'SELECT exchange,instrument_id FROM selected'):
+        self.path = path
+        self.sql = sql
+
+    def fetch(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            return [_contract_name(i[0], i[1]) for i in conn.execute(self.sql).fetchall()]
+        finally:
+            conn.close()
+
+
+class CSVSource(object):
+    """
+    a csv file with exchange and instrument_id columns
+
+    Args:
+        path (str): csv file
+    """
+    def __init__(self, path:str):
+        self.path = path
+
+    def fetch(self):
+        with open(self.path, newline='') as f:
+            return [_contract_name(row['exchange'], row['instrument_id']) for row in csv.DictReader(f)]
+
+
+class SymbolUniverse(object):
+    """
+    Cached symbol universe: the last good result of a source is kept on disk. A fresh cache
+    (younger than ttl) is returned without touching the source; a stale one is returned at once
+    while a background thread refreshes it; without a cache the source is queried directly
+
+    Args:
+        source: any object with fetch() -> list of contract names (MySQLSource, SQLiteSource, CSVSource ...)
+        cache_path (str, optional): cache file. Defaults to 'symbols_cache.json'
+        ttl (float, optional): seconds a cached universe counts as fresh. Defaults to 12 hours
+        factory (callable, optional): builds the source on the first refresh instead of passing
+            `source`, so a fresh cache needs neither its driver nor its credentials. Defaults to None
+    """
+    def __init__(self, source = None, cache_path = 'symbols_cache.json', ttl = 12 * 3600, factory = None):
+        if source is None and factory is None:
+            raise ValueError('SymbolUniverse needs a source or a source factory')
+        self.source = source
+        self.factory = factory
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.refresh_thread = None
+        self.lock = threading.Lock()
+
+    def get_source(self):
+        """
+        Returns:
+            source: the source, built by the factory on first use
+        """
+        with self.lock:
+            if self.source is None:
+                self.source = self.factory()
+            return self.source
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path, 'r') as f:
+                cache = json.load(f)
+            return cache['symbols'], cache['time']
+        except (OSError, ValueError, KeyError):
+            return None, None
+
+    def _write_cache(self, symbols:list):
+        tmp = self.cache_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'symbols' : symbols, 'time' : time.time()}, f)
+        os.replace(tmp, self.cache_path)
+
+    def refresh(self):
+        """
+        query the source and update the cache
+
+        Returns:
+            contract_names (list): selected contracts
+        """
+        symbols = self.get_source().fetch()
+        self._write_cache(symbols)
+        return symbols
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except Exception:
+            # 后台刷新失败时保留旧缓存，下次启动再试
+            pass
+
+    def get(self):
+        """
+        Returns:
+            contract_names (list): selected contracts, possibly from the cache
+        """
+        symbols, cached_at = self._read_cache()
+        if symbols is None:
+            return self.refresh()
+        if time.time() - cached_at > self.ttl and (self.refresh_thread is None or not self.refresh_thread.is_alive()):
+            self.refresh_thread = threading.Thread(target=self._refresh_quietly, name='universe-refresh', daemon=True)
+            self.refresh_thread.start()
+        return symbols